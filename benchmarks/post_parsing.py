@@ -0,0 +1,41 @@
+"""
+Compare how long it takes to parse a POST /get_normalized_nodes request body with pydantic (the default) and
+with the minimal orjson parser used when RAW_POST_PARSING=true.
+
+Usage:
+    python benchmarks/post_parsing.py [number of CURIEs] [repeats]
+"""
+import json
+import sys
+import timeit
+
+from node_normalizer.model import CurieList
+from node_normalizer.server import parse_curie_list
+
+
+def pydantic_parse(body: bytes) -> CurieList:
+    # This is what FastAPI does with a CurieList body parameter.
+    return CurieList(**json.loads(body))
+
+
+def main():
+    curie_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    body = json.dumps({
+        "curies": [f"NCBIGene:{i}" for i in range(curie_count)],
+        "conflate": True,
+        "drug_chemical_conflate": False,
+        "description": False,
+        "fields": ["id", "type"],
+    }).encode("utf-8")
+    assert pydantic_parse(body).curies == parse_curie_list(body).curies
+
+    print(f"Parsing a {len(body):,} byte request body with {curie_count:,} CURIEs ({repeats} repeats):")
+    for name, parse in [("pydantic", pydantic_parse), ("orjson (RAW_POST_PARSING)", parse_curie_list)]:
+        best = min(timeit.repeat(lambda: parse(body), number=1, repeat=repeats))
+        print(f" - {name}: {best * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
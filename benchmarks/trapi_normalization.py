@@ -0,0 +1,101 @@
+"""
+Compare how long it takes to normalize a TRAPI query as pydantic models (normalize_message()) and as dicts parsed with
+orjson (normalize_query_json(), used by /query), with and without validating it with reasoner_pydantic first.
+
+Redis isn't needed: every node is looked up in a fake table where pairs of nodes are equivalent.
+
+Usage:
+    python benchmarks/trapi_normalization.py [number of results] [repeats]
+"""
+import asyncio
+import sys
+import time
+from unittest.mock import patch
+
+import orjson
+import reasoner_pydantic
+
+from node_normalizer.normalizer import normalize_message, normalize_query_json
+
+
+async def fake_get_all_equivalent_curies(app, curies):
+    # NODE:0 and NODE:1 normalize to NODE:0, NODE:2 and NODE:3 to NODE:2, and so on.
+    equivalent_curies = {}
+    for curie in curies:
+        number = int(curie.split(':')[1])
+        primary_id = f"NODE:{number - number % 2}"
+        equivalent_curies[curie] = {
+            "id": {"identifier": primary_id, "label": f"Node {number}"},
+            "equivalent_identifiers": [{"identifier": primary_id}, {"identifier": f"NODE:{number - number % 2 + 1}"}],
+            "type": ["biolink:Gene", "biolink:NamedThing"],
+        }
+    return equivalent_curies
+
+
+async def fake_get_info_content_attributes(app, canonical_nonan):
+    return {canonical_id: None for canonical_id in canonical_nonan}
+
+
+def make_query(result_count: int) -> bytes:
+    attribute = {"attribute_type_id": "biolink:has_attribute", "value": ["a", "b"], "original_attribute_name": "x"}
+    source = {"resource_id": "infores:test", "resource_role": "primary_knowledge_source"}
+    nodes = {f"NODE:{i}": {"categories": ["biolink:Gene"]} for i in range(result_count + 1)}
+    edges = {
+        f"e{i}": {"subject": f"NODE:{i}", "predicate": "biolink:related_to", "object": f"NODE:{i + 1}",
+                  "sources": [source], "attributes": [attribute]}
+        for i in range(result_count)
+    }
+    results = [
+        {
+            "node_bindings": {"a": [{"id": f"NODE:{i}", "attributes": [attribute]}], "b": [{"id": f"NODE:{i + 1}"}]},
+            "analyses": [{"resource_id": "infores:test", "edge_bindings": {"e": [{"id": f"e{i}"}]}}],
+        }
+        for i in range(result_count)
+    ]
+    return orjson.dumps({"message": {
+        "query_graph": {
+            "nodes": {"a": {"ids": ["NODE:0"]}, "b": {"categories": ["biolink:Gene"]}},
+            "edges": {"e": {"subject": "a", "object": "b"}},
+        },
+        "knowledge_graph": {"nodes": nodes, "edges": edges},
+        "results": results,
+    }})
+
+
+async def pydantic_normalize(body: bytes) -> bytes:
+    # This is what FastAPI did with a reasoner_pydantic.Query body parameter and response model.
+    query = reasoner_pydantic.Query.parse_raw(body)
+    query.message = await normalize_message(None, query.message)
+    return reasoner_pydantic.Query.parse_obj(query.dict()).json(exclude_unset=True, exclude_none=True).encode()
+
+
+async def dict_normalize(body: bytes, validate: bool) -> bytes:
+    query = orjson.loads(body)
+    if validate:
+        reasoner_pydantic.Query.parse_obj(query)
+    return await normalize_query_json(None, query)
+
+
+async def main():
+    result_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    body = make_query(result_count)
+    print(f"Normalizing a {len(body):,} byte TRAPI query with {result_count:,} results ({repeats} repeats):")
+    for name, normalize in [
+        ("pydantic models", pydantic_normalize),
+        ("dicts, validated (TRAPI_VALIDATION=true)", lambda body: dict_normalize(body, True)),
+        ("dicts, not validated (TRAPI_VALIDATION=false)", lambda body: dict_normalize(body, False)),
+    ]:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            await normalize(body)
+            times.append(time.perf_counter() - start)
+        print(f" - {name}: {min(times) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    with patch("node_normalizer.normalizer.get_all_equivalent_curies", fake_get_all_equivalent_curies), \
+            patch("node_normalizer.normalizer.get_info_content_attributes", fake_get_info_content_attributes):
+        asyncio.run(main())
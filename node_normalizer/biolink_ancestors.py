@@ -0,0 +1,96 @@
+"""
+A precomputed table of the Biolink ancestors of every Biolink class.
+
+The loader computes this table with the Biolink Model Toolkit and stores it in Redis, and a copy for the default
+Biolink version is bundled with NodeNorm (resources/biolink_ancestors.json). The server only reads the table, so
+it never needs to load the Biolink model itself.
+
+To regenerate the bundled table (for example, after upgrading bmt), run:
+    python -m node_normalizer.biolink_ancestors [biolink-model.yaml]
+"""
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .util import LoggingUtil, BIOLINK_ANCESTORS_KEY
+
+logger = LoggingUtil.init_logging()
+
+BUNDLED_ANCESTOR_TABLE = Path(__file__).parent / "resources" / "biolink_ancestors.json"
+
+# A mapping from each Biolink type to a tuple of that type followed by all its ancestors.
+AncestorTable = Dict[str, Tuple[str, ...]]
+
+
+def compute_ancestor_table(toolkit) -> Dict[str, List[str]]:
+    """
+    Use a bmt Toolkit to compute the ancestors of every Biolink class. Each type is mapped to a list of itself
+    followed by its ancestors, in the order returned by the Toolkit.
+    """
+    ancestor_table = {}
+    for biolink_class in sorted(toolkit.get_all_classes(formatted=True)):
+        ancestors = [ancestor for ancestor in toolkit.get_ancestors(biolink_class, formatted=True)
+                     if ancestor != biolink_class]
+        ancestor_table[biolink_class] = [biolink_class] + ancestors
+    return ancestor_table
+
+
+def serialize_ancestor_table(toolkit) -> str:
+    """
+    Compute the ancestor table with a bmt Toolkit, and serialize it (along with the Biolink version it was
+    computed from) as JSON.
+    """
+    return json.dumps({
+        "biolink_version": toolkit.get_model_version(),
+        "ancestors": compute_ancestor_table(toolkit),
+    }, indent=2, sort_keys=True)
+
+
+def parse_ancestor_table(serialized: str) -> AncestorTable:
+    """
+    Parse a serialized ancestor table into a dict of immutable tuples.
+    """
+    return {
+        biolink_type: tuple(ancestors)
+        for biolink_type, ancestors in json.loads(serialized)["ancestors"].items()
+    }
+
+
+def read_bundled_ancestor_table() -> AncestorTable:
+    """
+    Read the ancestor table bundled with NodeNorm.
+    """
+    with open(BUNDLED_ANCESTOR_TABLE, "r") as tablef:
+        return parse_ancestor_table(tablef.read())
+
+
+async def load_ancestor_table(connection) -> AncestorTable:
+    """
+    Load the ancestor table stored in Redis by the loader, falling back to the bundled table if the loader
+    didn't store one.
+    """
+    try:
+        serialized = await connection.get(BIOLINK_ANCESTORS_KEY, encoding='utf-8')
+    except Exception as e:
+        logger.warning(f"Could not read the Biolink ancestor table from Redis: {e}")
+        serialized = None
+
+    if serialized:
+        ancestor_table = parse_ancestor_table(serialized)
+        logger.info(f"Loaded ancestors of {len(ancestor_table)} Biolink types from Redis.")
+    else:
+        ancestor_table = read_bundled_ancestor_table()
+        logger.info(f"Loaded ancestors of {len(ancestor_table)} Biolink types from {BUNDLED_ANCESTOR_TABLE}.")
+    return ancestor_table
+
+
+if __name__ == "__main__":
+    # Only the loader and this script need the Biolink Model Toolkit.
+    from bmt import Toolkit
+
+    toolkit = Toolkit(sys.argv[1]) if len(sys.argv) > 1 else Toolkit()
+    with open(BUNDLED_ANCESTOR_TABLE, "w") as tablef:
+        tablef.write(serialize_ancestor_table(toolkit))
+        tablef.write("\n")
+    print(f"Wrote the ancestors of Biolink {toolkit.get_model_version()} to {BUNDLED_ANCESTOR_TABLE}.")
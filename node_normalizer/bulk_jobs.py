@@ -0,0 +1,293 @@
+"""
+Bulk normalization jobs, for CURIE lists that are too large to normalize in a single request.
+
+A job is created by uploading a file of CURIEs (in any format that /get_normalized_nodes/stream accepts). It's then
+normalized in the background a batch at a time with normalize_stream(), and the results are written to a gzipped
+NDJSON file that can be downloaded once the job is complete.
+
+Each job is stored in its own directory under the job directory:
+
+    <job_id>/input.txt            The uploaded CURIEs.
+    <job_id>/status.json          The state of the job (see BulkJobManager.read_status()).
+    <job_id>/result.ndjson.gz     The results, once the job is complete.
+    <job_id>/lock                 Locked (with flock) by the process running the job.
+
+Since everything is on disk, the job directory can be shared by several server processes: any of them can report on
+the status of a job or return its results. A job is only run by the process that holds its lock, and jobs that were
+interrupted (e.g. by a restart) are picked up again by the next process to start.
+"""
+import asyncio
+import fcntl
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+import orjson
+from fastapi import FastAPI, HTTPException
+
+from .streaming import normalize_stream
+from .util import LoggingUtil
+
+logger = LoggingUtil.init_logging()
+
+# The states a job can be in.
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+UNFINISHED_STATES = (QUEUED, RUNNING)
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# How much of a file to read or write at a time.
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# How often (in seconds) to record the progress of a running job.
+STATUS_WRITE_INTERVAL = 1.0
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class BulkJobManager:
+    """
+    Creates bulk normalization jobs, runs them in the background and keeps track of their state on disk.
+
+    At most max_running_jobs jobs are run at once by each process. Each job is normalized batch_size CURIEs at a time,
+    with at most max_batches_in_flight batches being normalized at once. Uploads larger than max_upload_bytes are
+    rejected.
+    """
+    def __init__(self, directory: str, batch_size: int = 1000, max_batches_in_flight: int = 2,
+                 max_running_jobs: int = 1, retention_hours: float = 168, max_upload_bytes: int = 1024 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.max_batches_in_flight = max_batches_in_flight
+        self.retention_hours = retention_hours
+        self.max_upload_bytes = max_upload_bytes
+        self.running_jobs = asyncio.Semaphore(max_running_jobs)
+        # Keep strong references to the tasks so that they aren't garbage collected while they run.
+        self.tasks = set()
+
+    @staticmethod
+    def from_environment() -> 'BulkJobManager':
+        """
+        Create a BulkJobManager with the settings from the BULK_JOB_DIRECTORY, BULK_JOB_BATCH_SIZE,
+        BULK_JOB_MAX_BATCHES_IN_FLIGHT, BULK_JOB_MAX_RUNNING_JOBS, BULK_JOB_RETENTION_HOURS and
+        BULK_JOB_MAX_UPLOAD_MB environment variables.
+        """
+        return BulkJobManager(
+            directory=os.environ.get('BULK_JOB_DIRECTORY', os.path.join(tempfile.gettempdir(), 'node_normalizer_jobs')),
+            batch_size=int(os.environ.get('BULK_JOB_BATCH_SIZE', 1000)),
+            max_batches_in_flight=int(os.environ.get('BULK_JOB_MAX_BATCHES_IN_FLIGHT', 2)),
+            max_running_jobs=int(os.environ.get('BULK_JOB_MAX_RUNNING_JOBS', 1)),
+            retention_hours=float(os.environ.get('BULK_JOB_RETENTION_HOURS', 168)),
+            max_upload_bytes=int(float(os.environ.get('BULK_JOB_MAX_UPLOAD_MB', 1024)) * 1024 * 1024),
+        )
+
+    def job_directory(self, job_id: str) -> Optional[Path]:
+        """
+        Return the directory of a job, or None if there is no such job.
+        """
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        job_directory = self.directory / job_id
+        if not (job_directory / 'status.json').exists():
+            return None
+        return job_directory
+
+    def read_status(self, job_id: str) -> Optional[Dict]:
+        """
+        Return the status of a job, or None if there is no such job.
+
+        The status includes the `status` of the job (queued, running, complete or failed), the `options` it was created
+        with, when it was `created`, `started` and `finished`, the number of lines in the input (`total_lines`), the
+        number of results written so far (`processed_lines`; blank lines don't have results, so this can be less than
+        `total_lines`) and any `error`.
+        """
+        job_directory = self.job_directory(job_id)
+        if job_directory is None:
+            return None
+        return orjson.loads((job_directory / 'status.json').read_bytes())
+
+    def write_status(self, job_id: str, status: Dict):
+        # Write the status atomically, so that other processes never read half of it.
+        status_file = self.directory / job_id / 'status.json'
+        temporary_file = status_file.with_suffix('.tmp')
+        temporary_file.write_bytes(orjson.dumps(status))
+        os.replace(temporary_file, status_file)
+
+    def result_file(self, job_id: str) -> Optional[Path]:
+        """
+        Return the result file of a job, or None if there is no such job or it isn't complete.
+        """
+        status = self.read_status(job_id)
+        if status is None or status['status'] != COMPLETE:
+            return None
+        return self.directory / job_id / 'result.ndjson.gz'
+
+    async def create_job(self, app: FastAPI, chunks: AsyncIterator[bytes], **options) -> Dict:
+        """
+        Save an uploaded file of CURIEs as a new job, and start normalizing it in the background.
+
+        :param options: Passed on to get_normalized_nodes(), so they must be JSON serializable.
+        :return: The status of the new job.
+        :raises HTTPException: (413) If the upload is larger than max_upload_bytes.
+        """
+        self.remove_expired_jobs()
+
+        job_id = uuid.uuid4().hex
+        job_directory = self.directory / job_id
+        job_directory.mkdir()
+
+        total_lines = 0
+        total_bytes = 0
+        last_byte = b'\n'
+        try:
+            with open(job_directory / 'input.txt', 'wb') as input_file:
+                async for chunk in chunks:
+                    if chunk:
+                        total_bytes += len(chunk)
+                        if total_bytes > self.max_upload_bytes:
+                            raise HTTPException(status_code=413, detail=f"Bulk job uploads are limited to "
+                                                                        f"{self.max_upload_bytes} bytes")
+                        await asyncio.to_thread(input_file.write, chunk)
+                        total_lines += chunk.count(b'\n')
+                        last_byte = chunk[-1:]
+        except BaseException:
+            shutil.rmtree(job_directory, ignore_errors=True)
+            raise
+        if last_byte != b'\n':
+            total_lines += 1
+
+        status = {
+            'job_id': job_id,
+            'status': QUEUED,
+            'options': options,
+            'created': now(),
+            'started': None,
+            'finished': None,
+            'total_lines': total_lines,
+            'processed_lines': 0,
+            'error': None,
+        }
+        self.write_status(job_id, status)
+        self.start_job(app, job_id)
+        return status
+
+    def start_job(self, app: FastAPI, job_id: str):
+        task = asyncio.create_task(self.run_job(app, job_id), name=job_id)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_job(self, app: FastAPI, job_id: str):
+        """
+        Normalize the CURIEs of a job, unless another process is already doing so.
+        """
+        job_directory = self.directory / job_id
+        # We only take the lock once we're ready to run the job, so that idle processes can run it in the meantime.
+        async with self.running_jobs:
+            if not job_directory.exists():
+                return
+            with open(job_directory / 'lock', 'wb') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    logger.info(f"Bulk job {job_id} is being run by another process")
+                    return
+
+                status = self.read_status(job_id)
+                if status is None or status['status'] not in UNFINISHED_STATES:
+                    return
+
+                status.update(status=RUNNING, started=now(), processed_lines=0)
+                self.write_status(job_id, status)
+                logger.info(f"Starting bulk job {job_id} ({status['total_lines']} lines)")
+                try:
+                    await self.normalize_job(app, job_id, status)
+                except asyncio.CancelledError:
+                    # Leave the job to be resumed by the next process that starts.
+                    raise
+                except Exception as e:
+                    logger.exception(f"Bulk job {job_id} failed")
+                    status.update(status=FAILED, finished=now(), error=str(e))
+                else:
+                    status.update(status=COMPLETE, finished=now())
+                    logger.info(f"Finished bulk job {job_id}")
+                if job_directory.exists():
+                    # (Unless the job was deleted while it ran.)
+                    self.write_status(job_id, status)
+
+    async def normalize_job(self, app: FastAPI, job_id: str, status: Dict):
+        job_directory = self.directory / job_id
+        partial_result_file = job_directory / 'result.ndjson.gz.partial'
+
+        async def input_chunks():
+            with open(job_directory / 'input.txt', 'rb') as input_file:
+                while chunk := await asyncio.to_thread(input_file.read, FILE_CHUNK_SIZE):
+                    yield chunk
+
+        last_status_write = time.monotonic()
+        with gzip.open(partial_result_file, 'wb') as result_file:
+            async for output in normalize_stream(app, input_chunks(), self.batch_size, self.max_batches_in_flight,
+                                                 **status['options']):
+                await asyncio.to_thread(result_file.write, output)
+                status['processed_lines'] += output.count(b'\n')
+                # Record our progress every so often (rather than after every batch), without blocking the server.
+                if time.monotonic() - last_status_write >= STATUS_WRITE_INTERVAL:
+                    await asyncio.to_thread(self.write_status, job_id, status)
+                    last_status_write = time.monotonic()
+        os.replace(partial_result_file, job_directory / 'result.ndjson.gz')
+
+    def resume_jobs(self, app: FastAPI):
+        """
+        Start any jobs that were queued or running when the last process stopped.
+        """
+        self.remove_expired_jobs()
+        for job_directory in self.directory.iterdir():
+            status = self.read_status(job_directory.name)
+            if status is not None and status['status'] in UNFINISHED_STATES:
+                self.start_job(app, status['job_id'])
+
+    def delete_job(self, job_id: str) -> bool:
+        """
+        Delete a job and its results, cancelling it if it's running in this process.
+
+        :return: False if there is no such job.
+        """
+        job_directory = self.job_directory(job_id)
+        if job_directory is None:
+            return False
+        for task in self.tasks:
+            if task.get_name() == job_id:
+                task.cancel()
+        shutil.rmtree(job_directory, ignore_errors=True)
+        return True
+
+    def remove_expired_jobs(self):
+        """
+        Delete finished jobs that finished more than retention_hours ago.
+        """
+        cutoff = time.time() - self.retention_hours * 3600
+        for job_directory in self.directory.iterdir():
+            status = self.read_status(job_directory.name)
+            if status is None or status['status'] in UNFINISHED_STATES:
+                continue
+            if datetime.fromisoformat(status['finished']).timestamp() < cutoff:
+                shutil.rmtree(job_directory, ignore_errors=True)
+
+    async def close(self):
+        """
+        Cancel the jobs running in this process (they will be resumed when the server is restarted).
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
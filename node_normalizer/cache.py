@@ -0,0 +1,258 @@
+"""
+In-process caches used to avoid repeated Redis lookups for frequently requested CURIEs.
+"""
+import collections
+import os
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+from .util import LoggingUtil
+
+logger = LoggingUtil.init_logging()
+
+
+class BoundedCache:
+    """
+    A least-recently-used cache whose entries expire after ttl seconds (if ttl is not None), and which is
+    cleared whenever the version of the loaded data changes (see set_version()).
+
+    Subclasses decide when the cache is too large by implementing is_full(). Cached values are shared between
+    requests, so callers must not modify them.
+    """
+    def __init__(self, ttl=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+
+        # The version of the data these entries were loaded from, and when we last checked it.
+        self.version = None
+        self.version_checked_at = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_full(self) -> bool:
+        raise NotImplementedError()
+
+    def _get_many(self, keys: Iterable[Tuple[Hashable, Hashable]]) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        """
+        Look up several (name, key) pairs, returning a dict of the values found (keyed by name) and a list of
+        the names that weren't found.
+        """
+        now = self.clock()
+        found = {}
+        missing = []
+        for name, key in keys:
+            entry = self.entries.get(key)
+            if entry is not None and (self.ttl is None or now - entry[0] <= self.ttl):
+                self.entries.move_to_end(key)
+                found[name] = entry[1]
+                self.hits += 1
+            else:
+                if entry is not None:
+                    self._remove(key)
+                missing.append(name)
+                self.misses += 1
+        return found, missing
+
+    def _put(self, key: Hashable, value, now: float):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (now, value)
+
+    def _remove(self, key: Hashable):
+        del self.entries[key]
+
+    def _evict(self):
+        while self.entries and self.is_full():
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def set_version(self, version):
+        """
+        Record the version of the loaded data, clearing the cache if it has changed.
+        """
+        if version != self.version:
+            if self.entries:
+                logger.info(f"Data version changed from {self.version} to {version}, clearing {len(self)} cached " +
+                            f"entries from {type(self).__name__}.")
+            self.clear()
+            self.version = version
+        self.version_checked_at = self.clock()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "version": self.version,
+        }
+
+
+class NormalizationCache(BoundedCache):
+    """
+    A bounded cache of normalized nodes, keyed on the upper-cased CURIE and the options used to normalize it.
+
+    Entries are evicted in least-recently-used order once there are more than max_size of them, and are
+    treated as missing once they are older than ttl seconds.
+
+    CURIEs we couldn't normalize (None results) are kept in a separate, smaller cache of up to unknown_max_size
+    entries with a much shorter unknown_ttl, so that requests for lots of unknown CURIEs can't push real results out,
+    and so that CURIEs which are missing because of a problem with Redis are looked up again soon. They aren't cached
+    at all if unknown_max_size is 0.
+    """
+    def __init__(self, max_size: int, ttl: float, unknown_max_size: int = 0, unknown_ttl: float = 0,
+                 clock=time.monotonic):
+        super().__init__(ttl=ttl, clock=clock)
+        self.max_size = max_size
+        self.unknown = NormalizationCache(max_size=unknown_max_size, ttl=unknown_ttl, clock=clock) \
+            if unknown_max_size > 0 else None
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a NormalizationCache configured from environment variables, or None if the cache is disabled
+        (NORMALIZATION_CACHE_SIZE=0).
+        """
+        max_size = int(os.environ.get("NORMALIZATION_CACHE_SIZE", 10_000))
+        if max_size <= 0:
+            return None
+        return cls(max_size=max_size, ttl=float(os.environ.get("NORMALIZATION_CACHE_TTL", 3600)),
+                   unknown_max_size=int(os.environ.get("NORMALIZATION_CACHE_UNKNOWN_SIZE", 1000)),
+                   unknown_ttl=float(os.environ.get("NORMALIZATION_CACHE_UNKNOWN_TTL", 60)))
+
+    def is_full(self) -> bool:
+        return len(self.entries) > self.max_size
+
+    def get_many(self, upper_curies: Iterable[str], options: Tuple) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Look up several CURIEs normalized with the same options.
+
+        :return: A dict of the cached nodes (which may be None for CURIEs we couldn't normalize) keyed by
+            upper-cased CURIE, and a list of the upper-cased CURIEs that weren't in the cache.
+        """
+        found, missing = self._get_many((upper_curie, (upper_curie,) + options) for upper_curie in upper_curies)
+        if self.unknown is not None and missing:
+            found_unknown, missing = self.unknown.get_many(missing, options)
+            found.update(found_unknown)
+            # Our hits and misses count lookups in either cache.
+            self.hits += len(found_unknown)
+            self.misses -= len(found_unknown)
+        return found, missing
+
+    def put_many(self, nodes: Dict[str, Any], options: Tuple):
+        """
+        Add several nodes (keyed by upper-cased CURIE) normalized with the same options.
+        """
+        self._put_nodes({upper_curie: node for upper_curie, node in nodes.items() if node is not None}, options)
+        if self.unknown is not None:
+            self.unknown._put_nodes({upper_curie: None for upper_curie, node in nodes.items() if node is None},
+                                    options)
+
+    def _put_nodes(self, nodes: Dict[str, Any], options: Tuple):
+        now = self.clock()
+        for upper_curie, node in nodes.items():
+            self._put((upper_curie,) + options, node, now)
+        self._evict()
+
+    def clear(self):
+        super().clear()
+        if self.unknown is not None:
+            self.unknown.clear()
+
+    def set_version(self, version):
+        super().set_version(version)
+        if self.unknown is not None:
+            self.unknown.set_version(version)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {**super().stats(), "max_size": self.max_size}
+        if self.unknown is not None:
+            stats["unknown_curies"] = self.unknown.stats()
+        return stats
+
+
+class CliqueRecordCache(BoundedCache):
+    """
+    A cache of the decoded Redis records for each clique (its equivalent identifiers and type, and its
+    information content), keyed on the canonical ID. These records don't depend on the options that a node
+    was normalized with, so they are shared between requests with different options.
+
+    Cliques range from a single identifier to thousands, so rather than counting entries we estimate how much
+    memory each record takes up, and evict records in least-recently-used order once the total exceeds max_bytes.
+    """
+    # An estimate of the size of a record beyond the size of its raw value, and of how much larger a decoded
+    # JSON value is than its serialized form.
+    RECORD_OVERHEAD_BYTES = 200
+    DECODED_SIZE_FACTOR = 5
+
+    def __init__(self, max_bytes: int, clock=time.monotonic):
+        super().__init__(ttl=None, clock=clock)
+        self.max_bytes = max_bytes
+        self.sizes: Dict[Hashable, int] = {}
+        self.total_bytes = 0
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a CliqueRecordCache configured from environment variables, or None if the cache is disabled
+        (CLIQUE_CACHE_SIZE_MB=0).
+        """
+        max_megabytes = float(os.environ.get("CLIQUE_CACHE_SIZE_MB", 256))
+        if max_megabytes <= 0:
+            return None
+        return cls(max_bytes=int(max_megabytes * 1024 * 1024))
+
+    @classmethod
+    def estimate_size(cls, raw_value) -> int:
+        """
+        Estimate how many bytes a record takes up in memory once decoded from raw_value.
+        """
+        return cls.RECORD_OVERHEAD_BYTES + cls.DECODED_SIZE_FACTOR * len(raw_value or '')
+
+    def is_full(self) -> bool:
+        return self.total_bytes > self.max_bytes
+
+    def get_many(self, canonical_ids: Iterable[str], kind: str) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Look up one kind of record ('eqids' or 'info_content') for several canonical IDs.
+
+        :return: A dict of the cached records keyed by canonical ID, and a list of the canonical IDs that weren't
+            in the cache.
+        """
+        return self._get_many((canonical_id, (kind, canonical_id)) for canonical_id in canonical_ids)
+
+    def put_many(self, records: Dict[str, Tuple[Any, int]], kind: str):
+        """
+        Add one kind of record for several canonical IDs.
+
+        :param records: A dict of (record, estimated size in bytes) tuples keyed by canonical ID.
+        """
+        now = self.clock()
+        for canonical_id, (record, size) in records.items():
+            key = (kind, canonical_id)
+            self._put(key, record, now)
+            self.sizes[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _remove(self, key: Hashable):
+        super()._remove(key)
+        self.total_bytes -= self.sizes.pop(key)
+
+    def clear(self):
+        super().clear()
+        self.sizes.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "max_bytes": self.max_bytes, "estimated_bytes": self.total_bytes}
@@ -0,0 +1,373 @@
+"""
+ASGI middleware that compresses responses with gzip, brotli or zstd, depending on the client's Accept-Encoding header,
+and decompresses gzip or zstd request bodies.
+
+gzip is always available. brotli and zstd are only offered if the `brotli` and `zstandard` packages are installed.
+"""
+import os
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .util import LoggingUtil
+
+logger = LoggingUtil.init_logging()
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """ Return everything compressed so far, without ending the stream. """
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# The compressor and default level for each content-coding whose library is installed, in our order of preference
+# (used to break ties between encodings the client accepts equally).
+COMPRESSORS: Dict[str, Callable] = {}
+DEFAULT_LEVELS: Dict[str, int] = {}
+if zstandard is not None:
+    COMPRESSORS['zstd'] = ZstdCompressor
+    DEFAULT_LEVELS['zstd'] = 3
+if brotli is not None:
+    COMPRESSORS['br'] = BrotliCompressor
+    DEFAULT_LEVELS['br'] = 4
+COMPRESSORS['gzip'] = GzipCompressor
+DEFAULT_LEVELS['gzip'] = 6
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """
+    Choose one of encodings (in order of preference) based on an Accept-Encoding header, or return None if the client
+    doesn't accept any of them.
+    """
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        qvalue = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding] = qvalue
+
+    best_encoding, best_qvalue = None, 0.0
+    for encoding in encodings:
+        qvalue = qvalues.get(encoding, qvalues.get('*', 0.0))
+        if qvalue > best_qvalue:
+            best_encoding, best_qvalue = encoding, qvalue
+    return best_encoding
+
+
+# Responses of these types are already compressed, so we don't compress them again.
+COMPRESSED_MEDIA_TYPES = {'application/gzip', 'application/x-gzip', 'application/zstd'}
+
+
+class CompressionMiddleware:
+    """
+    Compress responses of at least minimum_size bytes with the best encoding that the client accepts.
+
+    Responses that are sent in a single message (such as ORJSONResponses) are compressed in chunks of chunk_size bytes,
+    each of which is sent as soon as it's compressed, so we never hold a second complete copy of a large body.
+    Streaming responses are compressed as they are streamed, and each message is flushed so that clients receive it
+    without waiting for the next one.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, encodings: Sequence[str] = None,
+                 levels: Dict[str, int] = None, chunk_size: int = 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.chunk_size = chunk_size
+        if encodings is None:
+            encodings = list(COMPRESSORS.keys())
+        for encoding in encodings:
+            if encoding not in COMPRESSORS:
+                logger.warning(f"Response compression with {encoding} is not available, since the library it needs "
+                               f"is not installed.")
+        self.encodings = [encoding for encoding in encodings if encoding in COMPRESSORS]
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+
+    @staticmethod
+    def options_from_environment() -> dict:
+        """
+        Read the options for this middleware from environment variables. COMPRESSION_ENCODINGS is a comma-separated
+        list of encodings in order of preference (set it to '' to disable compression), and the compression level of
+        each encoding can be set with COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_LEVEL and COMPRESSION_ZSTD_LEVEL.
+        """
+        encodings = os.environ.get('COMPRESSION_ENCODINGS', ','.join(COMPRESSORS.keys()))
+        levels = {}
+        for encoding, variable in [('gzip', 'COMPRESSION_GZIP_LEVEL'), ('br', 'COMPRESSION_BROTLI_LEVEL'),
+                                   ('zstd', 'COMPRESSION_ZSTD_LEVEL')]:
+            if variable in os.environ:
+                levels[encoding] = int(os.environ[variable])
+        return {
+            'minimum_size': int(os.environ.get('COMPRESSION_MINIMUM_SIZE', 1024)),
+            'encodings': [encoding.strip() for encoding in encodings.split(',') if encoding.strip()],
+            'levels': levels,
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = None
+        if scope['type'] == 'http' and self.encodings:
+            encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressingResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressingResponder:
+    """
+    Wraps the send() function of a single response, compressing the body if it's large enough.
+    """
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream_send = send
+        self.start_message: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if message['type'] == 'http.response.start':
+            # Wait until we see the body to decide whether to compress it.
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.downstream_send(message)
+            return
+        if self.passthrough:
+            await self.downstream_send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start_message['headers'])
+            content_length = headers.get('content-length')
+            too_small = (len(body) < self.middleware.minimum_size if not more_body else
+                         content_length is not None and int(content_length) < self.middleware.minimum_size)
+            already_compressed = headers.get('content-type', '').split(';')[0].strip() in COMPRESSED_MEDIA_TYPES
+            if too_small or already_compressed or 'content-encoding' in headers:
+                self.passthrough = True
+                await self.downstream_send(self.start_message)
+                await self.downstream_send(message)
+                return
+
+            self.compressor = COMPRESSORS[self.encoding](self.middleware.levels[self.encoding])
+            headers['Content-Encoding'] = self.encoding
+            headers.add_vary_header('Accept-Encoding')
+            del headers['Content-Length']
+            self.start_message['headers'] = headers.raw
+
+            if not more_body and len(body) <= self.middleware.chunk_size:
+                # A small response: compress it in one go, so we can tell the client how large it is.
+                compressed = self.compressor.compress(body) + self.compressor.finish()
+                headers['Content-Length'] = str(len(compressed))
+                self.start_message['headers'] = headers.raw
+                await self.downstream_send(self.start_message)
+                await self.downstream_send({'type': 'http.response.body', 'body': compressed})
+                return
+
+            await self.downstream_send(self.start_message)
+
+        if more_body:
+            # Streaming responses are flushed after every message.
+            await self.downstream_send({'type': 'http.response.body', 'more_body': True,
+                                        'body': self.compressor.compress(body) + self.compressor.flush()})
+            return
+
+        # Compress the rest of the body a chunk at a time, sending each chunk as soon as it's compressed.
+        chunk_size = self.middleware.chunk_size
+        view = memoryview(body)
+        for start in range(0, len(view), chunk_size):
+            compressed = self.compressor.compress(view[start:start + chunk_size])
+            if compressed:
+                await self.downstream_send({'type': 'http.response.body', 'body': compressed, 'more_body': True})
+        await self.downstream_send({'type': 'http.response.body', 'body': self.compressor.finish()})
+
+
+class RequestBodyTooLarge(Exception):
+    pass
+
+
+class GzipDecompressor:
+    def __init__(self, max_size: int):
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.remaining = max_size
+
+    def decompress(self, data: bytes) -> bytes:
+        # Never decompress more than one byte beyond the limit, however well the data compresses.
+        decompressed = self.decompressor.decompress(data, self.remaining + 1)
+        self.remaining -= len(decompressed)
+        if self.remaining < 0:
+            raise RequestBodyTooLarge()
+        return decompressed
+
+    def finish(self) -> bytes:
+        if not self.decompressor.eof:
+            raise zlib.error("incomplete gzip stream")
+        return b''
+
+
+class LimitedBuffer:
+    """
+    A file-like object that collects what's written to it, raising RequestBodyTooLarge once more than max_size bytes
+    have been written in total.
+    """
+    def __init__(self, max_size: int):
+        self.chunks: List[bytes] = []
+        self.remaining = max_size
+
+    def write(self, data: bytes) -> int:
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            raise RequestBodyTooLarge()
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ZstdDecompressor:
+    def __init__(self, max_size: int):
+        # A zstandard stream writer writes its output in chunks of write_size bytes, so we can stop as soon as we
+        # pass the limit.
+        self.output = LimitedBuffer(max_size)
+        self.decompressor = zstandard.ZstdDecompressor().stream_writer(self.output, write_size=64 * 1024)
+
+    def decompress(self, data: bytes) -> bytes:
+        self.decompressor.write(data)
+        return self.output.take()
+
+    def finish(self) -> bytes:
+        self.decompressor.flush()
+        return self.output.take()
+
+
+# The decompressor for each content-coding that we accept in request bodies.
+DECOMPRESSORS: Dict[str, Callable] = {'gzip': GzipDecompressor}
+if zstandard is not None:
+    DECOMPRESSORS['zstd'] = ZstdDecompressor
+DECOMPRESSION_ERRORS = (zlib.error, zstandard.ZstdError) if zstandard is not None else (zlib.error,)
+
+
+class DecompressionMiddleware:
+    """
+    Decompress request bodies sent with `Content-Encoding: gzip` (or zstd, if the `zstandard` package is installed)
+    as they are received, so that the handlers see an uncompressed body.
+
+    Decompression stops with a 413 error once the body is larger than max_size bytes, so a small request can't make
+    us decompress an arbitrarily large body. Invalid bodies get a 400 error, and other encodings a 415 error.
+    """
+    def __init__(self, app: ASGIApp, max_size: int = 1024 * 1024 * 1024):
+        self.app = app
+        self.max_size = max_size
+
+    @staticmethod
+    def options_from_environment() -> dict:
+        """
+        Read the options for this middleware from environment variables: REQUEST_DECOMPRESSION_MAX_SIZE_MB is the
+        largest decompressed request body we accept, in megabytes.
+        """
+        return {
+            'max_size': int(float(os.environ.get('REQUEST_DECOMPRESSION_MAX_SIZE_MB', 1024)) * 1024 * 1024),
+        }
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = Headers(scope=scope).get('content-encoding', '').strip().lower()
+        if encoding in ('', 'identity'):
+            await self.app(scope, receive, send)
+            return
+        if encoding not in DECOMPRESSORS:
+            response = JSONResponse({"detail": f"Unsupported Content-Encoding: {encoding}. Supported encodings: " +
+                                               ", ".join(DECOMPRESSORS.keys())}, status_code=415)
+            await response(scope, receive, send)
+            return
+
+        # The handlers see the decompressed body, so they shouldn't see the headers that describe the compressed one.
+        scope = dict(scope)
+        scope['headers'] = [(name, value) for name, value in scope['headers']
+                            if name not in (b'content-encoding', b'content-length')]
+        decompressor = DECOMPRESSORS[encoding](self.max_size)
+
+        async def decompressing_receive() -> Message:
+            message = await receive()
+            if message['type'] != 'http.request':
+                return message
+            try:
+                body = decompressor.decompress(message.get('body', b''))
+                if not message.get('more_body', False):
+                    body += decompressor.finish()
+            except RequestBodyTooLarge:
+                raise HTTPException(status_code=413,
+                                    detail=f"Decompressed request body is larger than {self.max_size} bytes.")
+            except DECOMPRESSION_ERRORS as e:
+                raise HTTPException(status_code=400, detail=f"Could not decompress {encoding} request body: {e}")
+            return {**message, 'body': body}
+
+        await self.app(scope, decompressing_receive, send)
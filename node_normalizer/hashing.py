@@ -0,0 +1,70 @@
+"""
+Canonical content hashes, used to find duplicate results, bindings, edges and attributes when normalizing TRAPI
+messages.
+
+A value is hashed by encoding it canonically (JSON with sorted keys, via orjson) and taking a 128-bit BLAKE2b digest of
+that. Values can be nested as deeply as they like, and only the 16 byte digests need to be kept to remember which
+values have been seen.
+"""
+import hashlib
+import json as builtin_json
+from typing import Dict, List, Optional
+
+import orjson
+
+DIGEST_SIZE = 16
+
+
+def _default(value):
+    # Called by orjson for values it can't encode itself.
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=canonical_bytes)
+    if hasattr(value, 'dict'):
+        # pydantic models
+        return value.dict()
+    return str(value)
+
+
+def canonical_bytes(value) -> bytes:
+    """
+    Encode a value so that equal values (including dicts with their keys in a different order) have equal encodings.
+    """
+    try:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # e.g. integers too large for orjson
+        return builtin_json.dumps(value, default=_default, sort_keys=True).encode('utf-8')
+
+
+def content_hash(value) -> bytes:
+    """
+    Return a 128-bit digest of the canonical encoding of a value.
+    """
+    return hashlib.blake2b(canonical_bytes(value), digest_size=DIGEST_SIZE).digest()
+
+
+def attribute_hash(attribute: Dict) -> bytes:
+    """
+    Return a digest of the parts of a TRAPI attribute that identify it. A missing value_type_id is treated as ''.
+    """
+    return content_hash((
+        attribute.get('attribute_type_id'),
+        attribute.get('value'),
+        attribute.get('original_attribute_name'),
+        attribute.get('value_url'),
+        attribute.get('attribute_source'),
+        attribute.get('value_type_id') if attribute.get('value_type_id') is not None else '',
+    ))
+
+
+def attributes_hash(attributes: Optional[List[Dict]]) -> bytes:
+    """
+    Return a digest of a list of TRAPI attributes, which (like TRAPI) treats the list as a set: neither the order of
+    the attributes nor any duplicates make a difference. No attributes (None) have a different hash from an empty list.
+    """
+    if attributes is None:
+        return content_hash(None)
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for hashed_attribute in sorted({attribute_hash(attribute) for attribute in attributes}):
+        digest.update(hashed_attribute)
+    return digest.digest()
@@ -4,7 +4,7 @@ import traceback
 from pathlib import Path
 from itertools import islice
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import json
 import hashlib
 from itertools import combinations
@@ -14,7 +14,10 @@ from .redis_adapter import RedisConnectionFactory, RedisConnection
 from bmt import Toolkit
 from bmt.utils import format_element as bmt_format
 
-from .util import LoggingUtil
+from .biolink_ancestors import serialize_ancestor_table
+from .normalizer import choose_preferred_label, get_first_labeled_subclique
+from .util import LoggingUtil, uniquify_list, get_preferred_label_key, BABEL_VERSION_KEY, BIOLINK_ANCESTORS_KEY, \
+    BIOLINK_NAMED_THING
 
 logger = LoggingUtil.init_logging()
 
@@ -246,6 +249,9 @@ class NodeLoader:
         # get the list of files in the directory
         compendia: list = self.get_compendia()
         types_prefixes_redis: RedisConnection = await self.get_redis("curie_to_bl_type_db")
+        # Preferred labels are only precomputed if there's a database to store them in; otherwise the server will
+        # choose them itself.
+        preferred_label_redis: Optional[RedisConnection] = await self.get_optional_redis("preferred_label_db")
         # did we get all the files
         if len(compendia) == len(self._data_files):
             # for each file validate and process
@@ -253,7 +259,7 @@ class NodeLoader:
                 # check the validity of the file
                 if self.validate_compendia(comp):
                     # try to load the file
-                    loaded = await self.load_compendium(comp, block_size)
+                    loaded = await self.load_compendium(comp, block_size, preferred_label_redis)
                     semantic_types_redis_pipeline = types_prefixes_redis.pipeline()
                     # @TODO add meta data about files eg. checksum to this object
                     semantic_types_redis_pipeline.set(f"file-{str(comp)}", json.dumps({"source_prefixes": self.source_prefixes}))
@@ -269,12 +275,16 @@ class NodeLoader:
                     logger.warning(f"Compendia file {comp} is invalid.")
                     continue
             for conf in self._conflations:
-                loaded = await self.load_conflation(conf, block_size)
+                loaded = await self.load_conflation(conf, block_size, preferred_label_redis)
                 if not loaded:
                     logger.warning(f"Conflation file {conf} did not load.")
                     continue
             # merge all semantic counts from other files / loaders
             await self.merge_semantic_meta_data()
+            # store the Biolink ancestors of every type, so that servers don't need to load the Biolink model
+            await self.record_biolink_ancestors()
+            # let running servers know that the data has changed
+            await self.record_babel_version()
         else:
             logger.error(f"Error: 1 or more data files were incorrect")
             ret_val = False
@@ -332,6 +342,36 @@ class NodeLoader:
             if asyncio.coroutines.iscoroutine(response):
                 await response
 
+    async def record_biolink_ancestors(self):
+        """
+        Store a table of the Biolink ancestors of every Biolink type (see biolink_ancestors.py), which servers
+        load at startup instead of loading the Biolink model themselves.
+        """
+        types_prefixes_redis: RedisConnection = await self.get_redis("curie_to_bl_type_db")
+        types_prefixes_pipeline = types_prefixes_redis.pipeline()
+        types_prefixes_pipeline.set(BIOLINK_ANCESTORS_KEY, serialize_ancestor_table(self.toolkit))
+
+        if self._test_mode != 1:
+            response = await RedisConnection.execute_pipeline(types_prefixes_pipeline)
+            if asyncio.coroutines.iscoroutine(response):
+                await response
+
+    async def record_babel_version(self):
+        """
+        Record which version of Babel has been loaded, so that servers can tell when their cached nodes are out
+        of date. We use the BABEL_VERSION environmental variable if it is set, or the time of this load otherwise.
+        """
+        babel_version = os.environ.get("BABEL_VERSION", f"loaded-{datetime.now().isoformat()}")
+
+        types_prefixes_redis: RedisConnection = await self.get_redis("curie_to_bl_type_db")
+        types_prefixes_pipeline = types_prefixes_redis.pipeline()
+        types_prefixes_pipeline.set(BABEL_VERSION_KEY, babel_version)
+
+        if self._test_mode != 1:
+            response = await RedisConnection.execute_pipeline(types_prefixes_pipeline)
+            if asyncio.coroutines.iscoroutine(response):
+                await response
+
     def validate_compendia(self, in_file):
         # open the file to validate
         with open(in_file, "r") as compendium:
@@ -376,10 +416,20 @@ class NodeLoader:
         connection = connection_factory.get_connection(db_name)
         return connection
 
-    async def load_conflation(self, conflation: dict, block_size: int) -> bool:
+    @staticmethod
+    async def get_optional_redis(db_name):
+        """
+        Return a redis instance, or None if redis_config.yaml doesn't configure this database
+        """
+        redis_config_path = Path(__file__).parent.parent / "redis_config.yaml"
+        connection_factory: RedisConnectionFactory = await RedisConnectionFactory.create_connection_pool(redis_config_path)
+        return connection_factory.get_all_connections().get(db_name)
+
+    async def load_conflation(self, conflation: dict, block_size: int,
+                              preferred_label_redis: Optional[RedisConnection] = None) -> bool:
         """
         Given a conflation, load it into a redis so that it can
-        be read by R3.
+        be read by R3. If preferred_label_redis is given, the preferred label of each conflated clique is stored there.
         """
 
         conflation_file = conflation["file"]
@@ -388,6 +438,8 @@ class NodeLoader:
         line_counter: int = 0
         conflation_redis: RedisConnection = await self.get_redis(conflation_redis_connection_name)
         conflation_pipeline = conflation_redis.pipeline()
+        # the conflated cliques in this block, whose preferred labels we choose when the block is written
+        conflated_cliques = []
 
         with open(f"{self._conflation_directory}/{conflation_file}", "r", encoding="utf-8") as cfile:
             logger.info(f"Processing {conflation_file}...")
@@ -398,6 +450,7 @@ class NodeLoader:
 
                 # load the line into memory
                 instance: dict = json.loads(line)
+                conflated_cliques.append(instance)
 
                 for identifier in instance:
                     # We need to include the identifier in the list of identifiers so that we know its position
@@ -405,12 +458,17 @@ class NodeLoader:
 
                 if self._test_mode != 1 and line_counter % block_size == 0:
                     await RedisConnection.execute_pipeline(conflation_pipeline)
+                    await self.load_conflation_labels(conflation_redis_connection_name, conflated_cliques,
+                                                      preferred_label_redis)
                     # Pipeline executed create a new one error
                     conflation_pipeline = conflation_redis.pipeline()
+                    conflated_cliques = []
                     logger.info(f"{line_counter} {conflation_file} lines processed")
 
             if self._test_mode != 1:
                 await RedisConnection.execute_pipeline(conflation_pipeline)
+                await self.load_conflation_labels(conflation_redis_connection_name, conflated_cliques,
+                                                  preferred_label_redis)
                 logger.info(f"{line_counter} {conflation_file} total lines processed")
 
             # Fail if the file was empty.
@@ -422,11 +480,58 @@ class NodeLoader:
         # return to the caller
         return True
 
-    async def load_compendium(self, compendium_filename: str, block_size: int) -> bool:
+    async def load_conflation_labels(self, conflation_db: str, conflated_cliques: list,
+                                     preferred_label_redis: Optional[RedisConnection]):
+        """
+        Choose the preferred label of each conflated clique in a conflation, in the same way as the server
+        would, and store it under every clique that makes up the conflated clique. This needs the compendia to
+        have been loaded already.
+
+        :param conflation_db: The name of the Redis database of this conflation (e.g. 'gene_protein_db').
+        :param conflated_cliques: A list of conflated cliques, each of which is a list of canonical IDs.
+        :param preferred_label_redis: The preferred_label_db connection, or None if there isn't one (in which case
+            the server will choose these labels itself).
+        """
+        if not conflated_cliques or preferred_label_redis is None:
+            return
+
+        id2eqids_redis: RedisConnection = await self.get_redis("id_to_eqids_db")
+        id2type_redis: RedisConnection = await self.get_redis("id_to_type_db")
+
+        canonical_ids = uniquify_list(identifier for instance in conflated_cliques for identifier in instance)
+        eqids = await id2eqids_redis.mget(*canonical_ids, encoding='utf-8')
+        types = await id2type_redis.mget(*canonical_ids, encoding='utf-8')
+        eqids_by_id = {
+            canonical_id: json.loads(value)
+            for canonical_id, value in zip(canonical_ids, eqids)
+            if value is not None
+        }
+        types_by_id = dict(zip(canonical_ids, types))
+
+        preferred_label_pipeline = preferred_label_redis.pipeline()
+        for instance in conflated_cliques:
+            # The conflated clique is made up of the identifiers of each clique in turn, and has the types (and
+            # ancestors) of each clique in turn.
+            eids = [eqid for canonical_id in instance for eqid in eqids_by_id.get(canonical_id, [])]
+            conflated_types = uniquify_list(
+                typ
+                for canonical_id in instance
+                for typ in (self.get_ancestors(types_by_id[canonical_id]) if types_by_id[canonical_id]
+                            else [BIOLINK_NAMED_THING])
+            )
+            preferred_label = choose_preferred_label(conflated_types, get_first_labeled_subclique(eids, eqids_by_id))
+            for canonical_id in instance:
+                preferred_label_pipeline.set(get_preferred_label_key(canonical_id, conflation_db), preferred_label)
+
+        await RedisConnection.execute_pipeline(preferred_label_pipeline)
+
+    async def load_compendium(self, compendium_filename: str, block_size: int,
+                              preferred_label_redis: Optional[RedisConnection] = None) -> bool:
         """
         Given the full path to a compendium, load it into redis so that it can
         be read by R3.  We also load extra keys, which are the upper-cased
-        identifiers, for ease of use
+        identifiers, for ease of use. If preferred_label_redis is given, the
+        preferred label of each clique is stored there.
         """
 
         # init a line counter
@@ -440,6 +545,7 @@ class NodeLoader:
         id2eqids_pipeline = id2eqids_redis.pipeline()
         id2type_pipeline = id2type_redis.pipeline()
         info_content_pipeline = info_content_redis.pipeline()
+        preferred_label_pipeline = preferred_label_redis.pipeline() if preferred_label_redis is not None else None
 
         with open(compendium_filename, "r", encoding="utf-8") as compendium:
             logger.info(f"Processing {compendium_filename}...")
@@ -495,11 +601,20 @@ class NodeLoader:
                     if "ic" in instance and instance["ic"] is not None:
                         info_content_pipeline.set(identifier, instance["ic"])
 
+                # Choose the preferred label of this clique now, so that the server doesn't need to. We use the
+                # same types (the type and all its ancestors) that the server would.
+                if preferred_label_pipeline is not None:
+                    preferred_label_pipeline.set(get_preferred_label_key(identifier),
+                                                 choose_preferred_label(semantic_types, instance["identifiers"]))
+
                 if self._test_mode != 1 and line_counter % block_size == 0:
                     await RedisConnection.execute_pipeline(term2id_pipeline)
                     await RedisConnection.execute_pipeline(id2eqids_pipeline)
                     await RedisConnection.execute_pipeline(id2type_pipeline)
                     await RedisConnection.execute_pipeline(info_content_pipeline)
+                    if preferred_label_pipeline is not None:
+                        await RedisConnection.execute_pipeline(preferred_label_pipeline)
+                        preferred_label_pipeline = preferred_label_redis.pipeline()
 
                     # Pipeline executed create a new one error
                     term2id_pipeline = term2id_redis.pipeline()
@@ -514,6 +629,8 @@ class NodeLoader:
                 await RedisConnection.execute_pipeline(id2eqids_pipeline)
                 await RedisConnection.execute_pipeline(id2type_pipeline)
                 await RedisConnection.execute_pipeline(info_content_pipeline)
+                if preferred_label_pipeline is not None:
+                    await RedisConnection.execute_pipeline(preferred_label_pipeline)
 
                 logger.info(f"{line_counter} {compendium_filename} total lines processed")
 
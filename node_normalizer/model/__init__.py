@@ -2,5 +2,5 @@
 API Models not described in reasoner-pydantic
 """
 
-from .input import CurieList, SemanticTypesInput, SetIDQuery
+from .input import CurieList, CanonicalIDQuery, NodeField, SemanticTypesInput, SetIDQuery
 from .response import CuriePivot, SemanticTypes, ConflationList, SetIDResponse
@@ -4,7 +4,10 @@ API Input Models not described in reasoner-pydantic
 
 from pydantic import BaseModel, Field
 
-from typing import List, Dict
+from typing import List, Dict, Literal, Optional
+
+# The parts of a normalized node that can be requested with the `fields` option of /get_normalized_nodes.
+NodeField = Literal['id', 'label', 'type', 'equivalent_identifiers', 'information_content', 'description']
 
 
 class CurieList(BaseModel):
@@ -36,6 +39,34 @@ class CurieList(BaseModel):
         title="Whether to return individual types for equivalent identifiers"
     )
 
+    fields: Optional[List[NodeField]] = Field(
+        None,
+        title="The parts of each normalized node to return (all of them by default). If set, descriptions are "
+              "only returned if 'description' is included."
+    )
+
+    max_equivalent_identifiers: Optional[int] = Field(
+        None,
+        title="The maximum number of equivalent identifiers to return for each node (all of them by default). The "
+              "rest can be retrieved from /get_equivalent_identifiers.",
+        ge=0
+    )
+
+    include_prefixes: Optional[List[str]] = Field(
+        None,
+        title="Only return the equivalent identifiers with one of these prefixes (e.g. MONDO)"
+    )
+
+    exclude_prefixes: Optional[List[str]] = Field(
+        None,
+        title="Don't return the equivalent identifiers with any of these prefixes"
+    )
+
+    require_type: Optional[str] = Field(
+        None,
+        title="Return null for CURIEs that don't normalize to a clique of this Biolink type (e.g. biolink:Disease)"
+    )
+
     class Config:
         schema_extra = {
             "example": {
@@ -47,6 +78,41 @@ class CurieList(BaseModel):
         }
 
 
+class CanonicalIDQuery(BaseModel):
+    """Canonical ID query input model"""
+
+    curies: List[str] = Field(
+        ...,  # Ellipsis means field is required
+        title='List of CURIEs to normalize',
+        min_items=1
+    )
+
+    conflate: bool = Field(
+        True,
+        title="Whether to apply gene/protein conflation"
+    )
+
+    drug_chemical_conflate: bool = Field(
+        False,
+        title="Whether to apply drug/chemical conflation"
+    )
+
+    include_type: bool = Field(
+        False,
+        title="Whether to return the most specific Biolink type of each preferred identifier"
+    )
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "curies": ['MESH:D014867', 'NCIT:C34373'],
+                "conflate": True,
+                "drug_chemical_conflate": False,
+                "include_type": False,
+            }
+        }
+
+
 class SemanticTypesInput(BaseModel):
     """Semantic type input model"""
 
@@ -1,3 +1,4 @@
+import asyncio
 import collections
 import itertools
 from pathlib import Path
@@ -8,16 +9,16 @@ import time
 import orjson as json
 import logging
 import os
-import uuid
 import traceback
-from typing import List, Dict, Optional, Any, Set, Tuple, Union
-from uuid import UUID
-from bmt.utils import format_element as bmt_format
+from typing import List, Dict, FrozenSet, Optional, Any, Sequence, Set, Tuple, Union
 
 from fastapi import FastAPI
 from reasoner_pydantic import KnowledgeGraph, Message, QueryGraph, Result, CURIE, Attribute
 
-from .util import LoggingUtil, uniquify_list, BIOLINK_NAMED_THING
+from .cache import BoundedCache, CliqueRecordCache, NormalizationCache
+from .hashing import attributes_hash, content_hash
+from .redis_adapter import RedisScript
+from .util import LoggingUtil, uniquify_list, get_preferred_label_key, BIOLINK_NAMED_THING, BABEL_VERSION_KEY
 
 # logger = LoggingUtil.init_logging(__name__, level=logging.INFO, format='medium', logFilePath=os.path.dirname(__file__), logFileLevel=logging.INFO)
 logger = LoggingUtil.init_logging()
@@ -27,6 +28,10 @@ with open(Path(__file__).parents[1] / "config.json", "r") as configf:
     config = builtin_json.load(configf)
 
 
+# The parts of a normalized node that can be requested with the `fields` option.
+NODE_FIELDS = frozenset(['id', 'label', 'type', 'equivalent_identifiers', 'information_content', 'description'])
+
+
 def sort_identifiers_with_boosted_prefixes(identifiers, prefixes):
     """
     Given a list of identifiers (with `identifier` and `label` keys), sort them using
@@ -50,45 +55,243 @@ def sort_identifiers_with_boosted_prefixes(identifiers, prefixes):
     )
 
 
-def get_ancestors(app, input_type):
-    if input_type in app.state.ancestor_map:
-        return app.state.ancestor_map[input_type]
-    a = app.state.toolkit.get_ancestors(input_type)
-    ancs = [bmt_format(ai) for ai in a]
-    #if input_type is in ancs, remove it
-    if input_type in ancs:
-        ancs.remove(input_type)
-    ancs = [input_type] + ancs
-    app.state.ancestor_map[input_type] = ancs
-    return ancs
+def get_first_labeled_subclique(eids: List[dict], subclique_eqids: Dict[str, List]) -> List[dict]:
+    """
+    Find the identifiers of the first subclique of a conflated clique that has any labels.
+
+    To replicate Babel's behavior for conflated cliques, we need to run the preferred label algorithm on ONLY the
+    labels for the FIRST clique of the conflated cliques with labels.
+
+    :param eids: The equivalent identifiers of the conflated clique, in the format
+        [ {"i": "MONDO:12312", "l": "Scrofula"}, {},...].
+    :param subclique_eqids: A dict of the equivalent identifiers of each clique that makes up the conflated clique,
+        keyed by the first identifier of that clique.
+    :return: The identifiers of the first subclique with a label, or of the last subclique checked if none of them
+        have labels.
+    """
+    # We have a conflation going on! To replicate Babel's behavior, we need to run the algorithem
+    # on the list of labels corresponding to the first
+    # So we need to run the algorithm on the first set of identifiers that have any
+    # label whatsoever.
+    identifiers_with_labels = []
+    curies_already_checked = set()
+    for identifier in eids:
+        curie = identifier.get('i', '')
+        if curie in curies_already_checked:
+            continue
+
+        # Each subclique starts with its own clique leader, so every CURIE we check here should be in
+        # subclique_eqids. If one isn't, we don't know which identifiers belong with it, so we skip it.
+        if curie not in subclique_eqids:
+            curies_already_checked.add(curie)
+            continue
+        identifiers_with_labels = [ident for ident in subclique_eqids[curie] if ident is not None]
+        labels = map(lambda ident: ident.get('l', ''), identifiers_with_labels)
+        if any(map(lambda l: l != '', labels)):
+            break
+
+        # Since we didn't get any matches here, add it to the list of CURIEs already checked so
+        # we don't make redundant queries to the database.
+        curies_already_checked.update(set(map(lambda x: x.get('i', ''), identifiers_with_labels)))
+
+    # We might get here without any labels, which is fine. At least we tried.
+    return identifiers_with_labels
+
+
+def choose_preferred_label(types: Sequence[str], identifiers_with_labels: List[dict]) -> str:
+    """
+    Choose the preferred label for a clique.
+
+    As per https://github.com/TranslatorSRI/Babel/issues/158, we select the first label from any
+    identifier _except_ where one of the types is in preferred_name_boost_prefixes, in which case
+    we prefer the prefixes listed there.
+
+    This should perfectly replicate NameRes labels for non-conflated cliques. For conflated cliques,
+    identifiers_with_labels should be the identifiers of the first subclique with any labels
+    (see get_first_labeled_subclique()).
+
+    :param types: The types of the clique (including ancestors), from most specific to least specific.
+    :param identifiers_with_labels: Identifiers in the format [ {"i": "MONDO:12312", "l": "Scrofula"}, {},...].
+    :return: The preferred label, or '' if none of the identifiers have a usable label.
+    """
+    # Note that types goes from most specific to least specific, so we
+    # need to reverse it in order to apply preferred_name_boost_prefixes for the most
+    # specific type.
+    possible_labels = []
+    for typ in types[::-1]:
+        if typ in config['preferred_name_boost_prefixes']:
+            # This is the most specific matching type, so we use this and then break.
+            possible_labels = list(map(lambda ident: ident.get('l', ''),
+                                  sort_identifiers_with_boosted_prefixes(
+                                      identifiers_with_labels,
+                                      config['preferred_name_boost_prefixes'][typ]
+                                  )))
+
+            # Add in all the other labels -- we'd still like to consider them, but at a lower priority.
+            for eid in identifiers_with_labels:
+                label = eid.get('l', '')
+                if label not in possible_labels:
+                    possible_labels.append(label)
+
+            # Since this is the most specific matching type, we shouldn't do other (presumably higher-level)
+            # categories: so let's break here.
+            break
+
+    # Step 1.2. If we didn't have a preferred_name_boost_prefixes, just use the identifiers in their
+    # Biolink prefix order.
+    if not possible_labels:
+        possible_labels = map(lambda eid: eid.get('l', ''), identifiers_with_labels)
+
+    # Step 2. Filter out any suspicious labels.
+    filtered_possible_labels = [l for l in possible_labels if
+        l and                               # Ignore blank or empty names.
+        not l.startswith('CHEMBL')          # Some CHEMBL names are just the identifier again.
+        ]
+
+    # Step 3. Filter out labels longer than config['demote_labels_longer_than'], but only if there is at
+    # least one label shorter than this limit.
+    labels_shorter_than_limit = [l for l in filtered_possible_labels if l and len(l) <= config['demote_labels_longer_than']]
+    if labels_shorter_than_limit:
+        filtered_possible_labels = labels_shorter_than_limit
+
+    if filtered_possible_labels:
+        return filtered_possible_labels[0]
+    return ''
+
+
+def get_ancestors(app, input_type) -> Tuple[str, ...]:
+    """
+    Look up a Biolink type and its ancestors in the precomputed ancestor table (see biolink_ancestors.py).
+    The returned tuple is shared, so it can't be modified.
+    """
+    ancestors = app.state.ancestor_map.get(input_type)
+    if ancestors is None:
+        # This type isn't in the version of Biolink that the table was computed from. Remember that, so we
+        # only warn about it once.
+        logger.warning(f"Biolink type {input_type} not found in the ancestor table, so no ancestors will be included.")
+        ancestors = (input_type,)
+        app.state.ancestor_map[input_type] = ancestors
+    return ancestors
 
 
 async def normalize_message(app: FastAPI, message: Message) -> Message:
     """
     Given a TRAPI message, updates the message to include a
     normalized qgraph, kgraph, and results
+
+    This is a wrapper around normalize_message_dict() for pydantic messages.
     """
+    message_dict = {}
+    if message.query_graph is not None:
+        message_dict['query_graph'] = _qgraph_to_dict(message.query_graph)
+    if message.knowledge_graph is not None:
+        message_dict['knowledge_graph'] = _kgraph_to_dict(message.knowledge_graph)
+    if message.results is not None:
+        message_dict['results'] = [result.dict() for result in message.results]
+
+    merged_message = await normalize_message_dict(app, message_dict)
+
+    # (Parsing a whole Message would give the edges new ids, so we only parse its parts.)
     ret = Message()
+    if 'query_graph' in merged_message:
+        ret.query_graph = QueryGraph.parse_obj(merged_message['query_graph'])
+    if 'knowledge_graph' in merged_message:
+        ret.knowledge_graph = KnowledgeGraph.parse_obj(merged_message['knowledge_graph'])
+    if 'results' in merged_message:
+        ret.results = [Result.parse_obj(result) for result in merged_message['results']]
+    return ret
 
-    logger.debug(f"message.query_graph is None: {message.query_graph is None}")
-    if message.query_graph is not None:
-        merged_qgraph = await normalize_qgraph(app, message.query_graph)
-        ret.query_graph = merged_qgraph
-    logger.debug(f"Merged Qgraph: {merged_qgraph}")
 
-    logger.debug(f"message.knowledge_graph is None: {message.knowledge_graph is None}")
-    if message.knowledge_graph is not None:
-        merged_kgraph, node_id_map, edge_id_map = await normalize_kgraph(app, message.knowledge_graph)
-        ret.knowledge_graph = merged_kgraph
-    logger.debug(f"Merged Kgraph: {merged_kgraph}")
+def _qgraph_to_dict(qgraph: QueryGraph) -> Dict:
+    # The edges are passed through unchanged.
+    return {
+        'nodes': {node_code: node.dict() for node_code, node in qgraph.nodes.items()},
+        'edges': qgraph.edges,
+    }
+
+
+def _kgraph_to_dict(kgraph: KnowledgeGraph) -> Dict:
+    # (KnowledgeGraph.dict() would give the edges new ids.)
+    return {
+        'nodes': {node_id: node.dict() for node_id, node in kgraph.nodes.items()},
+        'edges': {edge_id: edge.dict() for edge_id, edge in kgraph.edges.items()},
+    }
+
+
+async def normalize_query_json(app: FastAPI, query: Dict) -> bytes:
+    """
+    Normalize the message in a TRAPI query (as parsed from JSON, without pydantic), and return the query as JSON.
+    """
+    query = dict(query)
+    query['message'] = await normalize_message_dict(app, query.get('message') or {})
+    # Like the pydantic models (serialized with exclude_none), leave out any nulls.
+    return json.dumps(_drop_none(query))
+
+
+def _drop_none(value):
+    """
+    Return a copy of a JSON value without any null-valued keys. Attribute values are left as they are, since they
+    aren't TRAPI objects.
+    """
+    if isinstance(value, dict):
+        is_attribute = 'attribute_type_id' in value
+        return {
+            k: v if is_attribute and k == 'value' else _drop_none(v)
+            for k, v in value.items()
+            if v is not None
+        }
+    if isinstance(value, list):
+        return [_drop_none(v) for v in value]
+    return value
+
+
+async def normalize_message_dict(app: FastAPI, message: Dict) -> Dict:
+    """
+    Given a TRAPI message as a dict (e.g. parsed from JSON), returns a
+    message with a normalized qgraph, kgraph, and results
+
+    The dicts in the message may be modified or reused in the output.
+    """
+    ret = {}
+
+    query_graph = message.get('query_graph')
+    knowledge_graph = message.get('knowledge_graph')
+    results = message.get('results')
+
+    # Normalize the identifiers in the query graph and the knowledge graph together, since they usually overlap.
+    curies = []
+    if query_graph is not None:
+        curies.extend(get_qgraph_ids(query_graph))
+    if knowledge_graph is not None:
+        curies.extend(knowledge_graph.get('nodes', {}).keys())
+    equivalent_curies = await get_all_equivalent_curies(app, curies)
+
+    logger.debug(f"message.query_graph is None: {query_graph is None}")
+    if query_graph is not None:
+        ret['query_graph'] = await normalize_qgraph_dict(app, query_graph, equivalent_curies)
+        logger.debug(f"Merged Qgraph: {ret['query_graph']}")
+
+    node_id_map: Dict[str, str] = {}
+    edge_id_map: Dict[str, str] = {}
+    logger.debug(f"message.knowledge_graph is None: {knowledge_graph is None}")
+    if knowledge_graph is not None:
+        ret['knowledge_graph'], node_id_map, edge_id_map = await normalize_kgraph_dict(app, knowledge_graph,
+                                                                                      equivalent_curies)
+        logger.debug(f"Merged Kgraph: {ret['knowledge_graph']}")
     logger.debug(f"node_id_map: {node_id_map}")
     logger.debug(f"edge_id_map: {edge_id_map}")
 
-    logger.debug(f"message.results is None: {message.results is None}")
-    if message.results is not None:
-        merged_results = await normalize_results(app, message.results, node_id_map, edge_id_map)
-        ret.results = merged_results
-    logger.debug(f"Merged Results: {merged_results}")
+    logger.debug(f"message.results is None: {results is None}")
+    if results is not None:
+        # Bindings get the same information content as the knowledge graph node they're bound to, which comes
+        # from the first node that was merged into it, so the results don't need to look it up again.
+        info_contents = {}
+        for node_id in (knowledge_graph or {}).get('nodes') or {}:
+            if equivalent_curies.get(node_id):
+                info_contents.setdefault(node_id_map.get(node_id, node_id),
+                                         equivalent_curies[node_id].get('information_content'))
+        ret['results'] = await normalize_results_dict(app, results, node_id_map, edge_id_map, info_contents)
+        logger.debug(f"Merged Results: {ret['results']}")
 
     return ret
 
@@ -100,11 +303,47 @@ async def normalize_results(app,
                             ) -> List[Result]:
     """
     Given a TRAPI result creates a normalized result object
+
+    This is a wrapper around normalize_results_dict() for pydantic results.
+    """
+    merged_results = await normalize_results_dict(app, [result.dict() for result in results], node_id_map,
+                                                  edge_id_map)
+    return [Result.parse_obj(merged_result) for merged_result in merged_results]
+
+
+async def normalize_results_dict(app,
+                                 results: List[Dict],
+                                 node_id_map: Dict[str, str],
+                                 edge_id_map: Dict[str, str],
+                                 info_contents: Optional[Dict[str, Optional[float]]] = None
+                                 ) -> List[Dict]:
+    """
+    Given a list of TRAPI results as dicts, returns the normalized and deduplicated results
+
+    :param info_contents: The information content (or None) of the normalized ids that we already know it for
+        (e.g. from normalizing the knowledge graph). The rest are looked up together.
     """
 
-    merged_results: List[Result] = []
+    merged_results: List[Dict] = []
     result_seen = set()
 
+    # Look up the information content of all the bound nodes we don't already know it for at once, rather than
+    # once per binding.
+    info_contents = info_contents or {}
+    ic_attributes = {
+        canonical_id: info_content_attribute(ic_val) if ic_val is not None else None
+        for canonical_id, ic_val in info_contents.items()
+    }
+    missing_ids = [
+        bound_id
+        for result in results
+        for node_bindings in result.get('node_bindings', {}).values()
+        for bound_id in (node_id_map.get(n_bind['id'], n_bind['id']) for n_bind in node_bindings)
+        if bound_id not in info_contents
+    ]
+    if missing_ids:
+        ic_attributes.update(await get_info_content_attributes(app, missing_ids))
+
     for result in results:
         merged_result = {
             'node_bindings': {},
@@ -113,48 +352,28 @@ async def normalize_results(app,
 
         node_binding_seen = set()
 
-        for node_code, node_bindings in result.node_bindings.items():
+        for node_code, node_bindings in result.get('node_bindings', {}).items():
             merged_node_bindings = []
             for n_bind in node_bindings:
-                merged_binding = n_bind.dict()
-                # merged_binding['id'] = node_id_map[n_bind.id.__root__]
-                merged_binding['id'] = node_id_map[n_bind.id]
+                merged_binding = dict(n_bind)
+                merged_binding['id'] = node_id_map.get(n_bind['id'], n_bind['id'])
 
                 # get the information content value
-                ic_attrib = await get_info_content_attribute(app, merged_binding['id'])
+                ic_attrib = ic_attributes.get(merged_binding['id'])
 
                 # did we get a good attribute dict
                 if ic_attrib:
-                    if 'attributes' in merged_binding and merged_binding['attributes'] is not None:
-                        merged_binding['attributes'].append(ic_attrib)
+                    # (The same attribute can be used by many bindings, so each one gets its own copy.)
+                    ic_attrib = dict(ic_attrib)
+                    if merged_binding.get('attributes') is not None:
+                        merged_binding['attributes'] = merged_binding['attributes'] + [ic_attrib]
                     else:
                         merged_binding['attributes'] = [ic_attrib]
 
-                node_binding_information = [
-                    "atts" if k == 'attributes'
-                    else (k, tuple(v)) if isinstance(v, list)
-                    else (k, v)
-                    for k, v in merged_binding.items()
-                ]
-
-                # if there are attributes in the node binding
-                if 'attributes' in merged_binding:
-                    # storage for the pydantic Attributes
-                    attribs = []
-
-                    # the items in list of attributes must be of type Attribute
-                    # in order to reuse hash method
-                    if merged_binding['attributes'] is not None:
-                        for attrib in merged_binding['attributes']:
-                            new_attrib = Attribute.parse_obj(attrib)
-
-                            # add the new Attribute to the list
-                            attribs.append(new_attrib)
-
-                        # call to get the hash
-                        atty_hash = _hash_attributes(attribs)
-                        node_binding_information.append(atty_hash)
-                node_binding_hash = frozenset(node_binding_information)
+                # The attributes of a binding are a set, so they're hashed separately from the rest of it.
+                node_binding_hash = content_hash(
+                    {k: v for k, v in merged_binding.items() if k != 'attributes'}
+                ) + attributes_hash(merged_binding.get('attributes'))
 
                 if node_binding_hash in node_binding_seen:
                     continue
@@ -165,17 +384,16 @@ async def normalize_results(app,
             merged_result['node_bindings'][node_code] = merged_node_bindings
 
         edge_binding_seen = set()
-        for analysis in result.analyses:
-            for edge_code, edge_bindings in analysis.edge_bindings.items():
+        for analysis in result.get('analyses', []):
+            merged_analysis = dict(analysis)
+            merged_analysis['edge_bindings'] = {}
+            for edge_code, edge_bindings in analysis.get('edge_bindings', {}).items():
                 merged_edge_bindings = []
                 for e_bind in edge_bindings:
-                    merged_binding = e_bind.dict()
-                    merged_binding['id'] = edge_id_map[e_bind.id]
+                    merged_binding = dict(e_bind)
+                    merged_binding['id'] = edge_id_map.get(e_bind['id'], e_bind['id'])
 
-                    edge_binding_hash = frozenset([
-                        (k, freeze(v))
-                        for k, v in merged_binding.items()
-                    ])
+                    edge_binding_hash = content_hash(merged_binding)
 
                     if edge_binding_hash in edge_binding_seen:
                         continue
@@ -183,94 +401,120 @@ async def normalize_results(app,
                         edge_binding_seen.add(edge_binding_hash)
                         merged_edge_bindings.append(merged_binding)
 
-                analysis.edge_bindings[edge_code] = merged_edge_bindings
-                merged_result['analyses'].append(analysis.dict())
+                merged_analysis['edge_bindings'][edge_code] = merged_edge_bindings
 
-        try:
-            # This used to have some list comprehension based on types.  But in TRAPI 1.1 the list/dicts get pretty deep.
-            # This is simpler, and the sort_keys argument makes sure we get a constant result.
-            #THis is for regular json
-            #hashed_result = json.dumps(merged_result, sort_keys=True)
-            #This is for orjson
-            hashed_result = json.dumps(merged_result, option=json.OPT_SORT_KEYS)
-
-        except Exception as e:  # TODO determine exception(s) to catch
-            exception_str = "".join(traceback.format_exc())
-            logger.error(f'Exception: {exception_str}')
-            hashed_result = False
+            merged_result['analyses'].append(merged_analysis)
 
-        if hashed_result is not False:
-            if hashed_result in result_seen:
-                continue
-            else:
-                result_seen.add(hashed_result)
+        # We only keep the (16 byte) hash of each result we've seen, rather than the result itself.
+        hashed_result = content_hash(merged_result)
+        if hashed_result in result_seen:
+            continue
+        else:
+            result_seen.add(hashed_result)
 
-        merged_results.append(Result.parse_obj(merged_result))
+        merged_results.append(merged_result)
 
     return merged_results
 
 
-def freeze(d):
-    if isinstance(d, dict):
-        return frozenset((key, freeze(value)) for key, value in d.items())
-    elif isinstance(d, list):
-        return tuple(freeze(value) for value in d)
-    return d
+def get_qgraph_ids(qgraph: Dict) -> List[str]:
+    """
+    Return the ids of all the nodes in a TRAPI query graph dict.
+    """
+    return [
+        nr
+        for node in qgraph.get('nodes', {}).values()
+        if isinstance(node.get('ids'), list)
+        for nr in node['ids']
+    ]
 
 
-async def normalize_qgraph(app: FastAPI, qgraph: QueryGraph) -> QueryGraph:
+async def normalize_qgraph(app: FastAPI, qgraph: QueryGraph, equivalent_curies: Optional[Dict] = None) -> QueryGraph:
     """
     Given a TRAPI query graph creates a normalized query graph
     with primary curies replacing nonprimary ones
+
+    This is a wrapper around normalize_qgraph_dict() for pydantic query graphs.
+    """
+    return QueryGraph.parse_obj(await normalize_qgraph_dict(app, _qgraph_to_dict(qgraph), equivalent_curies))
+
+
+async def normalize_qgraph_dict(app: FastAPI, qgraph: Dict, equivalent_curies: Optional[Dict] = None) -> Dict:
+    """
+    Given a TRAPI query graph dict creates a normalized query graph
+    with primary curies replacing nonprimary ones
+
+    :param equivalent_curies: The output of get_all_equivalent_curies() for some or all of the ids in the query graph,
+        if we already have it. The rest are looked up together.
     """
     merged_nodes = {}
 
-    node_code_map: Dict[str, Union[str, List]] = {}
+    equivalent_curies = await get_missing_equivalent_curies(app, get_qgraph_ids(qgraph), equivalent_curies)
 
-    for node_code, node in qgraph.nodes.items():
+    for node_code, node in qgraph.get('nodes', {}).items():
         try:
-            merged_nodes[node_code] = node.dict()
+            # Fill in the defaults that validating the node with reasoner_pydantic would have added.
+            merged_nodes[node_code] = {'is_set': False, 'constraints': [], **node}
 
             # as of TRAPI 1.1, node.id must be none or a list.
             # node.id can be none, a string, or a list
-            if not node.ids:
+            if not node.get('ids'):
                 # do nothing
                 continue
             else:
-                if not isinstance(node.ids.__root__, list):
+                if not isinstance(node['ids'], list):
                     raise Exception("node.ids must be a list")
                 primary_ids = set()
-                for nr in node.ids.__root__:
-                    equivalent_curies = await get_equivalent_curies(app, nr)
-                    if equivalent_curies[nr]:
+                for nr in node['ids']:
+                    if equivalent_curies.get(nr):
                         primary_ids.add(equivalent_curies[nr]['id']['identifier'])
                     else:
                         primary_ids.add(nr)
                 merged_nodes[node_code]['ids'] = list(primary_ids)
-                node_code_map[node_code] = list(primary_ids)
         except Exception as e:
             exception_str = "".join(traceback.format_exc())
             logger.error(f'Exception: {exception_str}')
 
-    return QueryGraph.parse_obj({
+    return {
+        **qgraph,
         'nodes': merged_nodes,
-        'edges': qgraph.edges
-    })
+    }
 
 
 async def normalize_kgraph(
         app: FastAPI,
-        kgraph: KnowledgeGraph
+        kgraph: KnowledgeGraph,
+        equivalent_curies: Optional[Dict] = None
 ) -> Tuple[KnowledgeGraph, Dict[str, str], Dict[str, str]]:
     """
     Given a TRAPI knowledge graph creates a merged graph
     by iterating over each node, getting the primary id,
     and merging nodes and edges (as needed)
 
+    This is a wrapper around normalize_kgraph_dict() for pydantic knowledge graphs.
+    """
+    merged_kgraph, node_id_map, edge_id_map = await normalize_kgraph_dict(app, _kgraph_to_dict(kgraph),
+                                                                          equivalent_curies)
+    return KnowledgeGraph.parse_obj(merged_kgraph), node_id_map, edge_id_map
+
+
+async def normalize_kgraph_dict(
+        app: FastAPI,
+        kgraph: Dict,
+        equivalent_curies: Optional[Dict] = None
+) -> Tuple[Dict, Dict[str, str], Dict[str, str]]:
+    """
+    Given a TRAPI knowledge graph dict creates a merged graph
+    by iterating over each node, getting the primary id,
+    and merging nodes and edges (as needed)
+
     Returns a tuple with the first element being the merged
     knowledge graph, and the second element being a map
     of the original node id to the updated node id, and the third
     being an edge id map
+
+    :param equivalent_curies: The output of get_all_equivalent_curies() for some or all of the node ids, if we
+        already have it (e.g. from normalizing the query graph). The rest are looked up together.
     """
 
     merged_kgraph: Dict = {
@@ -278,17 +522,14 @@ async def normalize_kgraph(
         'edges': {}
     }
 
-    node_id_map: Dict[str, str] = {}
-    edge_id_map: Dict[str, str] = {}
-
     # Map for each node id (curie) and its primary id
     node_id_map: Dict[str, str] = {}
 
     # Map for each edge id and its primary id
     edge_id_map: Dict[str, str] = {}
 
-    # Map for each edge to its s,p,r,o signature
-    primary_edges: Dict[Tuple[str, str, Optional[str], str, Union[UUID, int]], str] = {}
+    # Map for each edge to its s,p,o,attributes signature
+    primary_edges: Dict[Tuple[str, str, str, bytes], str] = {}
 
     # cache for primary node ids
     primary_nodes_seen = set()
@@ -299,19 +540,26 @@ async def normalize_kgraph(
     # cache for nodes
     nodes_seen = set()
 
-    # cache for subject, predicate, relation, object, attribute hash tuples
-    edges_seen: Set[Tuple[str, str, str, str, Union[UUID, int]]] = set()
+    # cache for subject, predicate, object, attribute hash tuples
+    edges_seen: Set[Tuple[str, str, str, bytes]] = set()
+
+    kgraph_nodes = kgraph.get('nodes') or {}
+    kgraph_edges = kgraph.get('edges') or {}
+
+    # Normalize all the nodes up front, rather than one node at a time. The normalized nodes include their
+    # information content, so we don't need to look that up separately.
+    all_equivalent_curies = await get_missing_equivalent_curies(app, list(kgraph_nodes.keys()), equivalent_curies)
 
-    for node_id, node in kgraph.nodes.items():
+    for node_id, node in kgraph_nodes.items():
         if node_id in nodes_seen:
             continue
 
         nodes_seen.add(node_id)
         node_id_map[node_id] = node_id  # expected to overridden by primary id
 
-        merged_node = node.dict()
+        merged_node = dict(node)
 
-        equivalent_curies = await get_equivalent_curies(app, node_id)
+        equivalent_curies = {node_id: all_equivalent_curies.get(node_id)}
 
         if equivalent_curies[node_id]:
             primary_id = equivalent_curies[node_id]['id']['identifier']
@@ -320,7 +568,7 @@ async def normalize_kgraph(
             if primary_id in primary_nodes_seen:
                 merged_node = _merge_node_attributes(
                     node_a=merged_kgraph['nodes'][primary_id],
-                    node_b=node.dict(),
+                    node_b=node,
                     merged_count=node_merge_count[primary_id]
                 )
                 merged_kgraph['nodes'][primary_id] = merged_node
@@ -360,52 +608,43 @@ async def normalize_kgraph(
                     # 'source': f'{app.title} {app.version}',
                 }
                 if 'attributes' in merged_node and merged_node['attributes']:
-                    merged_node['attributes'].append(same_as_attribute)
+                    merged_node['attributes'] = merged_node['attributes'] + [same_as_attribute]
                 else:
                     merged_node['attributes'] = [same_as_attribute]
 
             if 'type' in equivalent_curies[node_id]:
                 if type(equivalent_curies[node_id]['type']) is list:
-                    merged_node['categories'] = equivalent_curies[node_id]['type']
+                    # Normalized nodes may be cached, so we copy the list rather than sharing it.
+                    merged_node['categories'] = list(equivalent_curies[node_id]['type'])
                 else:
                     merged_node['categories'] = [equivalent_curies[node_id]['type']]
 
-            # get the information content value
-            ic_attrib = await get_info_content_attribute(app, node_id)
-
-            # did we get a good attribute dict
-            if ic_attrib:
-                # add the attribute to the node
-                merged_node['attributes'].append(ic_attrib)
+            # add the information content value to the node, if it has one
+            if equivalent_curies[node_id].get('information_content') is not None:
+                ic_attrib = info_content_attribute(equivalent_curies[node_id]['information_content'])
+                merged_node['attributes'] = merged_node['attributes'] + [ic_attrib]
 
             merged_kgraph['nodes'][primary_id] = merged_node
         else:
             merged_kgraph['nodes'][node_id] = merged_node
 
-    for edge_id, edge in kgraph.edges.items():
-        # Accessing __root__ directly seems wrong,
-        # https://github.com/samuelcolvin/pydantic/issues/730
-        # could also do str(edge.subject)
-        if edge.subject in node_id_map:
-            primary_subject = node_id_map[edge.subject]
+    for edge_id, edge in kgraph_edges.items():
+        if edge['subject'] in node_id_map:
+            primary_subject = node_id_map[edge['subject']]
         else:
             # should we throw a validation error here?
-            primary_subject = edge.subject
+            primary_subject = edge['subject']
 
-        if edge.object in node_id_map:
-            primary_object = node_id_map[edge.object]
+        if edge['object'] in node_id_map:
+            primary_object = node_id_map[edge['object']]
         else:
-            primary_object = edge.object
-
-        hashed_attributes = _hash_attributes(edge.attributes)
+            primary_object = edge['object']
 
-        if hashed_attributes is False:
-            # we couldn't hash the attribute so assume unique
-            hashed_attributes = uuid.uuid4()
+        hashed_attributes = attributes_hash(edge.get('attributes'))
 
         triple = (
             primary_subject,
-            edge.predicate,
+            edge.get('predicate'),
             primary_object,
             hashed_attributes
         )
@@ -418,13 +657,13 @@ async def normalize_kgraph(
             edge_id_map[edge_id] = edge_id
 
         edges_seen.add(triple)
-        merged_edge = edge.dict()
+        merged_edge = dict(edge)
 
         merged_edge['subject'] = primary_subject
         merged_edge['object'] = primary_object
         merged_kgraph['edges'][edge_id] = merged_edge
 
-    return KnowledgeGraph.parse_obj(merged_kgraph), node_id_map, edge_id_map
+    return merged_kgraph, node_id_map, edge_id_map
 
 
 async def get_equivalent_curies(
@@ -465,6 +704,59 @@ async def get_equivalent_curies(
     return value
 
 
+async def get_all_equivalent_curies(
+        app: FastAPI,
+        curies: List[Union[str, CURIE]]
+) -> Dict:
+    """
+    Get the primary ids and equivalent curies of a list of curies, with a single call to get_normalized_nodes().
+
+    Returns a dict in the same format as get_equivalent_curies(), with an entry for each curie.
+    """
+    curies = uniquify_list([
+        curie.__root__ if isinstance(curie, CURIE) else curie
+        for curie in curies
+    ])
+
+    # set default return in case curies are not found
+    default_return = {curie: None for curie in curies}
+    if not curies:
+        return default_return
+
+    try:
+        value = await get_normalized_nodes(app, curies, True, True)
+
+        # did we get a valid response
+        if value is None:
+            # no, so return the default
+            return default_return
+
+    except Exception as e:
+        exception_str = "".join(traceback.format_exc())
+        logger.error(f'Exception: {exception_str}')
+        return default_return
+
+    return value
+
+
+async def get_missing_equivalent_curies(
+        app: FastAPI,
+        curies: List[str],
+        equivalent_curies: Optional[Dict] = None
+) -> Dict:
+    """
+    Add any curies that are missing from the output of an earlier call to get_all_equivalent_curies() (if any),
+    looking them all up at once.
+    """
+    if equivalent_curies is None:
+        return await get_all_equivalent_curies(app, curies)
+
+    missing_curies = [curie for curie in curies if curie not in equivalent_curies]
+    if not missing_curies:
+        return equivalent_curies
+    return {**equivalent_curies, **(await get_all_equivalent_curies(app, missing_curies))}
+
+
 async def get_info_content(
         app: FastAPI,
         canonical_nonan: List) -> dict:
@@ -479,9 +771,32 @@ async def get_info_content(
     if not canonical_nonan:
         return {}
 
-    # call redis and get the value
-    info_contents = await app.state.info_content_db.mget(*canonical_nonan, encoding='utf8')
+    # Read through the clique record cache, if we have one.
+    clique_cache: Optional[CliqueRecordCache] = getattr(app.state, 'clique_cache', None)
+    if clique_cache is not None:
+        info_contents, uncached_ids = clique_cache.get_many(canonical_nonan, 'info_content')
+    else:
+        info_contents, uncached_ids = {}, canonical_nonan
+
+    if uncached_ids:
+        # call redis and get the value
+        raw_info_contents = await app.state.info_content_db.mget(*uncached_ids, encoding='utf8')
+        new_info_contents = decode_info_contents(uncached_ids, raw_info_contents)
+        info_contents.update(new_info_contents)
+
+        if clique_cache is not None:
+            clique_cache.put_many({
+                canonical_id: (new_info_contents[canonical_id], clique_cache.estimate_size(raw_info_content))
+                for canonical_id, raw_info_content in zip(uncached_ids, raw_info_contents)
+            }, 'info_content')
 
+    return {canonical_id: info_contents[canonical_id] for canonical_id in canonical_nonan}
+
+
+def decode_info_contents(canonical_nonan: List, info_contents: List) -> dict:
+    """
+    Turn the raw info_content_db values for canonical_nonan into a dict of rounded information content values.
+    """
     # get this into a list
     info_contents = [round(float(ic_ids), 1) if ic_ids is not None else None for ic_ids in info_contents]
 
@@ -497,38 +812,268 @@ async def get_eqids_and_types(
         canonical_nonan: List) -> Tuple[List, List]:
     if len(canonical_nonan) == 0:
         return [], []
-    batch_size = int(os.environ.get("EQ_BATCH_SIZE", 2500))
-    eqids = []
-    for i in range(0, len(canonical_nonan), batch_size):
-        eqids += await app.state.id_to_eqids_db.mget(*canonical_nonan[i:i + batch_size], encoding='utf-8')
+
+    # Read through the clique record cache, if we have one.
+    clique_cache: Optional[CliqueRecordCache] = getattr(app.state, 'clique_cache', None)
+    if clique_cache is not None:
+        records, uncached_ids = clique_cache.get_many(canonical_nonan, 'eqids')
+    else:
+        records, uncached_ids = {}, canonical_nonan
+
+    if uncached_ids:
+        # The eqids and types lookups are independent of each other, so we issue them together. (RedisConnection
+        # takes care of splitting large reads into chunks.)
+        eqids, types = await asyncio.gather(
+            app.state.id_to_eqids_db.mget(*uncached_ids, encoding='utf-8'),
+            app.state.id_to_type_db.mget(*uncached_ids, encoding='utf-8')
+        )
+        new_records = decode_clique_records(eqids, types)
+        records.update(zip(uncached_ids, new_records))
+
+        if clique_cache is not None:
+            # We don't cache incomplete records, in case they are filled in by a later load.
+            clique_cache.put_many({
+                canonical_id: (record, clique_cache.estimate_size(raw_eqids))
+                for canonical_id, record, raw_eqids, typ in zip(uncached_ids, new_records, eqids, types)
+                if raw_eqids is not None and typ
+            }, 'eqids')
+
+    return expand_clique_records(app, canonical_nonan, [records[canonical_id] for canonical_id in canonical_nonan])
+
+
+def decode_clique_records(eqids: List, types: List) -> List[Tuple[List, Optional[str]]]:
+    """
+    Turn raw id_to_eqids_db and id_to_type_db values into (equivalent identifiers, type) records, with each
+    equivalent identifier annotated with its type. These records may be cached, so they must not be modified.
+    """
     eqids = [json.loads(value) if value is not None else [None] for value in eqids]
-    types = await app.state.id_to_type_db.mget(*canonical_nonan, encoding='utf-8')
+    for eqids_for_clique, typ in zip(eqids, types):
+        # Every equivalent identifier here has the same type.
+        for eqid in eqids_for_clique:
+            eqid.update({'t': [typ]})
+
+    return list(zip(eqids, types))
+
+
+def expand_clique_records(app: FastAPI, canonical_nonan: List, records: List[Tuple[List, Optional[str]]]) \
+        -> Tuple[List, List]:
+    """
+    Turn the (equivalent identifiers, type) record of each canonical ID into lists of equivalent identifiers
+    and of types with their ancestors.
+    """
+    eqids = []
     types_with_ancestors = []
-    for index, typ in enumerate(types):
+    for canonical_id, (eqids_for_clique, typ) in zip(canonical_nonan, records):
+        eqids.append(eqids_for_clique)
         if not typ:
-            logging.error(f"No type information found for '{canonical_nonan[index]}' with eqids: {eqids[index]}, "
+            logging.error(f"No type information found for '{canonical_id}' with eqids: {eqids_for_clique}, "
                           f"replacing with {BIOLINK_NAMED_THING}")
-            types_with_ancestors.append([BIOLINK_NAMED_THING])
+            types_with_ancestors.append((BIOLINK_NAMED_THING,))
         else:
             types_with_ancestors.append(get_ancestors(app, typ))
 
-        # Every equivalent identifier here has the same type.
-        for eqid in eqids[index]:
-            eqid.update({'t': [typ]})
-
     return eqids, types_with_ancestors
 
 
+def decode_eqids_and_types(app: FastAPI, canonical_nonan: List, eqids: List, types: List) -> Tuple[List, List]:
+    """
+    Turn the raw id_to_eqids_db and id_to_type_db values for canonical_nonan into lists of equivalent
+    identifiers (each annotated with its type) and lists of types with their ancestors.
+    """
+    return expand_clique_records(app, canonical_nonan, decode_clique_records(eqids, types))
+
+
+async def get_clique_records(app: FastAPI, canonical_nonan: List, need_eqids: bool, need_types: bool) \
+        -> Tuple[List, List]:
+    """
+    Like get_eqids_and_types(), but only read what we need. If we don't need the equivalent identifiers, each clique
+    is represented by its canonical ID alone; if we don't need the types, each clique gets an empty tuple of types.
+    """
+    if need_eqids:
+        return await get_eqids_and_types(app, canonical_nonan)
+
+    eqids = [[{'i': canonical_id}] for canonical_id in canonical_nonan]
+    if not need_types or not canonical_nonan:
+        return eqids, [() for _ in canonical_nonan]
+
+    # Use the types of any cliques we've already cached.
+    clique_cache: Optional[CliqueRecordCache] = getattr(app.state, 'clique_cache', None)
+    if clique_cache is not None:
+        records, uncached_ids = clique_cache.get_many(canonical_nonan, 'eqids')
+        types_by_id = {canonical_id: record[1] for canonical_id, record in records.items()}
+    else:
+        types_by_id, uncached_ids = {}, canonical_nonan
+
+    if uncached_ids:
+        types_by_id.update(zip(uncached_ids, await app.state.id_to_type_db.mget(*uncached_ids, encoding='utf-8')))
+
+    _, types = expand_clique_records(app, canonical_nonan, [(None, types_by_id[canonical_id])
+                                                            for canonical_id in canonical_nonan])
+    return eqids, types
+
+
+async def async_value(value):
+    """ Return a value from a coroutine, so that it can be gathered along with other lookups. """
+    return value
+
+
+async def get_preferred_labels(app: FastAPI, preferred_label_keys: Dict[str, str]) -> Dict[str, str]:
+    """
+    Look up the preferred labels precomputed by the loader.
+
+    :param preferred_label_keys: A dict of the preferred_label_db key to look up for each canonical ID
+        (see get_preferred_label_key()).
+    :return: A dict of preferred labels ('' for cliques without a label) keyed by canonical ID. Canonical IDs
+        without a precomputed label are left out.
+    """
+    preferred_label_db = getattr(app.state, 'preferred_label_db', None)
+    if preferred_label_db is None or not preferred_label_keys:
+        return {}
+
+    label_keys = uniquify_list(preferred_label_keys.values())
+
+    # Read through the clique record cache, if we have one.
+    clique_cache: Optional[CliqueRecordCache] = getattr(app.state, 'clique_cache', None)
+    if clique_cache is not None:
+        labels, uncached_keys = clique_cache.get_many(label_keys, 'preferred_label')
+    else:
+        labels, uncached_keys = {}, label_keys
+
+    if uncached_keys:
+        new_labels = dict(zip(uncached_keys, await preferred_label_db.mget(*uncached_keys, encoding='utf-8')))
+        labels.update(new_labels)
+
+        if clique_cache is not None:
+            clique_cache.put_many({
+                key: (label, clique_cache.estimate_size(label)) for key, label in new_labels.items()
+            }, 'preferred_label')
+
+    return {
+        canonical_id: labels[key]
+        for canonical_id, key in preferred_label_keys.items()
+        if labels[key] is not None
+    }
+
+
+# The tables read by the normalization script, in the order in which their database numbers are passed to it.
+NORMALIZATION_SCRIPT_TABLES = ['eq_id_to_id_db', 'id_to_eqids_db', 'id_to_type_db', 'info_content_db']
+
+# The conflation tables that the normalization script can apply.
+NORMALIZATION_SCRIPT_CONFLATION_TABLES = ['gene_protein_db', 'chemical_drug_db']
+
+# The precomputed preferred labels are read by the script too, if they've been configured.
+NORMALIZATION_SCRIPT_OPTIONAL_TABLES = ['preferred_label_db']
+
+
+def get_normalization_script_tables(app: FastAPI) -> List[str]:
+    """
+    Get the names of the tables that the normalization script reads on this server.
+    """
+    return NORMALIZATION_SCRIPT_TABLES + NORMALIZATION_SCRIPT_CONFLATION_TABLES + [
+        table for table in NORMALIZATION_SCRIPT_OPTIONAL_TABLES if getattr(app.state, table, None) is not None
+    ]
+
+# The largest number of CURIEs that the normalization script is used for. A script blocks the whole Redis instance
+# while it runs, so larger requests are read with (chunked) MGETs instead.
+DEFAULT_NORMALIZATION_SCRIPT_MAX_CURIES = 50
+
+
+async def register_normalization_script(app: FastAPI) -> Optional[RedisScript]:
+    """
+    Register the server-side normalization script (resources/normalize_nodes.lua), which resolves CURIEs to
+    their canonical IDs, clique records and conflated partners in a single round-trip.
+
+    The script switches between databases, so it can only be used if every table it reads is on the same
+    non-clustered Redis instance. If that isn't the case, we log a warning and return None, and
+    get_normalized_nodes() will continue to use separate MGETs.
+    """
+    connections = [getattr(app.state, table) for table in get_normalization_script_tables(app)]
+
+    servers = set()
+    for connection in connections:
+        redis_instance = connection.redis_instance
+        if redis_instance.is_cluster:
+            logger.warning("Normalization script disabled: at least one table is on a Redis cluster.")
+            return None
+        host = redis_instance.hosts[0]
+        servers.add((host.host_name, str(host.port), redis_instance.password, redis_instance.ssl_enabled))
+
+    if len(servers) > 1:
+        logger.warning(f"Normalization script disabled: tables are spread over {len(servers)} Redis instances.")
+        return None
+
+    with open(Path(__file__).parent / "resources" / "normalize_nodes.lua", "r") as scriptf:
+        script = scriptf.read()
+
+    normalization_script = await RedisScript.register(connections[0], script)
+    logger.info(f"Registered normalization script {normalization_script.digest}.")
+    return normalization_script
+
+
+def get_normalization_script_databases(app: FastAPI) -> Dict[str, int]:
+    """
+    Get the database number of every table that the normalization script might read.
+    """
+    return {
+        table: getattr(app.state, table).redis_instance.db or 0
+        for table in get_normalization_script_tables(app)
+    }
+
+
+async def run_normalization_script(app: FastAPI, upper_curies: List[str], conflation_tables: List[str]) -> Tuple[List, Dict]:
+    """
+    Run the normalization script registered by register_normalization_script().
+
+    :param upper_curies: The upper-cased CURIEs to normalize.
+    :param conflation_tables: The names of the conflation tables to apply, in order.
+    :return: A list of canonical IDs (one per CURIE, or None) and the decoded reply of the script, with missing
+        values replaced by None.
+    """
+    databases = app.state.normalization_script_databases
+    args = [databases[table] for table in NORMALIZATION_SCRIPT_TABLES]
+    args.append(databases.get('preferred_label_db', ''))
+    for table in conflation_tables:
+        args.extend([table, databases[table]])
+    reply = await app.state.normalization_script(keys=upper_curies, args=args)
+    reply = json.loads(reply)
+
+    # Lua represents missing values as false, and empty tables as objects.
+    def none_if_false(value):
+        return None if value is False else value
+
+    canonical_ids = [none_if_false(canonical_id) for canonical_id in reply['canonical_ids'] or []]
+    for section in ['eqids', 'types', 'info_contents', 'preferred_labels']:
+        reply[section] = {identifier: none_if_false(value) for identifier, value in (reply[section] or {}).items()}
+    reply['conflations'] = list(reply['conflations'] or [])
+
+    return canonical_ids, reply
+
+
 async def get_normalized_nodes(
         app: FastAPI,
         curies: List[Union[CURIE, str]],
         conflate_gene_protein: bool,
         conflate_chemical_drug: bool,
         include_descriptions: bool = False,
-        include_individual_types: bool = True
+        include_individual_types: bool = True,
+        fields: Optional[Sequence[str]] = None,
+        max_equivalent_identifiers: Optional[int] = None,
+        include_prefixes: Optional[Sequence[str]] = None,
+        exclude_prefixes: Optional[Sequence[str]] = None,
+        require_type: Optional[str] = None
 ) -> Dict[str, Optional[str]]:
     """
     Get value(s) for key(s) using redis MGET
+
+    :param fields: The parts of each node to return (see NODE_FIELDS), or None to return all of them. Descriptions
+        are only included if 'description' is one of the fields.
+    :param max_equivalent_identifiers: If set, return at most this many equivalent identifiers for each node,
+        along with the total number in `equivalent_identifiers_count`. The rest can be retrieved with
+        get_equivalent_identifiers_page().
+    :param include_prefixes: If set, only return the equivalent identifiers with one of these prefixes.
+    :param exclude_prefixes: If set, don't return the equivalent identifiers with any of these prefixes.
+    :param require_type: If set, CURIEs that don't normalize to a clique of this Biolink type (or one of its
+        descendants) are returned as None.
     """
 
     # Time how long this query takes.
@@ -539,44 +1084,322 @@ async def get_normalized_nodes(
         curie.__root__ if isinstance(curie, CURIE) else curie
         for curie in curies
     ]
-    normal_nodes = {}
 
+    # Input CURIEs are often repeated (or differ only in case), so we only look up each upper-cased CURIE once.
+    upper_curies = [c.upper() for c in curies]
+    unique_upper_curies = uniquify_list(upper_curies)
+
+    if fields is not None:
+        fields = frozenset(fields)
+        include_descriptions = 'description' in fields
+    if include_prefixes is not None:
+        include_prefixes = frozenset(include_prefixes)
+    if exclude_prefixes is not None:
+        exclude_prefixes = frozenset(exclude_prefixes)
+
+    # Check the cache for nodes that we've already normalized with these options. Only the ones that
+    # aren't there need to be looked up in Redis.
+    await check_cache_versions(app)
+    cache: Optional[NormalizationCache] = getattr(app.state, 'normalization_cache', None)
+    options = (conflate_gene_protein, conflate_chemical_drug, include_descriptions, include_individual_types, fields,
+               max_equivalent_identifiers, include_prefixes, exclude_prefixes, require_type)
+    if cache is not None:
+        nodes_by_upper_curie, uncached_upper_curies = cache.get_many(unique_upper_curies, options)
+    else:
+        nodes_by_upper_curie, uncached_upper_curies = {}, unique_upper_curies
+
+    if uncached_upper_curies:
+        new_nodes = await normalize_upper_curies(app, uncached_upper_curies, conflate_gene_protein,
+                                                 conflate_chemical_drug, include_descriptions,
+                                                 include_individual_types, fields, max_equivalent_identifiers,
+                                                 include_prefixes, exclude_prefixes, require_type)
+        if cache is not None:
+            cache.put_many(new_nodes, options)
+        nodes_by_upper_curie.update(new_nodes)
+
+    # output the final result
+    normal_nodes = {
+        input_curie: nodes_by_upper_curie[upper_curie]
+        for input_curie, upper_curie in zip(curies, upper_curies)
+    }
+
+    end_time = time.time_ns()
+    logger.info(f"Normalized {len(curies)} nodes in {(end_time - start_time)/1_000_000:.2f} ms with arguments " +
+                f"(curies={curies}, conflate_gene_protein={conflate_gene_protein}, conflate_chemical_drug={conflate_chemical_drug}, " +
+                f"include_descriptions={include_descriptions}, include_individual_types={include_individual_types}, " +
+                f"fields={sorted(fields) if fields is not None else None}, " +
+                f"max_equivalent_identifiers={max_equivalent_identifiers}, " +
+                f"include_prefixes={sorted(include_prefixes) if include_prefixes is not None else None}, " +
+                f"exclude_prefixes={sorted(exclude_prefixes) if exclude_prefixes is not None else None}, " +
+                f"require_type={require_type})")
+
+    return normal_nodes
+
+
+async def get_equivalent_identifiers_page(
+        app: FastAPI,
+        curie: str,
+        conflate_gene_protein: bool,
+        conflate_chemical_drug: bool,
+        include_descriptions: bool = False,
+        include_individual_types: bool = True,
+        offset: int = 0,
+        limit: int = 1000,
+        include_prefixes: Optional[Sequence[str]] = None,
+        exclude_prefixes: Optional[Sequence[str]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Get one page of the equivalent identifiers of the clique that a CURIE normalizes to, so that clients can
+    retrieve the identifiers left out by the `max_equivalent_identifiers` option of get_normalized_nodes().
+
+    The whole clique is normalized (and cached) as usual, so fetching later pages doesn't need to look it up again.
+
+    :return: A dict with the preferred identifier, the total number of equivalent identifiers and the requested
+        page of them, or None if the CURIE couldn't be normalized.
+    """
+    fields = ['id', 'equivalent_identifiers'] + (['description'] if include_descriptions else [])
+    nodes = await get_normalized_nodes(app, [curie], conflate_gene_protein, conflate_chemical_drug,
+                                       include_individual_types=include_individual_types, fields=fields,
+                                       include_prefixes=include_prefixes, exclude_prefixes=exclude_prefixes)
+    node = nodes[curie]
+    if node is None:
+        return None
+
+    equivalent_identifiers = node['equivalent_identifiers']
+    return {
+        'identifier': node['id']['identifier'],
+        'equivalent_identifiers_count': len(equivalent_identifiers),
+        'offset': offset,
+        'limit': limit,
+        'equivalent_identifiers': equivalent_identifiers[offset:offset + limit],
+    }
+
+
+async def get_canonical_ids(
+        app: FastAPI,
+        curies: List[Union[CURIE, str]],
+        conflate_gene_protein: bool,
+        conflate_chemical_drug: bool,
+        include_type: bool = False
+) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Get the preferred identifier (and optionally the most specific Biolink type) for each CURIE, without
+    building the full normalized node.
+
+    This only needs a single eq_id_to_id_db MGET, followed by one MGET per conflation requested and
+    an id_to_type_db MGET if include_type is set. Unlike get_normalized_nodes(), we don't read the clique records,
+    so we don't check whether the clique has any equivalent identifiers.
+
+    :return: A dict with the preferred identifier of each input CURIE, in the format {"identifier": ..., "type": ...},
+        or None for CURIEs that couldn't be normalized.
+    """
+    # Time how long this query takes.
+    start_time = time.time_ns()
+
+    curies = [
+        curie.__root__ if isinstance(curie, CURIE) else curie
+        for curie in curies
+    ]
+    upper_curies = [c.upper() for c in curies]
+    unique_upper_curies = uniquify_list(upper_curies)
+
+    unique_canonical_ids = await app.state.eq_id_to_id_db.mget(*unique_upper_curies, encoding='utf-8')
+    canonical_nonan = uniquify_list([canonical_id for canonical_id in unique_canonical_ids if canonical_id is not None])
+
+    conflation_tables = []
+    if conflate_gene_protein:
+        conflation_tables.append('gene_protein_db')
+    if conflate_chemical_drug:
+        conflation_tables.append('chemical_drug_db')
+
+    # A conflated clique is identified by the first clique in the first conflation (in the order above) that
+    # includes this clique.
+    preferred_ids = {canonical_id: canonical_id for canonical_id in canonical_nonan}
+    if canonical_nonan and conflation_tables:
+        conflation_results = await asyncio.gather(
+            *[getattr(app.state, table).mget(*canonical_nonan, encoding='utf8') for table in conflation_tables]
+        )
+        for conflation_result in reversed(conflation_results):
+            for canonical_id, conflated_ids in zip(canonical_nonan, conflation_result):
+                conflated_ids = json.loads(conflated_ids) if conflated_ids else []
+                if conflated_ids:
+                    preferred_ids[canonical_id] = conflated_ids[0]
+
+    preferred_types = {}
+    if include_type:
+        unique_preferred_ids = uniquify_list(preferred_ids.values())
+        if unique_preferred_ids:
+            types = await app.state.id_to_type_db.mget(*unique_preferred_ids, encoding='utf-8')
+            preferred_types = {
+                preferred_id: typ if typ else BIOLINK_NAMED_THING
+                for preferred_id, typ in zip(unique_preferred_ids, types)
+            }
+
+    results_by_upper_curie = {}
+    for upper_curie, canonical_id in zip(unique_upper_curies, unique_canonical_ids):
+        if canonical_id is None:
+            results_by_upper_curie[upper_curie] = None
+            continue
+        result = {"identifier": preferred_ids[canonical_id]}
+        if include_type:
+            result["type"] = preferred_types[preferred_ids[canonical_id]]
+        results_by_upper_curie[upper_curie] = result
+
+    end_time = time.time_ns()
+    logger.info(f"Found canonical IDs for {len(curies)} CURIEs in {(end_time - start_time)/1_000_000:.2f} ms with " +
+                f"arguments (conflate_gene_protein={conflate_gene_protein}, " +
+                f"conflate_chemical_drug={conflate_chemical_drug}, include_type={include_type})")
+
+    return {
+        input_curie: results_by_upper_curie[upper_curie]
+        for input_curie, upper_curie in zip(curies, upper_curies)
+    }
+
+
+async def check_cache_versions(app: FastAPI):
+    """
+    Every NORMALIZATION_CACHE_VERSION_CHECK seconds, check which version of Babel is loaded into Redis
+    (as recorded by the loader), and clear our caches if it has changed.
+    """
+    caches: List[BoundedCache] = [
+        cache for cache in [getattr(app.state, 'normalization_cache', None), getattr(app.state, 'clique_cache', None)]
+        if cache is not None
+    ]
+    check_interval = float(os.environ.get("NORMALIZATION_CACHE_VERSION_CHECK", 60))
+    if all(cache.version_checked_at is not None and cache.clock() - cache.version_checked_at < check_interval
+           for cache in caches):
+        return
+
+    try:
+        version = await app.state.curie_to_bl_type_db.get(BABEL_VERSION_KEY, encoding='utf-8')
+    except Exception as e:
+        # If we can't tell which version is loaded, we can't trust the caches.
+        logger.warning(f"Could not check the loaded Babel version, clearing caches: {e}")
+        version = None
+        for cache in caches:
+            cache.clear()
+    for cache in caches:
+        cache.set_version(version)
+
+
+async def normalize_upper_curies(
+        app: FastAPI,
+        unique_upper_curies: List[str],
+        conflate_gene_protein: bool,
+        conflate_chemical_drug: bool,
+        include_descriptions: bool,
+        include_individual_types: bool,
+        fields: Optional[FrozenSet[str]] = None,
+        max_equivalent_identifiers: Optional[int] = None,
+        include_prefixes: Optional[FrozenSet[str]] = None,
+        exclude_prefixes: Optional[FrozenSet[str]] = None,
+        require_type: Optional[str] = None
+) -> Dict[str, Optional[Dict]]:
+    """
+    Look up a list of unique upper-cased CURIEs in Redis and create a node for each of them.
+
+    :param fields: The parts of each node to build (see NODE_FIELDS), or None for all of them. We only read the
+        tables needed to build these parts.
+    :return: A dict of nodes (or None for CURIEs that couldn't be normalized), keyed by upper-cased CURIE.
+    """
+    wanted_fields = NODE_FIELDS if fields is None else fields
+    need_info_contents = 'information_content' in wanted_fields
+    need_labels = 'label' in wanted_fields
+    # Labels depend on the types of each clique as well as its identifiers.
+    need_types = 'type' in wanted_fields or need_labels or require_type is not None
+    # We can skip reading and decoding the (potentially very large) lists of equivalent identifiers if we don't
+    # need to return them or their descriptions, and can read the preferred labels that the loader precomputed.
+    need_eqids = ('equivalent_identifiers' in wanted_fields or include_descriptions or
+                  (need_labels and getattr(app.state, 'preferred_label_db', None) is None))
     # TODO: Add an option that lets one choose which conflations to do, and get the details of those conflations from the configs.
     # conflation_types = {"biolink:Gene", "biolink:Protein"}
     # conflation_redis = 5
 
-    upper_curies = [c.upper() for c in curies]
-    canonical_ids = await app.state.eq_id_to_id_db.mget(*upper_curies, encoding='utf-8')
-    canonical_nonan = [canonical_id for canonical_id in canonical_ids if canonical_id is not None]
+    conflation_tables = []
+    if conflate_gene_protein:
+        conflation_tables.append('gene_protein_db')
+    if conflate_chemical_drug:
+        conflation_tables.append('chemical_drug_db')
+
+    # If the normalization script has been registered, we get everything we need for a small request from Redis in
+    # a single round-trip. Otherwise, we read each table with its own MGET. The script always reads the clique
+    # records and information content of every clique, so we don't use it if we can skip some of those.
+    script_reply = None
+    use_script = (
+        getattr(app.state, 'normalization_script', None) is not None and
+        len(unique_upper_curies) <= getattr(app.state, 'normalization_script_max_curies',
+                                            DEFAULT_NORMALIZATION_SCRIPT_MAX_CURIES) and
+        need_eqids and need_types and need_info_contents
+    )
+    if use_script:
+        unique_canonical_ids, script_reply = await run_normalization_script(app, unique_upper_curies, conflation_tables)
+    else:
+        unique_canonical_ids = await app.state.eq_id_to_id_db.mget(*unique_upper_curies, encoding='utf-8')
+
+    # Many CURIEs can map to the same clique, so everything after this point is done once per canonical ID.
+    canonical_nonan = uniquify_list([canonical_id for canonical_id in unique_canonical_ids if canonical_id is not None])
     info_contents = {}
+    # Any labels that weren't precomputed are chosen in create_node().
+    preferred_labels = {}
 
     # did we get some canonical ids
     if canonical_nonan:
-        # get the information content values
-        info_contents = await get_info_content(app, canonical_nonan)
+        if script_reply is not None:
+            info_contents = decode_info_contents(
+                canonical_nonan, [script_reply['info_contents'].get(c) for c in canonical_nonan])
+            eqids, types = decode_eqids_and_types(
+                app,
+                canonical_nonan,
+                [script_reply['eqids'].get(c) for c in canonical_nonan],
+                [script_reply['types'].get(c) for c in canonical_nonan]
+            )
+            conflation_results = [
+                [conflation.get(c) for c in canonical_nonan] for conflation in script_reply['conflations']
+            ]
+            # The script has already chosen the label key for each clique from the conflations that apply to it.
+            preferred_labels = {canonical_id: label for canonical_id, label in script_reply['preferred_labels'].items()
+                                if label is not None}
+        else:
+            # Every other lookup only depends on the canonical IDs, so we issue them all at once instead of
+            # waiting for each one in turn: the information content values, the equivalent_ids and types, and
+            # the conflation tables for every conflation we've been asked to apply.
+            # If we aren't conflating, we can look up the precomputed preferred labels at the same time.
+            info_contents, (eqids, types), preferred_labels, *conflation_results = await asyncio.gather(
+                get_info_content(app, canonical_nonan) if need_info_contents else async_value({}),
+                get_clique_records(app, canonical_nonan, need_eqids, need_types),
+                get_preferred_labels(app, {} if conflation_tables or not need_labels else {
+                    canonical_id: get_preferred_label_key(canonical_id) for canonical_id in canonical_nonan
+                }),
+                *[getattr(app.state, table).mget(*canonical_nonan, encoding='utf8') for table in conflation_tables]
+            )
 
-        # Get the equivalent_ids and types
-        eqids, types = await get_eqids_and_types(app, canonical_nonan)
+            # If any of the labels weren't precomputed, we need the equivalent identifiers after all.
+            if need_labels and not need_eqids and not conflation_tables and len(preferred_labels) < len(canonical_nonan):
+                need_eqids = True
+                eqids, types = await get_eqids_and_types(app, canonical_nonan)
 
         # are we looking for conflated values
         if conflate_gene_protein or conflate_chemical_drug:
-            other_ids = []
-
-            if conflate_gene_protein:
-                other_ids.extend(await app.state.gene_protein_db.mget(*canonical_nonan, encoding='utf8'))
-
-            # logger.error(f"After conflate_gene_protein: {other_ids}")
-
-            if conflate_chemical_drug:
-                other_ids.extend(await app.state.chemical_drug_db.mget(*canonical_nonan, encoding='utf8'))
-
-            # logger.error(f"After conflate_chemical_drug: {other_ids}")
+            # The conflation results are concatenated in the same order as before: gene/protein first,
+            # then chemical/drug.
+            other_ids = list(itertools.chain.from_iterable(conflation_results))
 
             # if there are other ids, then we want to rebuild eqids and types.  That's because even though we have them,
             # they're not necessarily first.  For instance if what came in and got canonicalized was a protein id
             # and we want gene first, then we're relying on the order of the other_ids to put it back in the right place.
             other_ids = [json.loads(oids) if oids else [] for oids in other_ids]
 
+            # The loader precomputes the preferred label of each conflated clique for each conflation, so we can
+            # use those for cliques that are only conflated by one of the conflations we've been asked to apply
+            # (or use the clique's own label if it isn't conflated at all).
+            preferred_label_keys = {}
+            for index, canonical_id in enumerate(canonical_nonan):
+                conflated_by = [table for table_index, table in enumerate(conflation_tables)
+                                if other_ids[table_index * len(canonical_nonan) + index]]
+                if len(conflated_by) <= 1:
+                    preferred_label_keys[canonical_id] = get_preferred_label_key(
+                        canonical_id, conflated_by[0] if conflated_by else None)
+
             # Until we added conflate_chemical_drug, canonical_nonan and other_ids would always have the same
             # length, so we could figure out mappings from one to the other just by doing:
             #   dereference_others = dict(zip(canonical_nonan, other_ids))
@@ -591,8 +1414,31 @@ async def get_normalized_nodes(
             for canon, oids in zip(itertools.cycle(canonical_nonan), other_ids):
                 dereference_others[canon].extend(oids)
 
-            all_other_ids = sum(other_ids, [])
-            eqids2, types2 = await get_eqids_and_types(app, all_other_ids)
+            # The same partner can be listed by both conflations, and many cliques share partners, so we
+            # deduplicate the partners of each clique as well as the partners we look up.
+            for canon in dereference_others:
+                dereference_others[canon] = uniquify_list(dereference_others[canon])
+            all_other_ids = uniquify_list(itertools.chain.from_iterable(other_ids))
+            if script_reply is not None:
+                eqids2, types2 = decode_eqids_and_types(
+                    app,
+                    all_other_ids,
+                    [script_reply['eqids'].get(o) for o in all_other_ids],
+                    [script_reply['types'].get(o) for o in all_other_ids]
+                )
+            else:
+                (eqids2, types2), preferred_labels = await asyncio.gather(
+                    get_clique_records(app, all_other_ids, need_eqids, need_types),
+                    get_preferred_labels(app, preferred_label_keys if need_labels else {})
+                )
+
+                # If any of the labels weren't precomputed, we need the equivalent identifiers after all.
+                if need_labels and not need_eqids and len(preferred_labels) < len(canonical_nonan):
+                    need_eqids = True
+                    (eqids, types), (eqids2, types2) = await asyncio.gather(
+                        get_eqids_and_types(app, canonical_nonan),
+                        get_eqids_and_types(app, all_other_ids)
+                    )
 
             # logger.error(f"other_ids = {other_ids}")
             # logger.error(f"dereference_others = {dereference_others}")
@@ -622,31 +1468,44 @@ async def get_normalized_nodes(
 
             dereference_ids = dict(zip(canonical_nonan, final_eqids))
             dereference_types = dict(zip(canonical_nonan, final_types))
+
+            # create_node() needs the identifiers of each of the cliques that make up a conflated clique (in
+            # order to choose a label). We've already fetched all of these, so we index them by their clique
+            # leader (which is the first identifier in the clique) so that create_node() can share them.
+            subclique_eqids = dict(zip(canonical_nonan, eqids))
+            subclique_eqids.update(deref_others_eqs)
         else:
             dereference_ids = dict(zip(canonical_nonan, eqids))
             dereference_types = dict(zip(canonical_nonan, types))
+            subclique_eqids = dict()
     else:
         dereference_ids = dict()
         dereference_types = dict()
-
-    # output the final result
-    normal_nodes = {
-        input_curie: await create_node(app, canonical_id, dereference_ids, dereference_types, info_contents,
-                                       include_descriptions=include_descriptions,
-                                       include_individual_types=include_individual_types,
-                                       conflations={
-                                           'GeneProtein': conflate_gene_protein,
-                                           'DrugChemical': conflate_chemical_drug,
-                                       })
-        for input_curie, canonical_id in zip(curies, canonical_ids)
+        subclique_eqids = dict()
+
+    # Create one node per clique; every input CURIE that maps to that clique shares it.
+    nodes = {
+        canonical_id: await create_node(app, canonical_id, dereference_ids, dereference_types, info_contents,
+                                        include_descriptions=include_descriptions,
+                                        include_individual_types=include_individual_types,
+                                        conflations={
+                                            'GeneProtein': conflate_gene_protein,
+                                            'DrugChemical': conflate_chemical_drug,
+                                        },
+                                        subclique_eqids=subclique_eqids,
+                                        preferred_labels=preferred_labels,
+                                        fields=fields,
+                                        max_equivalent_identifiers=max_equivalent_identifiers,
+                                        include_prefixes=include_prefixes,
+                                        exclude_prefixes=exclude_prefixes,
+                                        require_type=require_type)
+        for canonical_id in canonical_nonan
     }
 
-    end_time = time.time_ns()
-    logger.info(f"Normalized {len(curies)} nodes in {(end_time - start_time)/1_000_000:.2f} ms with arguments " +
-                f"(curies={curies}, conflate_gene_protein={conflate_gene_protein}, conflate_chemical_drug={conflate_chemical_drug}, " +
-                f"include_descriptions={include_descriptions}, include_individual_types={include_individual_types})")
-
-    return normal_nodes
+    return {
+        upper_curie: nodes.get(canonical_id)
+        for upper_curie, canonical_id in zip(unique_upper_curies, unique_canonical_ids)
+    }
 
 
 async def get_info_content_attribute(app, canonical_nonan) -> dict:
@@ -663,8 +1522,7 @@ async def get_info_content_attribute(app, canonical_nonan) -> dict:
     # did we get a good value
     if ic_val is not None:
         # load up a dict with the attribute data and create a trapi attribute object
-        new_attrib = dict(attribute_type_id="biolink:has_numeric_value", original_attribute_name="information_content", value_type_id="EDAM:data_0006",
-                          value=round(float(ic_val), 1))
+        new_attrib = info_content_attribute(round(float(ic_val), 1))
     else:
         # else return nothing
         new_attrib = None
@@ -673,9 +1531,46 @@ async def get_info_content_attribute(app, canonical_nonan) -> dict:
     return new_attrib
 
 
+async def get_info_content_attributes(app, canonical_nonan: List[str]) -> Dict[str, Optional[dict]]:
+    """
+    Gets the information content attributes of a list of ids, with a single MGET (through the clique record cache).
+
+    :return: A dict of each id to its attribute, as returned by get_info_content_attribute().
+    """
+    info_contents = await get_info_content(app, uniquify_list(canonical_nonan))
+    return {
+        canonical_id: info_content_attribute(ic_val) if ic_val is not None else None
+        for canonical_id, ic_val in info_contents.items()
+    }
+
+
+def info_content_attribute(ic_val: float) -> dict:
+    """
+    Create a TRAPI attribute dict for a (rounded) information content value.
+    """
+    return dict(attribute_type_id="biolink:has_numeric_value", original_attribute_name="information_content",
+                value_type_id="EDAM:data_0006", value=ic_val)
+
+
 async def create_node(app, canonical_id, equivalent_ids, types, info_contents, include_descriptions=True,
-                      include_individual_types=False, conflations=None):
-    """Construct the output format given the compressed redis data"""
+                      include_individual_types=False, conflations=None, subclique_eqids=None, preferred_labels=None,
+                      fields=None, max_equivalent_identifiers=None, include_prefixes=None, exclude_prefixes=None,
+                      require_type=None):
+    """
+    Construct the output format given the compressed redis data
+
+    :param subclique_eqids: When conflating, a dict of the equivalent identifiers of each clique that makes up
+        the conflated clique, keyed by the first identifier of that clique. These are fetched in bulk by
+        get_normalized_nodes() and shared between all the nodes it creates.
+    :param preferred_labels: A dict of the preferred labels precomputed by the loader, keyed by canonical ID
+        ('' if the clique has no label). Labels are computed for any canonical ID that isn't included.
+    :param fields: The parts of the node to build (see NODE_FIELDS), or None for all of them.
+    :param max_equivalent_identifiers: If set, only build the first max_equivalent_identifiers equivalent
+        identifiers, and record how many there are in `equivalent_identifiers_count`.
+    :param include_prefixes: If set, only include the equivalent identifiers with one of these prefixes.
+    :param exclude_prefixes: If set, leave out the equivalent identifiers with any of these prefixes.
+    :param require_type: If set, return None unless this Biolink type is one of the types of the clique.
+    """
     # It's possible that we didn't find a canonical_id
     if canonical_id is None:
         return None
@@ -684,6 +1579,10 @@ async def create_node(app, canonical_id, equivalent_ids, types, info_contents, i
     if conflations is None:
         conflations = {}
 
+    # If no subcliques were provided, assume we don't know any.
+    if subclique_eqids is None:
+        subclique_eqids = {}
+
     # If we have 'None' in the equivalent IDs, skip it so we don't confuse things further down the line.
     if None in equivalent_ids[canonical_id]:
         logging.warning(f"Skipping None in canonical ID {canonical_id} among eqids: {equivalent_ids}")
@@ -698,98 +1597,37 @@ async def create_node(app, canonical_id, equivalent_ids, types, info_contents, i
         logging.error(f"No types found for canonical ID {canonical_id} among types: {types}")
         return None
 
+    # Skip cliques that the caller will throw away before doing any more work on them.
+    if require_type is not None and require_type not in types[canonical_id]:
+        return None
+
     # OK, now we should have id's in the format [ {"i": "MONDO:12312", "l": "Scrofula"}, {},...]
     eids = equivalent_ids[canonical_id]
 
-    # As per https://github.com/TranslatorSRI/Babel/issues/158, we select the first label from any
-    # identifier _except_ where one of the types is in preferred_name_boost_prefixes, in which case
-    # we prefer the prefixes listed there.
-    #
-    # This should perfectly replicate NameRes labels for non-conflated cliques, but it WON'T perfectly
-    # match conflated cliques. To do that, we need to run the preferred label algorithm on ONLY the labels
-    # for the FIRST clique of the conflated cliques with labels.
-    any_conflation = any(conflations.values())
-    if not any_conflation:
-        # No conflation. We just use the identifiers we've been given.
-        identifiers_with_labels = eids
-    else:
-        # We have a conflation going on! To replicate Babel's behavior, we need to run the algorithem
-        # on the list of labels corresponding to the first
-        # So we need to run the algorithm on the first set of identifiers that have any
-        # label whatsoever.
-        identifiers_with_labels = []
-        curies_already_checked = set()
-        for identifier in eids:
-            curie = identifier.get('i', '')
-            if curie in curies_already_checked:
-                continue
-            results, _ = await get_eqids_and_types(app, [curie])
-
-            identifiers_with_labels = results[0]
-            labels = map(lambda ident: ident.get('l', ''), identifiers_with_labels)
-            if any(map(lambda l: l != '', labels)):
-                break
-
-            # Since we didn't get any matches here, add it to the list of CURIEs already checked so
-            # we don't make redundant queries to the database.
-            curies_already_checked.update(set(map(lambda x: x.get('i', ''), identifiers_with_labels)))
-
-        # We might get here without any labels, which is fine. At least we tried.
-
-    # At this point:
-    #   - eids will be the full list of all identifiers and labels in this clique.
-    #   - identifiers_with_labels is the list of identifiers and labels for the first subclique that has at least
-    #     one label.
-
-    # Note that types[canonical_id] goes from most specific to least specific, so we
-    # need to reverse it in order to apply preferred_name_boost_prefixes for the most
-    # specific type.
-    possible_labels = []
-    for typ in types[canonical_id][::-1]:
-        if typ in config['preferred_name_boost_prefixes']:
-            # This is the most specific matching type, so we use this and then break.
-            possible_labels = list(map(lambda ident: ident.get('l', ''),
-                                  sort_identifiers_with_boosted_prefixes(
-                                      identifiers_with_labels,
-                                      config['preferred_name_boost_prefixes'][typ]
-                                  )))
-
-            # Add in all the other labels -- we'd still like to consider them, but at a lower priority.
-            for eid in identifiers_with_labels:
-                label = eid.get('l', '')
-                if label not in possible_labels:
-                    possible_labels.append(label)
-
-            # Since this is the most specific matching type, we shouldn't do other (presumably higher-level)
-            # categories: so let's break here.
-            break
-
-    # Step 1.2. If we didn't have a preferred_name_boost_prefixes, just use the identifiers in their
-    # Biolink prefix order.
-    if not possible_labels:
-        possible_labels = map(lambda eid: eid.get('l', ''), identifiers_with_labels)
-
-    # Step 2. Filter out any suspicious labels.
-    filtered_possible_labels = [l for l in possible_labels if
-        l and                               # Ignore blank or empty names.
-        not l.startswith('CHEMBL')          # Some CHEMBL names are just the identifier again.
-        ]
-
-    # Step 3. Filter out labels longer than config['demote_labels_longer_than'], but only if there is at
-    # least one label shorter than this limit.
-    labels_shorter_than_limit = [l for l in filtered_possible_labels if l and len(l) <= config['demote_labels_longer_than']]
-    if labels_shorter_than_limit:
-        filtered_possible_labels = labels_shorter_than_limit
+    wanted_fields = NODE_FIELDS if fields is None else fields
+
+    # The loader usually precomputes the preferred label of each clique and conflated clique, but if it hasn't
+    # (or we're conflating in a way it couldn't precompute), we choose one here.
+    preferred_label = preferred_labels.get(canonical_id) if preferred_labels else None
+    if 'label' not in wanted_fields:
+        preferred_label = ''
+    elif preferred_label is None:
+        any_conflation = any(conflations.values())
+        if not any_conflation:
+            # No conflation. We just use the identifiers we've been given.
+            identifiers_with_labels = eids
+        else:
+            identifiers_with_labels = get_first_labeled_subclique(eids, subclique_eqids)
+        preferred_label = choose_preferred_label(types[canonical_id], identifiers_with_labels)
 
     # Note that the id will be from the equivalent ids, not the canonical_id.  This is to handle conflation
-    if len(filtered_possible_labels) > 0:
-        node = {"id": {"identifier": eids[0]['i'], "label": filtered_possible_labels[0]}}
+    if preferred_label:
+        node = {"id": {"identifier": eids[0]['i'], "label": preferred_label}}
     else:
         # Sometimes, nothing has a label :(
         node = {"id": {"identifier": eids[0]['i']}}
-
-    # Now that we've determined a label for this clique, we should never use identifiers_with_labels, possible_labels,
-    # or filtered_possible_labels after this point.
+    if 'id' not in wanted_fields:
+        del node["id"]["identifier"]
 
     # if descriptions are enabled look for the first available description and use that 
     if include_descriptions:
@@ -802,29 +1640,45 @@ async def create_node(app, canonical_id, equivalent_ids, types, info_contents, i
         if len(descriptions) > 0:
             node["id"]["description"] = descriptions[0]
 
+    # The label and description are returned as part of the id, so we only leave out the id if none of them
+    # were requested.
+    if not node["id"]:
+        del node["id"]
+
     # now need to reformat the identifier keys.  It could be cleaner but we have to worry about if there is a label
-    node["equivalent_identifiers"] = []
-    for eqid in eids:
-        eq_item = {"identifier": eqid["i"]}
-        if "l" in eqid:
-            eq_item["label"] = eqid["l"]
-        # if descriptions is enabled and exist add them to each eq_id entry
-        if include_descriptions and "d" in eqid and len(eqid["d"]):
-            eq_item["description"] = eqid["d"][0]
-        # if individual types have been requested, add them too.
-        if include_individual_types and 't' in eqid:
-            eq_item["type"] = eqid['t'][-1]
-        node["equivalent_identifiers"].append(eq_item)
+    if 'equivalent_identifiers' in wanted_fields:
+        node["equivalent_identifiers"] = []
+        # Filter identifiers by prefix before building them, so that the count and the limit apply to the
+        # identifiers we return.
+        returned_eids = eids
+        if include_prefixes is not None or exclude_prefixes is not None:
+            returned_eids = [
+                eqid for eqid in eids
+                if (include_prefixes is None or eqid['i'].split(':', 1)[0] in include_prefixes)
+                and (exclude_prefixes is None or eqid['i'].split(':', 1)[0] not in exclude_prefixes)
+            ]
+        # Some cliques have thousands of identifiers, so we don't build more of them than we were asked for.
+        for eqid in returned_eids[:max_equivalent_identifiers]:
+            eq_item = {"identifier": eqid["i"]}
+            if "l" in eqid:
+                eq_item["label"] = eqid["l"]
+            # if descriptions is enabled and exist add them to each eq_id entry
+            if include_descriptions and "d" in eqid and len(eqid["d"]):
+                eq_item["description"] = eqid["d"][0]
+            # if individual types have been requested, add them too.
+            if include_individual_types and 't' in eqid:
+                eq_item["type"] = eqid['t'][-1]
+            node["equivalent_identifiers"].append(eq_item)
+        if max_equivalent_identifiers is not None:
+            node["equivalent_identifiers_count"] = len(returned_eids)
 
     # We need to remove `biolink:Entity` from the types returned.
     # (See explanation at https://github.com/TranslatorSRI/NodeNormalization/issues/173)
-    if 'biolink:Entity' in types[canonical_id]:
-        types[canonical_id].remove('biolink:Entity')
-
-    node['type'] = types[canonical_id]
+    if 'type' in wanted_fields:
+        node['type'] = [typ for typ in types[canonical_id] if typ != 'biolink:Entity']
 
     # add the info content to the node if we got one
-    if info_contents[canonical_id] is not None:
+    if info_contents.get(canonical_id) is not None:
         node['information_content'] = info_contents[canonical_id]
 
     return node
@@ -908,50 +1762,13 @@ def _merge_node_attributes(node_a: Dict, node_b, merged_count: int) -> Dict:
     return node_a
 
 
-def _hash_attributes(attributes: List[Attribute] = None) -> Union[int, bool]:
+def _hash_attributes(attributes: List[Attribute] = None) -> bytes:
     """
-    Attempt to make an attribute list hashable by converting it to a
-    tuple of tuples
-
-    Using the python builtin hash https://docs.python.org/3.5/library/functions.html#hash
-    Which can technically return zero, so downstream code should explicitly check
-    for a False value instead of falsy values
+    Hash a list of pydantic Attributes with attributes_hash(), which treats the list as a set and can hash any
+    attribute value (however deeply it's nested).
 
-    The tricky thing here is that attribute.value is an Any type, so we do some type
-    checking to see if it's hashable
+    Every list of attributes can be hashed, and no attributes (None) have the same hash as each other.
     """
-    new_attributes = []
-
-    try:
-        if not attributes:
-            return hash(attributes)
-
-        for attribute in attributes:
-            hashed_value = attribute.value
-            if attribute.value:
-                if isinstance(attribute.value, list):
-                    # TODO list of lists?
-                    hashed_value = tuple(attribute.value)
-                elif isinstance(attribute.value, dict):
-                    hashed_value = tuple(
-                        (k, tuple(v))
-                        if isinstance(v, list)
-                        else (k, v)
-                        for k, v in attribute.value.items())
-
-            new_attribute = (
-                attribute.attribute_type_id,
-                hashed_value,
-                attribute.original_attribute_name,
-                attribute.value_url,
-                attribute.attribute_source,
-                attribute.value_type_id if attribute.value_type_id is not None else '',
-                attribute.attribute_source
-            )
-            new_attributes.append(new_attribute)
-
-        return hash(frozenset(new_attributes))
-    except Exception as e:
-        exception_str = "".join(traceback.format_exc())
-        logger.error(f'Exception: {exception_str}')
-        return False
+    if attributes is None:
+        return attributes_hash(None)
+    return attributes_hash([attribute.dict() for attribute in attributes])
@@ -1,3 +1,7 @@
+import asyncio
+import itertools
+import os
+import time
 from dataclasses import dataclass, field
 import rediscluster
 from rediscluster import RedisCluster
@@ -40,6 +44,59 @@ class ConnectionConfig:
         return list(self.connection_confg.keys())
 
 
+class ChunkSizer:
+    """
+    Chooses how many keys to send in each chunk of a multi-key read.
+
+    After each chunk, we estimate how many keys we could have read within the target latency and the target
+    reply size, and move the chunk size towards that estimate. This keeps bulk reads from tying up Redis (and
+    the connection) for long enough to hold up small requests, without splitting small reads unnecessarily.
+    """
+    def __init__(self, initial_size=2500, min_size=100, max_size=25000, target_seconds=0.01,
+                 target_bytes=4_000_000, smoothing=0.2):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.smoothing = smoothing
+        self.size = float(min(max(initial_size, min_size), max_size))
+
+    @property
+    def chunk_size(self) -> int:
+        return int(self.size)
+
+    def observe(self, key_count: int, seconds: float, value_bytes: int):
+        """
+        Record how long a chunk of key_count keys took to read, and how large its values were.
+        """
+        if key_count <= 0:
+            return
+
+        ideal_size = self.max_size
+        if seconds > 0:
+            ideal_size = min(ideal_size, self.target_seconds * key_count / seconds)
+        if value_bytes > 0:
+            ideal_size = min(ideal_size, self.target_bytes * key_count / value_bytes)
+
+        # Smooth the estimate so that a single slow chunk doesn't swing the chunk size.
+        size = (1 - self.smoothing) * self.size + self.smoothing * ideal_size
+        self.size = min(max(size, self.min_size), self.max_size)
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Create a ChunkSizer configured from environment variables. EQ_BATCH_SIZE is still honored as
+        the initial chunk size.
+        """
+        return cls(
+            initial_size=int(os.environ.get("MGET_CHUNK_SIZE", os.environ.get("EQ_BATCH_SIZE", 2500))),
+            min_size=int(os.environ.get("MGET_MIN_CHUNK_SIZE", 100)),
+            max_size=int(os.environ.get("MGET_MAX_CHUNK_SIZE", 25000)),
+            target_seconds=float(os.environ.get("MGET_TARGET_CHUNK_MS", 10)) / 1000,
+            target_bytes=int(os.environ.get("MGET_TARGET_CHUNK_BYTES", 4_000_000)),
+        )
+
+
 class RedisConnection:
     """
     Abstraction layer for redis interaction.
@@ -47,6 +104,10 @@ class RedisConnection:
     """
     def __init__(self):
         self.connector = None
+        self.redis_instance = None
+        # Multi-key reads are split into chunks, and at most this many chunks of each read are sent at once.
+        self.chunk_sizer = ChunkSizer.from_environment()
+        self.max_chunks_in_flight = int(os.environ.get("MGET_MAX_IN_FLIGHT", 4))
 
     @classmethod
     async def create(cls, redis_instance: RedisInstance):
@@ -80,11 +141,49 @@ class RedisConnection:
                                                                **other_params)
 
         self.connector = redis_connector
+        self.redis_instance = redis_instance
         return self
 
     async def mget(self, *keys, encoding='utf-8'):
         """
         Execute mget command.
+
+        Large reads are split into chunks (see ChunkSizer), which are sent concurrently, with no more than
+        max_chunks_in_flight chunks of this read outstanding at once. The limit applies to each read rather than to
+        the connection, so that small reads are never queued behind the chunks of a large one.
+        """
+        chunk_size = self.chunk_sizer.chunk_size
+        if len(keys) <= chunk_size:
+            # The time taken by a read much smaller than a chunk is mostly round-trip latency, which says little
+            # about how many keys we could read at once, so we only learn from reads of about a chunk or more.
+            return await self._mget_chunk(keys, encoding, observe=len(keys) >= chunk_size // 2)
+
+        chunks_in_flight = asyncio.Semaphore(self.max_chunks_in_flight)
+
+        async def mget_limited_chunk(chunk):
+            async with chunks_in_flight:
+                return await self._mget_chunk(chunk, encoding)
+
+        chunks = await asyncio.gather(*[
+            mget_limited_chunk(keys[i:i + chunk_size])
+            for i in range(0, len(keys), chunk_size)
+        ])
+        return list(itertools.chain.from_iterable(chunks))
+
+    async def _mget_chunk(self, keys, encoding, observe=True):
+        """
+        Read a single chunk of keys, and (if observe is set) tell the chunk sizer how it went.
+        """
+        start_time = time.perf_counter()
+        values = await self._mget(keys, encoding)
+        if observe:
+            value_bytes = sum(len(value) for value in values if value)
+            self.chunk_sizer.observe(len(keys), time.perf_counter() - start_time, value_bytes)
+        return values
+
+    async def _mget(self, keys, encoding):
+        """
+        Execute a single mget command.
         """
         if isinstance(self.connector, RedisCluster):
             self.connector: RedisCluster
@@ -165,6 +264,33 @@ class RedisConnection:
     def pipeline(self):
         return self.connector.pipeline()
 
+    async def script_load(self, script):
+        """
+        Load a Lua script into the script cache.
+        :return: The SHA1 digest of the script.
+        """
+        if isinstance(self.connector, RedisCluster):
+            self.connector: RedisCluster
+            return self.connector.script_load(script)
+        elif isinstance(self.connector, aioredis.commands.Redis):
+            self.connector: aioredis.commands.Redis
+            digest = await self.connector.script_load(script)
+            return digest.decode('utf-8') if isinstance(digest, bytes) else digest
+
+    async def evalsha(self, digest, keys=[], args=[], encoding='utf-8'):
+        """
+        Execute a Lua script from the script cache.
+        """
+        if isinstance(self.connector, RedisCluster):
+            self.connector: RedisCluster
+            return self.connector.evalsha(digest, len(keys), *keys, *args)
+        elif isinstance(self.connector, aioredis.commands.Redis):
+            self.connector: aioredis.commands.Redis
+            result = await self.connector.evalsha(digest, keys=list(keys), args=list(args))
+            if encoding and isinstance(result, bytes):
+                result = result.decode(encoding)
+            return result
+
     async def keys(self, pattern, encoding="utf-8"):
         """
         Execute keys command
@@ -196,6 +322,38 @@ class RedisConnection:
             return pipeline.execute()
 
 
+class RedisScript:
+    """
+    A Lua script registered in the script cache of a Redis instance.
+    If Redis forgets the script (e.g. after a restart or SCRIPT FLUSH), it is loaded again.
+    """
+    def __init__(self, connection: RedisConnection, script: str):
+        self.connection = connection
+        self.script = script
+        self.digest = None
+
+    @classmethod
+    async def register(cls, connection: RedisConnection, script: str):
+        """
+        Create a RedisScript and load it into the script cache of the connection.
+        """
+        self = RedisScript(connection, script)
+        self.digest = await connection.script_load(script)
+        return self
+
+    async def __call__(self, keys=[], args=[]):
+        """
+        Run the script with the given keys and arguments.
+        """
+        try:
+            return await self.connection.evalsha(self.digest, keys=keys, args=args)
+        except Exception as e:
+            if 'NOSCRIPT' not in str(e):
+                raise
+            self.digest = await self.connection.script_load(self.script)
+            return await self.connection.evalsha(self.digest, keys=keys, args=args)
+
+
 class RedisConnectionFactory:
     """
     Class to create three redis connections based on config
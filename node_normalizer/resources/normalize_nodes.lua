@@ -0,0 +1,109 @@
+-- Resolve a list of CURIEs to everything get_normalized_nodes() needs in a single round-trip.
+--
+-- This script SELECTs between databases, so it can only be used when every table lives on the same
+-- (non-clustered) Redis instance. Since Redis 2.8.12, a SELECT inside a script does not change the
+-- database selected by the calling connection.
+--
+-- KEYS: the upper-cased CURIEs to normalize.
+-- ARGV: the database numbers of eq_id_to_id_db, id_to_eqids_db, id_to_type_db, info_content_db and
+--       preferred_label_db (or '' if there are no precomputed labels), followed by the name and database number
+--       of each conflation table to apply (in order).
+--
+-- Returns a JSON object with:
+--   canonical_ids: a list with the canonical ID (or false) for each key.
+--   eqids, types: the raw id_to_eqids and id_to_type values for each canonical ID and conflated partner.
+--   info_contents: the raw info_content value for each canonical ID.
+--   conflations: a list with one object per conflation table, mapping each canonical ID to its raw value.
+--   preferred_labels: the precomputed preferred label (or false) for each canonical ID, taking into account the
+--                     conflations that apply to it (see get_preferred_label_key() in util.py).
+
+local eq_id_to_id_db, id_to_eqids_db, id_to_type_db, info_content_db, preferred_label_db =
+    ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+
+local canonical_ids = {}
+local canonical_list = {}
+local record_ids = {}
+local record_list = {}
+
+local function add_record(identifier)
+    if not record_ids[identifier] then
+        record_ids[identifier] = true
+        table.insert(record_list, identifier)
+    end
+end
+
+redis.call('SELECT', eq_id_to_id_db)
+for index, key in ipairs(KEYS) do
+    local canonical_id = redis.call('GET', key)
+    canonical_ids[index] = canonical_id
+    if canonical_id and not record_ids[canonical_id] then
+        table.insert(canonical_list, canonical_id)
+        add_record(canonical_id)
+    end
+end
+
+local conflations = {}
+local conflation_names = {}
+for conflation_index = 6, #ARGV, 2 do
+    local conflation = {}
+    table.insert(conflation_names, ARGV[conflation_index])
+    redis.call('SELECT', ARGV[conflation_index + 1])
+    for _, canonical_id in ipairs(canonical_list) do
+        local value = redis.call('GET', canonical_id)
+        if value then
+            conflation[canonical_id] = value
+            for _, other_id in ipairs(cjson.decode(value)) do
+                add_record(other_id)
+            end
+        end
+    end
+    table.insert(conflations, conflation)
+end
+
+local eqids = {}
+redis.call('SELECT', id_to_eqids_db)
+for _, identifier in ipairs(record_list) do
+    eqids[identifier] = redis.call('GET', identifier)
+end
+
+local types = {}
+redis.call('SELECT', id_to_type_db)
+for _, identifier in ipairs(record_list) do
+    types[identifier] = redis.call('GET', identifier)
+end
+
+local info_contents = {}
+redis.call('SELECT', info_content_db)
+for _, canonical_id in ipairs(canonical_list) do
+    info_contents[canonical_id] = redis.call('GET', canonical_id)
+end
+
+-- The loader stores the label of each clique under its canonical ID, and the label of each conflated clique
+-- under the name of its conflation and the canonical ID. There's no precomputed label for a clique conflated by
+-- more than one conflation.
+local preferred_labels = {}
+if preferred_label_db ~= '' then
+    redis.call('SELECT', preferred_label_db)
+    for _, canonical_id in ipairs(canonical_list) do
+        local label_key = canonical_id
+        local conflated_by = 0
+        for index, conflation in ipairs(conflations) do
+            if conflation[canonical_id] and #cjson.decode(conflation[canonical_id]) > 0 then
+                conflated_by = conflated_by + 1
+                label_key = conflation_names[index] .. '|' .. canonical_id
+            end
+        end
+        if conflated_by <= 1 then
+            preferred_labels[canonical_id] = redis.call('GET', label_key)
+        end
+    end
+end
+
+return cjson.encode({
+    canonical_ids = canonical_ids,
+    eqids = eqids,
+    types = types,
+    info_contents = info_contents,
+    conflations = conflations,
+    preferred_labels = preferred_labels,
+})
@@ -0,0 +1,146 @@
+"""
+Binary formats for the results of get_normalized_nodes(), chosen with the Accept header.
+
+JSON is always available. MessagePack and Arrow IPC streams are only offered if the `msgpack` and `pyarrow` packages
+(from requirements.txt) are installed.
+"""
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from starlette.responses import Response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# The library needed for each binary format (None if it isn't installed).
+BINARY_FORMAT_LIBRARIES = {
+    MSGPACK_MEDIA_TYPE: msgpack,
+    "application/x-msgpack": msgpack,
+    ARROW_STREAM_MEDIA_TYPE: pyarrow,
+}
+
+
+# Documents the binary formats in the OpenAPI schema of /get_normalized_nodes.
+NORMALIZED_NODES_RESPONSES = {
+    200: {
+        "content": {
+            MSGPACK_MEDIA_TYPE: {},
+            ARROW_STREAM_MEDIA_TYPE: {},
+        },
+        "description": "The normalized nodes as JSON, or as MessagePack or an Arrow IPC stream if requested in the "
+                       "Accept header.",
+    },
+    406: {"description": "Only binary formats whose optional library is not installed were accepted."},
+}
+
+
+def choose_media_type(accept: str) -> str:
+    """
+    Choose the format to return normalized nodes in, based on an Accept header. We return JSON unless the client
+    prefers one of the binary formats.
+
+    :raises HTTPException: With a 406 error if the client only accepts binary formats whose library isn't installed.
+        (Clients that only accept other formats get JSON, as they always have.)
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+
+    accepted = []
+    for index, item in enumerate(accept.split(',')):
+        media_type, _, params = item.strip().partition(';')
+        media_type = media_type.strip().lower()
+        qvalue = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        if media_type and qvalue > 0:
+            # Sort by quality, and then by the order in the header.
+            accepted.append((-qvalue, index, media_type))
+
+    for _, _, media_type in sorted(accepted):
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            return JSON_MEDIA_TYPE
+        if media_type in BINARY_FORMAT_LIBRARIES and BINARY_FORMAT_LIBRARIES[media_type] is not None:
+            return MSGPACK_MEDIA_TYPE if media_type == "application/x-msgpack" else media_type
+
+    if not any(media_type in BINARY_FORMAT_LIBRARIES for _, _, media_type in accepted):
+        return JSON_MEDIA_TYPE
+
+    available = [JSON_MEDIA_TYPE] + [media_type for media_type, library in BINARY_FORMAT_LIBRARIES.items()
+                                     if library is not None]
+    raise HTTPException(status_code=406, detail=f"Cannot produce any of the requested formats ({accept}). " +
+                                                f"Available formats: {', '.join(available)}")
+
+
+def normalized_nodes_to_arrow(normalized_nodes: Dict[str, Optional[Dict]]) -> bytes:
+    """
+    Convert the output of get_normalized_nodes() into an Arrow IPC stream with one row per input CURIE.
+
+    The columns are the input `curie`, the preferred `identifier` and `label`, the most specific `type`, the
+    `information_content` and a list of the `equivalent_identifiers`. Every column except `curie` is null for
+    CURIEs that couldn't be normalized, or if that part of the node wasn't requested.
+    """
+    columns = {
+        "curie": [],
+        "identifier": [],
+        "label": [],
+        "type": [],
+        "information_content": [],
+        "equivalent_identifiers": [],
+    }
+    for curie, node in normalized_nodes.items():
+        node = node or {}
+        node_id = node.get("id", {})
+        types = node.get("type")
+        equivalent_identifiers = node.get("equivalent_identifiers")
+
+        columns["curie"].append(curie)
+        columns["identifier"].append(node_id.get("identifier"))
+        columns["label"].append(node_id.get("label"))
+        columns["type"].append(types[0] if types else None)
+        columns["information_content"].append(node.get("information_content"))
+        columns["equivalent_identifiers"].append(
+            [eqid["identifier"] for eqid in equivalent_identifiers] if equivalent_identifiers is not None else None
+        )
+
+    schema = pyarrow.schema([
+        ("curie", pyarrow.string()),
+        ("identifier", pyarrow.string()),
+        ("label", pyarrow.string()),
+        ("type", pyarrow.string()),
+        ("information_content", pyarrow.float64()),
+        ("equivalent_identifiers", pyarrow.list_(pyarrow.string())),
+    ])
+    table = pyarrow.Table.from_pydict(columns, schema=schema)
+
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def normalized_nodes_response(normalized_nodes: Dict[str, Optional[Dict]], media_type: str) -> Response:
+    """
+    Serialize the output of get_normalized_nodes() in the format chosen by choose_media_type().
+    """
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return Response(msgpack.packb(normalized_nodes), media_type=MSGPACK_MEDIA_TYPE)
+    if media_type == ARROW_STREAM_MEDIA_TYPE:
+        return Response(normalized_nodes_to_arrow(normalized_nodes), media_type=ARROW_STREAM_MEDIA_TYPE)
+    return ORJSONResponse(normalized_nodes)
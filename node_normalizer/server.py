@@ -4,33 +4,44 @@ import os
 import logging, warnings
 
 from pathlib import Path
-from typing import List, Optional, Dict, Annotated
+from typing import List, Optional, Dict, Annotated, get_args
 
 from fastapi.middleware.cors import CORSMiddleware
 import requests
 from requests.adapters import HTTPAdapter, Retry
 import fastapi
-from fastapi import FastAPI, HTTPException, Body, Query
+import orjson
+from fastapi import FastAPI, HTTPException, Body, Query, Request
+from fastapi.exceptions import RequestValidationError
 import reasoner_pydantic
 import yaml
-from pydantic import BaseModel
-from bmt import Toolkit
-from starlette.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+from fastapi.responses import ORJSONResponse
+from starlette.responses import FileResponse, JSONResponse, Response
 
-from .loader import NodeLoader
 from .apidocs import get_app_info, construct_open_api_schema
 from .model import (
     SemanticTypes,
     CuriePivot,
     CurieList,
+    CanonicalIDQuery,
+    NodeField,
     SemanticTypesInput,
     ConflationList,
     SetIDResponse,
     SetIDQuery,
 )
-from .normalizer import get_normalized_nodes, get_curie_prefixes, normalize_message
+from .normalizer import get_normalized_nodes, get_curie_prefixes, normalize_message, normalize_query_json, \
+    register_normalization_script, DEFAULT_NORMALIZATION_SCRIPT_MAX_CURIES, \
+    get_normalization_script_databases, get_canonical_ids, get_equivalent_identifiers_page, config
 from .set_id import generate_setid
+from .biolink_ancestors import load_ancestor_table
 from .redis_adapter import RedisConnectionFactory
+from .cache import CliqueRecordCache, NormalizationCache
+from .compression import CompressionMiddleware, DecompressionMiddleware
+from .streaming import normalize_stream, get_stream_settings, RequestStreamingResponse, NDJSON_MEDIA_TYPE
+from .bulk_jobs import BulkJobManager
+from .response_formats import choose_media_type, normalized_nodes_response, NORMALIZED_NODES_RESPONSES
 from .util import LoggingUtil
 from .examples import EXAMPLE_QUERY_DRUG_TREATS_ESSENTIAL_HYPERTENSION
 
@@ -48,10 +59,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-loader = NodeLoader()
+# Compress large responses with gzip, brotli or zstd (depending on what the client accepts and which libraries are
+# installed). See CompressionMiddleware.options_from_environment() for the settings.
+app.add_middleware(CompressionMiddleware, **CompressionMiddleware.options_from_environment())
 
-redis_host = os.environ.get("REDIS_HOST", loader.get_config()["redis_host"])
-redis_port = os.environ.get("REDIS_PORT", loader.get_config()["redis_port"])
+# Accept request bodies compressed with gzip or zstd. See DecompressionMiddleware.options_from_environment() for
+# the settings.
+app.add_middleware(DecompressionMiddleware, **DecompressionMiddleware.options_from_environment())
+
+# We use the configuration loaded by the normalizer rather than creating a NodeLoader, which would load the
+# entire Biolink model.
+redis_host = os.environ.get("REDIS_HOST", config["redis_host"])
+redis_port = os.environ.get("REDIS_PORT", config["redis_port"])
 
 async_query_tasks = set()
 
@@ -70,8 +89,31 @@ async def startup_event():
     app.state.info_content_db = connection_factory.get_connection(connection_id="info_content_db")
     app.state.gene_protein_db = connection_factory.get_connection(connection_id="gene_protein_db")
     app.state.chemical_drug_db = connection_factory.get_connection(connection_id="chemical_drug_db")
-    app.state.toolkit = Toolkit()
-    app.state.ancestor_map = {}
+    # The preferred labels precomputed by the loader are optional: if this database isn't configured, we
+    # compute labels as we need them.
+    app.state.preferred_label_db = connection_factory.get_all_connections().get("preferred_label_db")
+    app.state.ancestor_map = await load_ancestor_table(app.state.curie_to_bl_type_db)
+
+    # Optionally resolve small requests with a server-side Lua script, so that each call to get_normalized_nodes()
+    # only needs a single round-trip to Redis. This only works if all the tables are on the same
+    # non-clustered Redis instance; otherwise we fall back to separate MGETs.
+    app.state.normalization_script = None
+    if os.environ.get('REDIS_SCRIPT_MODE', 'false') == 'true':
+        app.state.normalization_script = await register_normalization_script(app)
+        app.state.normalization_script_databases = get_normalization_script_databases(app)
+        app.state.normalization_script_max_curies = int(os.environ.get('REDIS_SCRIPT_MAX_CURIES',
+                                                                       DEFAULT_NORMALIZATION_SCRIPT_MAX_CURIES))
+
+    # Cache recently normalized nodes in memory (set NORMALIZATION_CACHE_SIZE=0 to disable).
+    app.state.normalization_cache = NormalizationCache.from_environment()
+
+    # Cache the decoded records of recently used cliques, which are shared by requests with different options
+    # (set CLIQUE_CACHE_SIZE_MB=0 to disable).
+    app.state.clique_cache = CliqueRecordCache.from_environment()
+
+    # Resume any bulk jobs that were interrupted when the server last stopped.
+    app.state.bulk_jobs = BulkJobManager.from_environment()
+    app.state.bulk_jobs.resume_jobs(app)
 
 
 @app.on_event("shutdown")
@@ -79,6 +121,8 @@ async def shutdown_event():
     """
     Shut down Redis connection
     """
+    if getattr(app.state, 'bulk_jobs', None) is not None:
+        await app.state.bulk_jobs.close()
     app.state.eq_id_to_id_db.close()
     await app.state.eq_id_to_id_db.wait_closed()
     app.state.id_to_eqids_db.close()
@@ -93,6 +137,9 @@ async def shutdown_event():
     await app.state.gene_protein_db.wait_closed()
     app.state.chemical_drug_db.close()
     await app.state.chemical_drug_db.wait_closed()
+    if app.state.preferred_label_db is not None:
+        app.state.preferred_label_db.close()
+        await app.state.preferred_label_db.wait_closed()
 
 
 @app.get(
@@ -116,7 +163,15 @@ async def status() -> Dict:
     babel_version = os.environ.get("BABEL_VERSION", "unknown")
     babel_version_url = os.environ.get("BABEL_VERSION_URL", "")
 
-    return {
+    caches = {}
+    normalization_cache = getattr(app.state, 'normalization_cache', None)
+    if normalization_cache is not None:
+        caches['normalization_cache'] = normalization_cache.stats()
+    clique_cache = getattr(app.state, 'clique_cache', None)
+    if clique_cache is not None:
+        caches['clique_cache'] = clique_cache.stats()
+
+    status_info = {
         "status": "running",
         "babel_version": babel_version,
         "babel_version_url": babel_version_url,
@@ -164,27 +219,75 @@ async def status() -> Dict:
                 "is_cluster": redis_config['chemical_drug_db'].get('is_cluster', 'false')
             }
         },
+        "caches": caches,
     }
 
+    preferred_label_db = getattr(app.state, 'preferred_label_db', None)
+    if preferred_label_db is not None:
+        status_info["databases"]["preferred_label_db"] = {
+            "dbname": "preferred-labels",
+            "count": await preferred_label_db.dbsize(),
+            "used_memory_rss_human": await preferred_label_db.used_memory_rss_human(),
+            "is_cluster": redis_config['preferred_label_db'].get('is_cluster', 'false')
+        }
+
+    return status_info
+
+
+def parse_trapi_query(body: bytes, validate: bool) -> Dict:
+    """
+    Parse a TRAPI query from a raw request body with orjson, optionally validating it with reasoner_pydantic.
+
+    Errors are reported in the same format as FastAPI's validation errors.
+    """
+    try:
+        query = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError([{"loc": ("body",), "msg": f"Invalid JSON: {e}",
+                                       "type": "value_error.jsondecode"}])
+
+    if validate:
+        try:
+            reasoner_pydantic.Query.parse_obj(query)
+        except ValidationError as e:
+            raise RequestValidationError([{**error, "loc": ("body",) + tuple(error["loc"])} for error in e.errors()])
+    elif not isinstance(query, dict) or not isinstance(query.get("message"), dict):
+        raise RequestValidationError([{"loc": ("body", "message"), "msg": "value is not a valid dict",
+                                       "type": "type_error.dict"}])
+
+    return query
+
+
+# Validating a large TRAPI message with reasoner_pydantic takes much longer than normalizing it, so setting
+# TRAPI_VALIDATION=false skips it. Either way, the message is normalized as plain dicts.
+TRAPI_VALIDATION = os.environ.get('TRAPI_VALIDATION', 'true') == 'true'
+
 
 @app.post(
     "/query",
     summary="Normalizes a TRAPI response object",
     description="Returns the response object with a merged knowledge graph and query graph bindings",
     response_model=reasoner_pydantic.Query,
-    response_model_exclude_none=True,
-    response_model_exclude_unset=True,
     deprecated=True,
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {
+                "schema": {"$ref": "#/components/schemas/Query"},
+                "examples": {"Drugs that treat essential hypertension": {
+                    "summary": "A result from a query for drugs that treat essential hypertension.",
+                    "value": EXAMPLE_QUERY_DRUG_TREATS_ESSENTIAL_HYPERTENSION,
+                }},
+            }},
+            "required": True,
+        },
+    },
 )
-async def query(query: Annotated[reasoner_pydantic.Query, Body(openapi_examples={"Drugs that treat essential hypertension": {
-    "summary": "A result from a query for drugs that treat essential hypertension.",
-    "value": EXAMPLE_QUERY_DRUG_TREATS_ESSENTIAL_HYPERTENSION,
-}})]) -> reasoner_pydantic.Query:
+async def query(request: Request):
     """
     Normalizes a TRAPI compliant knowledge graph
     """
-    query.message = await normalize_message(app, query.message)
-    return query
+    query = parse_trapi_query(await request.body(), TRAPI_VALIDATION)
+    return Response(await normalize_query_json(app, query), media_type="application/json")
 
 
 @app.post(
@@ -248,61 +351,467 @@ async def get_conflations() -> ConflationList:
     return conflations
 
 
+class IdentifierOptions:
+    """
+    The query parameters that choose which equivalent identifiers are returned for a normalized curie, shared by
+    every endpoint that returns them (as a FastAPI dependency).
+    """
+    def __init__(
+        self,
+        conflate: bool = fastapi.Query(True, description="Whether to apply gene/protein conflation"),
+        drug_chemical_conflate: bool = fastapi.Query(False, description="Whether to apply drug/chemical conflation"),
+        description: bool = fastapi.Query(False, description="Whether to return curie descriptions when possible"),
+        individual_types: bool = fastapi.Query(False, description="Whether to return individual types for equivalent identifiers"),
+        include_prefixes: List[str] = fastapi.Query(
+            None,
+            description="Only return the equivalent identifiers with one of these prefixes",
+            example=["MONDO", "DOID"],
+        ),
+        exclude_prefixes: List[str] = fastapi.Query(
+            None,
+            description="Don't return the equivalent identifiers with any of these prefixes",
+        ),
+    ):
+        self.conflate = conflate
+        self.drug_chemical_conflate = drug_chemical_conflate
+        self.description = description
+        self.individual_types = individual_types
+        self.include_prefixes = include_prefixes
+        self.exclude_prefixes = exclude_prefixes
+
+    def as_kwargs(self) -> Dict:
+        """
+        Return these options as keyword arguments for get_equivalent_identifiers_page().
+        """
+        return {
+            'conflate_gene_protein': self.conflate,
+            'conflate_chemical_drug': self.drug_chemical_conflate,
+            'include_descriptions': self.description,
+            'include_individual_types': self.individual_types,
+            'include_prefixes': self.include_prefixes,
+            'exclude_prefixes': self.exclude_prefixes,
+        }
+
+
+class NormalizationOptions:
+    """
+    The query parameters of /get_normalized_nodes, shared by the endpoints that normalize curies with
+    get_normalized_nodes() (as a FastAPI dependency).
+    """
+    def __init__(
+        self,
+        identifier_options: IdentifierOptions = fastapi.Depends(),
+        fields: List[NodeField] = fastapi.Query(
+            None,
+            description="The parts of each normalized node to return (all of them by default). If set, descriptions are "
+                        "only returned if 'description' is included.",
+            example=["id", "type"],
+        ),
+        max_equivalent_identifiers: Optional[int] = fastapi.Query(
+            None,
+            description="The maximum number of equivalent identifiers to return for each node (all of them by default). "
+                        "The rest can be retrieved from /get_equivalent_identifiers.",
+            ge=0,
+        ),
+        require_type: Optional[str] = fastapi.Query(
+            None,
+            description="Return null for curies that don't normalize to a clique of this Biolink type",
+            example="biolink:Disease",
+        ),
+    ):
+        self.identifier_options = identifier_options
+        self.fields = fields
+        self.max_equivalent_identifiers = max_equivalent_identifiers
+        self.require_type = require_type
+
+    def as_kwargs(self) -> Dict:
+        """
+        Return these options as keyword arguments for get_normalized_nodes().
+        """
+        return {
+            **self.identifier_options.as_kwargs(),
+            'fields': self.fields,
+            'max_equivalent_identifiers': self.max_equivalent_identifiers,
+            'require_type': self.require_type,
+        }
+
+
 @app.get(
     "/get_normalized_nodes",
+    response_class=ORJSONResponse,
+    responses=NORMALIZED_NODES_RESPONSES,
     summary="Get the equivalent identifiers and semantic types for the curie(s) entered.",
     description="Returns the equivalent identifiers and semantic types for the curie(s)",
 )
 async def get_normalized_node_handler(
+    request: Request,
     curie: List[str] = fastapi.Query(
         [],
         description="List of curies to normalize",
         example=["MESH:D014867", "NCIT:C34373"],
         min_items=1,
     ),
-    conflate: bool = fastapi.Query(True, description="Whether to apply gene/protein conflation"),
-    drug_chemical_conflate: bool = fastapi.Query(False, description="Whether to apply drug/chemical conflation"),
-    description: bool = fastapi.Query(False, description="Whether to return curie descriptions when possible"),
-    individual_types: bool = fastapi.Query(False, description="Whether to return individual types for equivalent identifiers")
+    options: NormalizationOptions = fastapi.Depends(),
 ):
     """
     Get value(s) for key(s) using redis MGET
     """
+    media_type = choose_media_type(request.headers.get("accept", ""))
+
     # no_conflate = request.args.get('dontconflate',['GeneProtein'])
-    normalized_nodes = await get_normalized_nodes(app, curie, conflate, drug_chemical_conflate,
-                                                  include_descriptions=description,
-                                                  include_individual_types=individual_types)
+    normalized_nodes = await get_normalized_nodes(app, curie, **options.as_kwargs())
 
     # If curie contains at least one entry, then the only way normalized_nodes could be blank
     # would be if an error occurred during processing.
     if not normalized_nodes:
         raise HTTPException(detail="Error occurred during processing.", status_code=500)
 
-    return normalized_nodes
+    # Large responses take longer to encode with jsonable_encoder and the standard library than to look up in Redis,
+    # so we serialize them with orjson (or one of the binary formats) directly.
+    return normalized_nodes_response(normalized_nodes, media_type)
 
 
-@app.post(
-    "/get_normalized_nodes",
-    summary="Get the equivalent identifiers and semantic types for the curie(s) entered.",
-    description="Returns the equivalent identifiers and semantic types for the curie(s). Use the `conflate` flag to choose whether to apply conflation.",
-)
-async def get_normalized_node_handler_post(curies: CurieList):
+async def normalize_curie_list(curies: CurieList, accept: str) -> Response:
     """
-    Get value(s) for key(s) using redis MGET
+    Normalize the CURIEs in a CurieList with the options it sets, and return them in the format chosen by the
+    Accept header.
     """
+    media_type = choose_media_type(accept)
     normalized_nodes = await get_normalized_nodes(app, curies.curies, curies.conflate, curies.drug_chemical_conflate,
-                                                  curies.description, include_individual_types=curies.individual_types)
+                                                  curies.description, include_individual_types=curies.individual_types,
+                                                  fields=curies.fields,
+                                                  max_equivalent_identifiers=curies.max_equivalent_identifiers,
+                                                  include_prefixes=curies.include_prefixes,
+                                                  exclude_prefixes=curies.exclude_prefixes,
+                                                  require_type=curies.require_type)
 
     # If curies.curies contains at least one entry, then the only way normalized_nodes could be blank
     # would be if an error occurred during processing.
     if not normalized_nodes:
         raise HTTPException(detail="Error occurred during processing.", status_code=500)
 
-    return normalized_nodes
+    return normalized_nodes_response(normalized_nodes, media_type)
+
+
+async def get_normalized_node_handler_post(curies: CurieList, request: Request):
+    """
+    Get value(s) for key(s) using redis MGET
+    """
+    return await normalize_curie_list(curies, request.headers.get("accept", ""))
+
+
+# The options in a CurieList that are checked by parse_curie_list(), and the types they must have (if not null).
+CURIE_LIST_OPTIONS = {
+    "conflate": bool,
+    "description": bool,
+    "drug_chemical_conflate": bool,
+    "individual_types": bool,
+    "fields": list,
+    "max_equivalent_identifiers": int,
+    "include_prefixes": list,
+    "exclude_prefixes": list,
+    "require_type": str,
+}
+NODE_FIELD_VALUES = frozenset(get_args(NodeField))
+
+
+def parse_curie_list(body: bytes) -> CurieList:
+    """
+    Parse a CurieList from a raw request body with orjson, without validating it with pydantic.
+
+    We only check what get_normalized_nodes() relies on: that `curies` is a non-empty list of strings, and that
+    each option has the right type. Errors are reported in the same format as FastAPI's validation errors.
+    """
+    def invalid(loc, msg, error_type):
+        return RequestValidationError([{"loc": ("body",) + loc, "msg": msg, "type": error_type}])
+
+    try:
+        query = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise invalid((), f"Invalid JSON: {e}", "value_error.jsondecode")
+    if not isinstance(query, dict):
+        raise invalid((), "value is not a valid dict", "type_error.dict")
+
+    curies = query.get("curies")
+    if not isinstance(curies, list):
+        raise invalid(("curies",), "value is not a valid list", "type_error.list")
+    if not curies:
+        raise invalid(("curies",), "ensure this value has at least 1 items", "value_error.list.min_items")
+    for index, curie in enumerate(curies):
+        if not isinstance(curie, str):
+            raise invalid(("curies", index), "str type expected", "type_error.str")
+
+    options = {}
+    for option, option_type in CURIE_LIST_OPTIONS.items():
+        value = query.get(option)
+        if value is None:
+            continue
+        # bool is a subclass of int, so we need to rule it out explicitly.
+        if not isinstance(value, option_type) or (option_type is int and isinstance(value, bool)):
+            raise invalid((option,), f"value is not a valid {option_type.__name__}",
+                          f"type_error.{option_type.__name__}")
+        if option_type is list and not all(isinstance(item, str) for item in value):
+            raise invalid((option,), "str type expected", "type_error.str")
+        options[option] = value
+
+    if not NODE_FIELD_VALUES.issuperset(options.get("fields", [])):
+        raise invalid(("fields",), f"unexpected value; permitted: {sorted(NODE_FIELD_VALUES)}",
+                      "value_error.const")
+    if options.get("max_equivalent_identifiers", 0) < 0:
+        raise invalid(("max_equivalent_identifiers",), "ensure this value is greater than or equal to 0",
+                      "value_error.number.not_ge")
+
+    return CurieList.construct(curies=curies, **options)
+
+
+async def get_normalized_node_handler_post_raw(request: Request):
+    """
+    Get value(s) for key(s) using redis MGET, parsing the request body with parse_curie_list()
+    """
+    return await normalize_curie_list(parse_curie_list(await request.body()), request.headers.get("accept", ""))
+
+
+# Validating a large CurieList with pydantic can take longer than normalizing it, so setting RAW_POST_PARSING=true
+# replaces it with the minimal checks in parse_curie_list(). The request body is still documented as a CurieList.
+if os.environ.get('RAW_POST_PARSING', 'false') == 'true':
+    app.post(
+        "/get_normalized_nodes",
+        response_class=ORJSONResponse,
+        responses=NORMALIZED_NODES_RESPONSES,
+        summary="Get the equivalent identifiers and semantic types for the curie(s) entered.",
+        description="Returns the equivalent identifiers and semantic types for the curie(s). Use the `conflate` flag to choose whether to apply conflation.",
+        openapi_extra={
+            "requestBody": {
+                "content": {"application/json": {"schema": CurieList.schema()}},
+                "required": True,
+            },
+        },
+    )(get_normalized_node_handler_post_raw)
+else:
+    app.post(
+        "/get_normalized_nodes",
+        response_class=ORJSONResponse,
+        responses=NORMALIZED_NODES_RESPONSES,
+        summary="Get the equivalent identifiers and semantic types for the curie(s) entered.",
+        description="Returns the equivalent identifiers and semantic types for the curie(s). Use the `conflate` flag to choose whether to apply conflation.",
+    )(get_normalized_node_handler_post)
+
+
+@app.post(
+    "/get_normalized_nodes/stream",
+    response_class=RequestStreamingResponse,
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}}}},
+    summary="Stream the equivalent identifiers and semantic types for a stream of curies.",
+    description="Normalizes a request body of newline-delimited curies (or JSON objects with a `curie` key), and "
+                "streams back one JSON object per line with each `curie` and its normalized `node`. Results are "
+                "returned in the same order as the input, as they become available.",
+    openapi_extra={
+        "requestBody": {
+            "content": {"text/plain": {"schema": {"type": "string"}, "example": "MESH:D014867\nNCIT:C34373\n"}},
+            "required": True,
+        },
+    },
+)
+async def get_normalized_nodes_stream_handler(
+    request: Request,
+    options: NormalizationOptions = fastapi.Depends(),
+):
+    """
+    Normalize a stream of curies a window at a time
+    """
+    body_read = asyncio.Event()
+
+    async def request_chunks():
+        try:
+            async for chunk in request.stream():
+                yield chunk
+        finally:
+            body_read.set()
+
+    content = normalize_stream(app, request_chunks(), **get_stream_settings(), **options.as_kwargs())
+    return RequestStreamingResponse(content, body_read, media_type=NDJSON_MEDIA_TYPE)
+
+
+def get_bulk_jobs() -> BulkJobManager:
+    """
+    Return the BulkJobManager, creating it if the server was started without running the startup event.
+    """
+    if getattr(app.state, 'bulk_jobs', None) is None:
+        app.state.bulk_jobs = BulkJobManager.from_environment()
+    return app.state.bulk_jobs
+
+
+def bulk_job_response(status: Dict, status_code: int = 200) -> ORJSONResponse:
+    job_id = status['job_id']
+    return ORJSONResponse({
+        **status,
+        'status_url': app.url_path_for('get_bulk_job_handler', job_id=job_id),
+        'result_url': app.url_path_for('get_bulk_job_result_handler', job_id=job_id),
+    }, status_code=status_code)
+
+
+@app.post(
+    "/bulk_jobs",
+    status_code=202,
+    response_class=ORJSONResponse,
+    summary="Start normalizing a file of curies in the background.",
+    description="Uploads a file of newline-delimited curies (or JSON objects with a `curie` key), which is then "
+                "normalized in the background. Returns the status of the new job, including its `job_id`, which can "
+                "be used to check its progress and to download the results once it is complete.",
+    openapi_extra={
+        "requestBody": {
+            "content": {"text/plain": {"schema": {"type": "string"}, "example": "MESH:D014867\nNCIT:C34373\n"}},
+            "required": True,
+        },
+    },
+)
+async def create_bulk_job_handler(
+    request: Request,
+    options: NormalizationOptions = fastapi.Depends(),
+):
+    """
+    Save an uploaded file of curies and start normalizing it in the background
+    """
+    status = await get_bulk_jobs().create_job(app, request.stream(), **options.as_kwargs())
+    return bulk_job_response(status, status_code=202)
+
+
+@app.get(
+    "/bulk_jobs/{job_id}",
+    response_class=ORJSONResponse,
+    summary="Get the status of a bulk normalization job.",
+    description="Returns the `status` of the job (`queued`, `running`, `complete` or `failed`), and how many of its "
+                "`total_lines` have been processed so far (`processed_lines`).",
+)
+async def get_bulk_job_handler(job_id: str):
+    """
+    Get the status of a bulk normalization job
+    """
+    status = get_bulk_jobs().read_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No bulk job found with ID {job_id}")
+    return bulk_job_response(status)
+
+
+@app.get(
+    "/bulk_jobs/{job_id}/result",
+    response_class=FileResponse,
+    responses={200: {"content": {"application/gzip": {}}, "description": "The gzipped NDJSON results of the job."}},
+    summary="Download the results of a bulk normalization job.",
+    description="Returns a gzipped NDJSON file, with one line for each line of the input in the same format as "
+                "/get_normalized_nodes/stream. Returns a 409 error if the job hasn't completed yet.",
+)
+async def get_bulk_job_result_handler(job_id: str):
+    """
+    Download the results of a completed bulk normalization job
+    """
+    bulk_jobs = get_bulk_jobs()
+    status = bulk_jobs.read_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"No bulk job found with ID {job_id}")
+    result_file = bulk_jobs.result_file(job_id)
+    if result_file is None:
+        raise HTTPException(status_code=409, detail=f"Bulk job {job_id} is {status['status']}, not complete")
+    return FileResponse(result_file, media_type="application/gzip", filename=f"{job_id}.ndjson.gz")
+
+
+@app.delete(
+    "/bulk_jobs/{job_id}",
+    status_code=204,
+    summary="Delete a bulk normalization job.",
+    description="Cancels the job if it is still running, and deletes its input and results.",
+)
+async def delete_bulk_job_handler(job_id: str):
+    """
+    Delete a bulk normalization job and its results
+    """
+    if not get_bulk_jobs().delete_job(job_id):
+        raise HTTPException(status_code=404, detail=f"No bulk job found with ID {job_id}")
+    return Response(status_code=204)
+
+
+@app.get(
+    "/get_equivalent_identifiers",
+    response_class=ORJSONResponse,
+    summary="Get a page of the equivalent identifiers for the curie entered.",
+    description="Returns some of the equivalent identifiers of the clique that the curie normalizes to, so that "
+                "large cliques truncated by the `max_equivalent_identifiers` option of /get_normalized_nodes can be "
+                "retrieved in pages.",
+)
+async def get_equivalent_identifiers_handler(
+    curie: str = fastapi.Query(..., description="The curie to normalize", example="MESH:D014867"),
+    offset: int = fastapi.Query(0, description="The index of the first equivalent identifier to return", ge=0),
+    limit: int = fastapi.Query(1000, description="The maximum number of equivalent identifiers to return",
+                               ge=1, le=10000),
+    options: IdentifierOptions = fastapi.Depends(),
+):
+    """
+    Get a page of the equivalent identifiers for a curie
+    """
+    page = await get_equivalent_identifiers_page(app, curie, offset=offset, limit=limit, **options.as_kwargs())
+    if page is None:
+        raise HTTPException(detail=f"Could not normalize {curie}.", status_code=404)
+
+    return ORJSONResponse(page)
+
+
+@app.get(
+    "/get_canonical_ids",
+    response_class=ORJSONResponse,
+    summary="Get the preferred identifier for the curie(s) entered.",
+    description="Returns only the preferred identifier (and optionally the most specific Biolink type) for each curie, "
+                "which is much faster than /get_normalized_nodes when you don't need the rest of the clique.",
+)
+async def get_canonical_ids_handler(
+    curie: List[str] = fastapi.Query(
+        [],
+        description="List of curies to normalize",
+        example=["MESH:D014867", "NCIT:C34373"],
+        min_items=1,
+    ),
+    conflate: bool = fastapi.Query(True, description="Whether to apply gene/protein conflation"),
+    drug_chemical_conflate: bool = fastapi.Query(False, description="Whether to apply drug/chemical conflation"),
+    include_type: bool = fastapi.Query(False, description="Whether to return the most specific Biolink type of each "
+                                                          "preferred identifier"),
+):
+    """
+    Get the preferred identifier for each curie using redis MGET
+    """
+    canonical_ids = await get_canonical_ids(app, curie, conflate, drug_chemical_conflate, include_type=include_type)
+
+    # If curie contains at least one entry, then the only way canonical_ids could be blank
+    # would be if an error occurred during processing.
+    if not canonical_ids:
+        raise HTTPException(detail="Error occurred during processing.", status_code=500)
+
+    return ORJSONResponse(canonical_ids)
+
+
+@app.post(
+    "/get_canonical_ids",
+    response_class=ORJSONResponse,
+    summary="Get the preferred identifier for the curie(s) entered.",
+    description="Returns only the preferred identifier (and optionally the most specific Biolink type) for each curie, "
+                "which is much faster than /get_normalized_nodes when you don't need the rest of the clique.",
+)
+async def get_canonical_ids_handler_post(query: CanonicalIDQuery):
+    """
+    Get the preferred identifier for each curie using redis MGET
+    """
+    canonical_ids = await get_canonical_ids(app, query.curies, query.conflate, query.drug_chemical_conflate,
+                                            include_type=query.include_type)
+
+    # If query.curies contains at least one entry, then the only way canonical_ids could be blank
+    # would be if an error occurred during processing.
+    if not canonical_ids:
+        raise HTTPException(detail="Error occurred during processing.", status_code=500)
+
+    return ORJSONResponse(canonical_ids)
 
 
 @app.get(
     "/get_setid",
+    response_class=ORJSONResponse,
     response_model=SetIDResponse,
     summary="Normalize and deduplicate a set of identifiers and return a single hash that represents this set."
 )
@@ -318,12 +827,14 @@ async def get_setid(
         description="Set of conflations to apply",
         example=["GeneProtein", "DrugChemical"],
     )
-) -> SetIDResponse:
-    return await generate_setid(app, curie, conflation)
+) -> ORJSONResponse:
+    setid = await generate_setid(app, curie, conflation)
+    return ORJSONResponse(setid.dict())
 
 
 @app.post(
     "/get_setid",
+    response_class=ORJSONResponse,
     response_model=List[SetIDResponse],
     summary="Normalize and deduplicate a set of identifiers and return a single hash that represents this set."
 )
@@ -339,10 +850,10 @@ async def get_setid(
                                                         "conflations": ["GeneProtein", "DrugChemical"]
                                                     }
                                                 ])
-) -> List[SetIDResponse]:
+) -> ORJSONResponse:
     # I'm guessing there's some way of doing this so that the generate_setid()s run in parallel, but I don't know how.
     # I'll figure it out if needed.
-    return [await generate_setid(app, q.curies, q.conflations) for q in sets]
+    return ORJSONResponse([(await generate_setid(app, q.curies, q.conflations)).dict() for q in sets])
 
 
 @app.get(
@@ -367,8 +878,19 @@ async def get_semantic_types_handler() -> SemanticTypes:
     return ret_val
 
 
+def curie_prefixes_response(curie_prefixes: Dict[str, Dict]) -> ORJSONResponse:
+    """
+    Serialize the output of get_curie_prefixes() in the CuriePivot format, which reports each count as a string.
+    """
+    return ORJSONResponse({
+        semantic_type: {"curie_prefix": {prefix: str(count) for prefix, count in pivot["curie_prefix"].items()}}
+        for semantic_type, pivot in curie_prefixes.items()
+    })
+
+
 @app.get(
     "/get_curie_prefixes",
+    response_class=ORJSONResponse,
     response_model=Dict[str, CuriePivot],
     summary="Return the number of times each CURIE prefix appears in an equivalent identifier for a semantic type",
     description="Returns the curies and their hit count for a semantic type(s).",
@@ -376,20 +898,21 @@ async def get_semantic_types_handler() -> SemanticTypes:
 async def get_curie_prefixes_handler(
     semantic_type: Optional[List[str]] = fastapi.Query([], description="e.g. biolink:ChemicalEntity, "
                                                                        "biolink:AnatomicalEntity")
-) -> Dict[str, CuriePivot]:
-    return await get_curie_prefixes(app, semantic_type)
+) -> ORJSONResponse:
+    return curie_prefixes_response(await get_curie_prefixes(app, semantic_type))
 
 
 @app.post(
     "/get_curie_prefixes",
+    response_class=ORJSONResponse,
     response_model=Dict[str, CuriePivot],
     summary="Return the number of times each CURIE prefix appears in an equivalent identifier for a semantic type",
     description="Returns the curies and their hit count for a semantic type(s).",
 )
 async def get_curie_prefixes_handler(
     semantic_types: SemanticTypesInput,
-) -> Dict[str, CuriePivot]:
-    return await get_curie_prefixes(app, semantic_types.semantic_types)
+) -> ORJSONResponse:
+    return curie_prefixes_response(await get_curie_prefixes(app, semantic_types.semantic_types))
 
 
 # Override open api schema with custom schema
@@ -0,0 +1,149 @@
+"""
+Normalize a stream of CURIEs, returning a stream of NDJSON results.
+
+The input is read a window of CURIEs at a time, and each window is normalized with get_normalized_nodes(). At most
+a fixed number of windows are normalized at once, and the results of each window are written out (in the same order
+as the input) as soon as they and all the windows before them are ready, so the memory we use doesn't depend on
+how many CURIEs are sent.
+"""
+import asyncio
+import collections
+import os
+from typing import AsyncIterator, Dict, List
+
+import orjson
+from fastapi import FastAPI
+from starlette.responses import StreamingResponse
+from starlette.types import Receive
+
+from .normalizer import get_normalized_nodes
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def get_stream_settings() -> Dict[str, int]:
+    """
+    Read the window size (STREAM_WINDOW_SIZE) and the maximum number of windows to normalize at once
+    (STREAM_MAX_WINDOWS_IN_FLIGHT) from environment variables.
+    """
+    return {
+        'window_size': int(os.environ.get('STREAM_WINDOW_SIZE', 1000)),
+        'max_windows_in_flight': int(os.environ.get('STREAM_MAX_WINDOWS_IN_FLIGHT', 4)),
+    }
+
+
+def parse_curie_line(line: bytes):
+    """
+    Parse one line of input, which is either a CURIE, a JSON string or a JSON object with a `curie` key.
+
+    :return: The CURIE, or None if the line is blank.
+    :raises ValueError: If the line is a JSON value without a CURIE.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line[:1] not in (b'{', b'"'):
+        return line.decode('utf-8')
+
+    value = orjson.loads(line)
+    if isinstance(value, dict):
+        value = value.get('curie')
+    if not isinstance(value, str):
+        raise ValueError(f"Expected a CURIE or an object with a 'curie' string, but got {line.decode('utf-8')}")
+    return value
+
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split a stream of bytes into lines.
+    """
+    partial = b''
+    async for chunk in chunks:
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line
+    if partial:
+        yield partial
+
+
+async def normalize_stream(app: FastAPI, chunks: AsyncIterator[bytes], window_size: int, max_windows_in_flight: int,
+                           **options) -> AsyncIterator[bytes]:
+    """
+    Normalize the CURIEs in a stream of lines (see parse_curie_line()), yielding one chunk of NDJSON per window.
+
+    Each output line is a JSON object with the input `curie` and its normalized `node` (null if it couldn't be
+    normalized). Lines that couldn't be parsed are reported as objects with the `line` number and an `error`.
+
+    :param options: Passed on to get_normalized_nodes().
+    """
+    # Each window is a list of (line number, CURIE or None, error or None), and is normalized by a task.
+    in_flight = collections.deque()
+
+    def start_window(window: List):
+        curies = [curie for _, curie, _ in window if curie is not None]
+        task = asyncio.ensure_future(get_normalized_nodes(app, curies, **options)) if curies else None
+        in_flight.append((window, task))
+
+    async def finish_window() -> bytes:
+        window, task = in_flight.popleft()
+        nodes = await task if task is not None else {}
+        output = []
+        for line_number, curie, error in window:
+            if error is not None:
+                output.append(orjson.dumps({"line": line_number, "error": error}))
+            else:
+                output.append(orjson.dumps({"curie": curie, "node": nodes[curie]}))
+        output.append(b'')
+        return b'\n'.join(output)
+
+    try:
+        window = []
+        line_number = 0
+        async for line in read_lines(chunks):
+            line_number += 1
+            try:
+                curie = parse_curie_line(line)
+            except ValueError as e:
+                window.append((line_number, None, str(e)))
+            else:
+                if curie is not None:
+                    window.append((line_number, curie, None))
+
+            if len(window) >= window_size:
+                start_window(window)
+                window = []
+                # Wait for the oldest window if we have too many in flight, and send any others that are ready.
+                if len(in_flight) >= max_windows_in_flight:
+                    yield await finish_window()
+                while in_flight and (in_flight[0][1] is None or in_flight[0][1].done()):
+                    yield await finish_window()
+
+        if window:
+            start_window(window)
+        while in_flight:
+            yield await finish_window()
+    finally:
+        # If the client goes away, don't keep normalizing windows that nobody will read.
+        for _, task in in_flight:
+            if task is not None:
+                task.cancel()
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse whose content is generated while the request body is still being read.
+
+    A StreamingResponse listens for the client disconnecting by reading from the request, which would steal the
+    request body from the content generator. Instead, we only start listening once the request body has been read
+    (when body_read is set).
+    """
+    def __init__(self, content, body_read: asyncio.Event, status_code: int = 200, headers=None, media_type=None,
+                 background=None):
+        super().__init__(content, status_code=status_code, headers=headers, media_type=media_type,
+                         background=background)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await self.body_read.wait()
+        await super().listen_for_disconnect(receive)
@@ -11,6 +11,22 @@ from fastapi.logger import logger as fastapi_logger
 # Some constants.
 BIOLINK_NAMED_THING = "biolink:NamedThing"
 
+# The key in curie_to_bl_type_db where the loader records the version of Babel that was loaded.
+BABEL_VERSION_KEY = "babel_version"
+
+# The key in curie_to_bl_type_db where the loader stores the table of Biolink ancestors for each type.
+BIOLINK_ANCESTORS_KEY = "biolink_ancestors"
+
+
+def get_preferred_label_key(canonical_id: str, conflation_db: str = None) -> str:
+    """
+    Return the key in preferred_label_db of the preferred label of a clique, or of the conflated clique it belongs
+    to in the conflation stored in conflation_db (e.g. 'gene_protein_db').
+    """
+    if conflation_db is None:
+        return canonical_id
+    return f"{conflation_db}|{canonical_id}"
+
 
 # loggers = {}
 class LoggingUtil(object):
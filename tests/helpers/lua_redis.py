@@ -0,0 +1,68 @@
+"""
+Run the Redis Lua scripts in node_normalizer/resources against in-memory tables, using lupa.
+
+Only the parts of the Redis scripting API that our scripts use are provided: redis.call() with SELECT and GET, and
+cjson.encode()/cjson.decode().
+"""
+import json
+from typing import Dict
+
+from lupa import LuaRuntime
+
+try:
+    # Redis runs Lua 5.1.
+    from lupa import lua51
+    LuaRuntime = lua51.LuaRuntime
+except ImportError:
+    pass
+
+
+class LuaRedisScript:
+    """
+    A Redis script that runs against a dict of tables (each a dict of string keys and values) keyed by database
+    number. It's called in the same way as node_normalizer.redis_adapter.RedisScript.
+    """
+    def __init__(self, script: str, databases: Dict[int, Dict[str, str]]):
+        self.databases = databases
+        self.selected = 0
+        self.calls = 0
+        self.lua = LuaRuntime(unpack_returned_tuples=True)
+        self.lua_type = self.lua.eval('type')
+
+        lua_globals = self.lua.globals()
+        lua_globals.redis = self.lua.table_from({'call': self.redis_call})
+        lua_globals.cjson = self.lua.table_from({
+            'encode': lambda value: json.dumps(self.to_python(value)),
+            'decode': lambda value: self.to_lua(json.loads(value)),
+        })
+        self.function = self.lua.eval('function(KEYS, ARGV)\n' + script + '\nend')
+
+    def redis_call(self, command, *args):
+        if command == 'SELECT':
+            self.selected = int(args[0])
+            return True
+        if command == 'GET':
+            # Redis converts nil replies to false.
+            value = self.databases.get(self.selected, {}).get(args[0])
+            return False if value is None else value
+        raise ValueError(f"Unsupported Redis command in script: {command}")
+
+    def to_python(self, value):
+        # Like cjson, tables with keys 1..n are arrays, and other tables (including empty ones) are objects.
+        if self.lua_type(value) != 'table':
+            return value
+        keys = list(value.keys())
+        if keys and sorted(keys) == list(range(1, len(keys) + 1)):
+            return [self.to_python(value[index]) for index in range(1, len(keys) + 1)]
+        return {key: self.to_python(value[key]) for key in keys}
+
+    def to_lua(self, value):
+        if isinstance(value, list):
+            return self.lua.table(*[self.to_lua(item) for item in value])
+        if isinstance(value, dict):
+            return self.lua.table_from({key: self.to_lua(item) for key, item in value.items()})
+        return value
+
+    async def __call__(self, keys=[], args=[]):
+        self.calls += 1
+        return self.function(self.lua.table(*keys), self.lua.table(*[str(arg) for arg in args]))
@@ -23,6 +23,21 @@ async def mock_get_equivalent_curies(app, curie):
         }
     return equivalent_curies
 
+
+async def mock_get_all_equivalent_curies(app, curies):
+    """
+    Mock the data returned by redis for a list of curies
+    """
+    return {
+        curie: (await mock_get_equivalent_curies(app, curie)).get(curie)
+        for curie in curies
+    }
+
+
 async def mock_get_ic(app, canonical_nonan) -> dict:
     return None
 
+
+async def mock_get_ic_attributes(app, canonical_nonan) -> dict:
+    return {canonical_id: None for canonical_id in canonical_nonan}
+
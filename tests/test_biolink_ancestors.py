@@ -0,0 +1,53 @@
+"""Test node_normalizer biolink_ancestors.py"""
+import json
+
+import pytest
+from starlette.datastructures import State
+from unittest.mock import Mock
+
+from node_normalizer.biolink_ancestors import read_bundled_ancestor_table, load_ancestor_table
+from node_normalizer.normalizer import create_node, get_ancestors
+from node_normalizer.util import BIOLINK_ANCESTORS_KEY
+
+
+class MockRedis:
+    def __init__(self, data):
+        self.data = data
+
+    async def get(self, key, **kwargs):
+        return self.data.get(key)
+
+
+def test_bundled_ancestor_table():
+    ancestor_table = read_bundled_ancestor_table()
+    gene_ancestors = ancestor_table["biolink:Gene"]
+    assert isinstance(gene_ancestors, tuple)
+    assert gene_ancestors[0] == "biolink:Gene"
+    assert "biolink:NamedThing" in gene_ancestors
+    assert "biolink:Entity" in gene_ancestors
+
+
+@pytest.mark.asyncio
+async def test_load_ancestor_table_from_redis():
+    stored = json.dumps({"biolink_version": "0.0.1", "ancestors": {"biolink:Gene": ["biolink:Gene", "biolink:Entity"]}})
+    assert await load_ancestor_table(MockRedis({BIOLINK_ANCESTORS_KEY: stored})) == \
+           {"biolink:Gene": ("biolink:Gene", "biolink:Entity")}
+
+    # If the loader didn't store a table, we use the bundled one.
+    assert await load_ancestor_table(MockRedis({})) == read_bundled_ancestor_table()
+
+
+@pytest.mark.asyncio
+async def test_create_node_does_not_modify_ancestors():
+    app = Mock()
+    app.state = State()
+    app.state.ancestor_map = read_bundled_ancestor_table()
+    types = {"NCBIGene:1": get_ancestors(app, "biolink:Gene")}
+
+    node = await create_node(app, "NCBIGene:1", {"NCBIGene:1": [{"i": "NCBIGene:1", "l": "gene one"}]}, types,
+                             {"NCBIGene:1": None})
+    assert "biolink:Entity" not in node["type"]
+    assert "biolink:Entity" in app.state.ancestor_map["biolink:Gene"]
+
+    # Types that aren't in the table are returned without any ancestors.
+    assert get_ancestors(app, "biolink:NotAType") == ("biolink:NotAType",)
@@ -0,0 +1,111 @@
+"""Test the bulk normalization jobs in node_normalizer/bulk_jobs.py"""
+import asyncio
+import fcntl
+import gzip
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from node_normalizer.bulk_jobs import BulkJobManager
+from .test_normalizer import mock_app
+
+
+async def chunks_of(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def read_results(result_file):
+    with gzip.open(result_file, 'rt') as f:
+        return [json.loads(line) for line in f]
+
+
+async def test_bulk_job(tmp_path):
+    app = mock_app()
+    bulk_jobs = BulkJobManager(str(tmp_path), batch_size=2, max_batches_in_flight=2)
+
+    curies = ["HGNC:1", "UniProtKB:P1", "UNKNOWN:1", "NCBIGene:1", "HGNC:1"]
+    body = ("\n".join(curies) + "\n\n").encode("utf-8")
+    status = await bulk_jobs.create_job(app, chunks_of(body, 5), conflate_gene_protein=True,
+                                        conflate_chemical_drug=False, fields=["id"])
+    job_id = status["job_id"]
+    assert status["status"] == "queued"
+    assert status["total_lines"] == 6
+    assert bulk_jobs.result_file(job_id) is None
+
+    await asyncio.gather(*bulk_jobs.tasks)
+    status = bulk_jobs.read_status(job_id)
+    assert status["status"] == "complete"
+    assert status["processed_lines"] == 5
+    assert status["options"]["fields"] == ["id"]
+
+    results = read_results(bulk_jobs.result_file(job_id))
+    assert [result["curie"] for result in results] == curies
+    assert results[2]["node"] is None
+    assert results[1]["node"] == {"id": {"identifier": "NCBIGene:1"}}
+
+    assert bulk_jobs.read_status("not-a-job") is None
+    assert bulk_jobs.read_status("../" + job_id) is None
+    assert bulk_jobs.delete_job(job_id)
+    assert bulk_jobs.read_status(job_id) is None
+
+
+async def test_resume_bulk_jobs(tmp_path):
+    """
+    Interrupted jobs are restarted by resume_jobs(), unless another process holds their lock, and old finished jobs
+    are removed.
+    """
+    app = mock_app()
+    bulk_jobs = BulkJobManager(str(tmp_path), retention_hours=1)
+    job_ids = []
+    for _ in range(3):
+        status = await bulk_jobs.create_job(app, chunks_of(b"HGNC:1\nNCBIGene:1", 100), conflate_gene_protein=False,
+                                            conflate_chemical_drug=False)
+        job_ids.append(status["job_id"])
+    # Pretend the jobs were interrupted before they started.
+    for task in bulk_jobs.tasks:
+        task.cancel()
+    await asyncio.gather(*bulk_jobs.tasks, return_exceptions=True)
+
+    old_status = bulk_jobs.read_status(job_ids[2])
+    old_status.update(status="complete", finished="2000-01-01T00:00:00+00:00")
+    bulk_jobs.write_status(job_ids[2], old_status)
+
+    with open(tmp_path / job_ids[1] / "lock", "wb") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        restarted = BulkJobManager(str(tmp_path), retention_hours=1)
+        restarted.resume_jobs(app)
+        await asyncio.gather(*restarted.tasks)
+
+    assert restarted.read_status(job_ids[0])["status"] == "complete"
+    assert [result["curie"] for result in read_results(restarted.result_file(job_ids[0]))] == ["HGNC:1", "NCBIGene:1"]
+    assert restarted.read_status(job_ids[1])["status"] == "queued"
+    assert restarted.read_status(job_ids[2]) is None
+
+
+async def test_bulk_job_upload_too_large(tmp_path):
+    bulk_jobs = BulkJobManager(str(tmp_path), max_upload_bytes=10)
+    with pytest.raises(HTTPException) as e:
+        await bulk_jobs.create_job(mock_app(), chunks_of(b"HGNC:1\nNCBIGene:1\n", 5), conflate_gene_protein=False,
+                                   conflate_chemical_drug=False)
+    assert e.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_queued_bulk_job_not_locked(tmp_path):
+    """
+    A job waiting for one of this process's job slots isn't locked, so that another process can run it.
+    """
+    app = mock_app()
+    bulk_jobs = BulkJobManager(str(tmp_path), max_running_jobs=1)
+    async with bulk_jobs.running_jobs:
+        status = await bulk_jobs.create_job(app, chunks_of(b"HGNC:1", 100), conflate_gene_protein=False,
+                                            conflate_chemical_drug=False)
+        await asyncio.sleep(0.01)
+        with open(tmp_path / status["job_id"] / "lock", "wb") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    await asyncio.gather(*bulk_jobs.tasks)
+    assert bulk_jobs.read_status(status["job_id"])["status"] == "complete"
@@ -0,0 +1,126 @@
+"""Test node_normalizer cache.py"""
+from node_normalizer.cache import CliqueRecordCache, NormalizationCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+OPTIONS = (True, False, True, False)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = NormalizationCache(max_size=2, ttl=60)
+    cache.put_many({"A:1": {"id": "A:1"}, "B:1": {"id": "B:1"}}, OPTIONS)
+
+    # Reading A:1 makes B:1 the least recently used entry.
+    found, missing = cache.get_many(["A:1"], OPTIONS)
+    assert found == {"A:1": {"id": "A:1"}} and missing == []
+
+    cache.put_many({"C:1": {"id": "C:1"}}, OPTIONS)
+    found, missing = cache.get_many(["A:1", "B:1", "C:1"], OPTIONS)
+    assert found == {"A:1": {"id": "A:1"}, "C:1": {"id": "C:1"}}
+    assert missing == ["B:1"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.hits == 3 and cache.misses == 1
+
+
+def test_cache_unknown_curies_separately():
+    """
+    CURIEs we couldn't normalize are cached separately for a shorter time, and don't evict normalized nodes.
+    """
+    clock = FakeClock()
+    cache = NormalizationCache(max_size=2, ttl=3600, unknown_max_size=2, unknown_ttl=60, clock=clock)
+    cache.put_many({"A:1": {"id": "A:1"}, "B:1": {"id": "B:1"}}, OPTIONS)
+    cache.put_many({f"UNKNOWN:{i}": None for i in range(5)}, OPTIONS)
+    assert len(cache) == 2 and cache.evictions == 0
+    assert len(cache.unknown) == 2 and cache.unknown.evictions == 3
+
+    found, missing = cache.get_many(["A:1", "B:1", "UNKNOWN:0", "UNKNOWN:4"], OPTIONS)
+    assert found == {"A:1": {"id": "A:1"}, "B:1": {"id": "B:1"}, "UNKNOWN:4": None}
+    assert missing == ["UNKNOWN:0"]
+    assert cache.hits == 3 and cache.misses == 1
+
+    clock.now = 61
+    found, missing = cache.get_many(["A:1", "UNKNOWN:4"], OPTIONS)
+    assert found == {"A:1": {"id": "A:1"}} and missing == ["UNKNOWN:4"]
+    assert cache.stats()["unknown_curies"]["ttl"] == 60
+
+    cache.set_version("2024feb1")
+    assert len(cache) == 0 and len(cache.unknown) == 0
+
+    # Without room for them, unknown CURIEs aren't cached at all.
+    cache = NormalizationCache(max_size=2, ttl=3600)
+    cache.put_many({"UNKNOWN:1": None}, OPTIONS)
+    assert cache.get_many(["UNKNOWN:1"], OPTIONS) == ({}, ["UNKNOWN:1"])
+
+
+def test_cache_keys_include_options():
+    cache = NormalizationCache(max_size=10, ttl=60)
+    cache.put_many({"A:1": {"id": "A:1"}}, OPTIONS)
+    found, missing = cache.get_many(["A:1"], (False, False, True, False))
+    assert found == {} and missing == ["A:1"]
+
+
+def test_cache_expires_entries():
+    clock = FakeClock()
+    cache = NormalizationCache(max_size=10, ttl=60, clock=clock)
+    cache.put_many({"A:1": {"id": "A:1"}}, OPTIONS)
+
+    clock.now = 60
+    assert cache.get_many(["A:1"], OPTIONS)[1] == []
+    clock.now = 61
+    assert cache.get_many(["A:1"], OPTIONS)[1] == ["A:1"]
+    assert len(cache) == 0
+
+
+def test_cache_cleared_on_version_change():
+    cache = NormalizationCache(max_size=10, ttl=60)
+    cache.set_version("2024jan1")
+    cache.put_many({"A:1": {"id": "A:1"}}, OPTIONS)
+
+    cache.set_version("2024jan1")
+    assert len(cache) == 1
+    cache.set_version("2024feb1")
+    assert len(cache) == 0
+    assert cache.version == "2024feb1"
+
+
+def test_cache_from_environment(monkeypatch):
+    monkeypatch.setenv("NORMALIZATION_CACHE_SIZE", "0")
+    assert NormalizationCache.from_environment() is None
+
+    monkeypatch.setenv("NORMALIZATION_CACHE_SIZE", "5")
+    monkeypatch.setenv("NORMALIZATION_CACHE_TTL", "10")
+    monkeypatch.setenv("NORMALIZATION_CACHE_UNKNOWN_SIZE", "3")
+    monkeypatch.setenv("NORMALIZATION_CACHE_UNKNOWN_TTL", "2")
+    cache = NormalizationCache.from_environment()
+    assert cache.max_size == 5 and cache.ttl == 10
+    assert cache.unknown.max_size == 3 and cache.unknown.ttl == 2
+
+    monkeypatch.setenv("NORMALIZATION_CACHE_UNKNOWN_SIZE", "0")
+    assert NormalizationCache.from_environment().unknown is None
+
+
+def test_clique_cache_evicts_by_size():
+    cache = CliqueRecordCache(max_bytes=1000)
+    cache.put_many({"A:1": (["a"], 400), "B:1": (["b"], 400)}, "eqids")
+    cache.put_many({"A:1": (1.0, 100)}, "info_content")
+    assert cache.total_bytes == 900
+
+    # Records of different kinds are cached separately.
+    found, missing = cache.get_many(["A:1", "B:1"], "info_content")
+    assert found == {"A:1": 1.0} and missing == ["B:1"]
+
+    # Adding a large record evicts the least recently used records until we're back under the limit.
+    cache.put_many({"C:1": (["c"], 500)}, "eqids")
+    assert cache.get_many(["A:1", "B:1", "C:1"], "eqids") == ({"B:1": ["b"], "C:1": ["c"]}, ["A:1"])
+    assert cache.total_bytes == 1000
+    assert cache.evictions == 1
+
+    cache.set_version("2024feb1")
+    assert cache.total_bytes == 0 and len(cache) == 0
@@ -0,0 +1,154 @@
+"""Test the response compression and request decompression middleware"""
+import gzip
+
+import orjson
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from node_normalizer.compression import CompressionMiddleware, DecompressionMiddleware, negotiate_encoding, \
+    COMPRESSORS
+
+BODY = {"curies": [f"NCBIGene:{i}" for i in range(5000)]}
+
+
+def make_client(**options):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, **options)
+
+    @app.get("/large")
+    async def large():
+        return ORJSONResponse(BODY)
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("small")
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for i in range(100):
+                yield f"line {i}\n" * 50
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate", ["zstd", "br", "gzip"]) == "gzip"
+    assert negotiate_encoding("gzip;q=0.5, br", ["zstd", "br", "gzip"]) == "br"
+    assert negotiate_encoding("*", ["zstd", "br", "gzip"]) == "zstd"
+    assert negotiate_encoding("*, zstd;q=0", ["zstd", "br", "gzip"]) == "br"
+    assert negotiate_encoding("identity", ["zstd", "br", "gzip"]) is None
+    assert negotiate_encoding("", ["gzip"]) is None
+
+
+def test_gzip():
+    client = make_client(encodings=["gzip"], chunk_size=4096)
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.json() == BODY
+
+    # Small responses and clients that don't accept gzip get uncompressed responses.
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == "small"
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == BODY
+
+
+def test_streaming():
+    client = make_client(encodings=["gzip"])
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode("utf-8") == "".join(f"line {i}\n" * 50 for i in range(100))
+
+
+def test_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    client = make_client(chunk_size=4096)
+    with client.stream("GET", "/large", headers={"Accept-Encoding": "zstd, gzip"}) as response:
+        assert response.headers["content-encoding"] == "zstd"
+        raw = b"".join(response.iter_raw())
+    decompressed = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    assert decompressed == ORJSONResponse(BODY).body
+
+
+def test_brotli():
+    brotli = pytest.importorskip("brotli")
+    client = make_client(levels={"br": 5})
+    with client.stream("GET", "/large", headers={"Accept-Encoding": "br"}) as response:
+        assert response.headers["content-encoding"] == "br"
+        raw = b"".join(response.iter_raw())
+    assert brotli.decompress(raw) == ORJSONResponse(BODY).body
+
+
+def test_unavailable_encodings_are_ignored():
+    middleware = CompressionMiddleware(None, encodings=["nonsense", "gzip"])
+    assert middleware.encodings == ["gzip"]
+    assert "gzip" in COMPRESSORS
+
+
+def make_echo_client(**options):
+    app = FastAPI()
+    app.add_middleware(DecompressionMiddleware, **options)
+
+    @app.post("/echo")
+    async def echo(body: dict):
+        return body
+
+    @app.post("/raw")
+    async def raw(request: Request):
+        body = await request.body()
+        return {"length": len(body), "content-encoding": request.headers.get("content-encoding")}
+
+    return TestClient(app)
+
+
+def test_gzip_request_body():
+    client = make_echo_client(max_size=1024 * 1024)
+    body = orjson.dumps(BODY)
+    response = client.post("/echo", content=gzip.compress(body),
+                           headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 200
+    assert response.json() == BODY
+
+    response = client.post("/raw", content=gzip.compress(body), headers={"Content-Encoding": "gzip"})
+    assert response.json() == {"length": len(body), "content-encoding": None}
+
+    # Uncompressed bodies are passed through.
+    response = client.post("/echo", json=BODY)
+    assert response.json() == BODY
+
+
+def test_request_body_errors():
+    client = make_echo_client(max_size=10_000)
+    response = client.post("/echo", content=gzip.compress(b"0" * 1_000_000),
+                           headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 413
+    response = client.post("/raw", content=gzip.compress(b"0" * 1_000_000), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
+
+    response = client.post("/echo", content=b"not gzip",
+                           headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 400
+
+    response = client.post("/echo", content=b"{}", headers={"Content-Encoding": "compress"})
+    assert response.status_code == 415
+
+
+def test_zstd_request_body():
+    zstandard = pytest.importorskip("zstandard")
+    client = make_echo_client(max_size=1024 * 1024)
+    body = orjson.dumps(BODY)
+    response = client.post("/echo", content=zstandard.ZstdCompressor().compress(body),
+                           headers={"Content-Encoding": "zstd", "Content-Type": "application/json"})
+    assert response.json() == BODY
+
+    response = client.post("/raw", content=zstandard.ZstdCompressor().compress(b"0" * 10_000_000),
+                           headers={"Content-Encoding": "zstd"})
+    assert response.status_code == 413
@@ -15,6 +15,8 @@ from reasoner_pydantic import Response
 # Need to add to sources root to avoid linter warnings
 from .helpers.redis_mocks import mock_get_equivalent_curies
 from .helpers.redis_mocks import mock_get_ic
+from .helpers.redis_mocks import mock_get_all_equivalent_curies
+from .helpers.redis_mocks import mock_get_ic_attributes
 
 premerged_response = Path(__file__).parent / "resources" / "premerged_response.json"
 postmerged_response = Path(__file__).parent / "resources" / "postmerged_response.json"
@@ -43,6 +45,14 @@ class TestServer:
         "node_normalizer.normalizer.get_info_content_attribute",
         Mock(side_effect=mock_get_ic),
     )
+    @patch(
+        "node_normalizer.normalizer.get_all_equivalent_curies",
+        Mock(side_effect=mock_get_all_equivalent_curies),
+    )
+    @patch(
+        "node_normalizer.normalizer.get_info_content_attributes",
+        Mock(side_effect=mock_get_ic_attributes),
+    )
     def test_message_normalize_endpoint(self):
         """
         TODO turn this into a parametrized test for various cases
@@ -68,6 +78,84 @@ class TestServer:
         # assert diffs is None
         assert len(diffs) == 0
 
+    @patch(
+        "node_normalizer.normalizer.get_all_equivalent_curies",
+        Mock(side_effect=mock_get_all_equivalent_curies),
+    )
+    @patch(
+        "node_normalizer.normalizer.get_info_content_attributes",
+        Mock(side_effect=mock_get_ic_attributes),
+    )
+    @patch("node_normalizer.server.TRAPI_VALIDATION", False)
+    def test_message_normalize_without_validation(self):
+        """
+        Skipping validation gives the same result for valid messages, and invalid ones are still passed through.
+        """
+        with open(premerged_response, "r") as pre:
+            premerged_data = json.load(pre)
+
+        with open(postmerged_response, "r") as post:
+            postmerged_from_file = json.load(post)
+
+        response = self.test_client.post("/query", json=premerged_data)
+        diffs = DeepDiff(postmerged_from_file, json.loads(response.text), ignore_order=True)
+        assert len(diffs) == 0
+
+        premerged_data["message"]["knowledge_graph"]["edges"]["invalid"] = {
+            "subject": "HGNC:11603", "object": "MONDO:0005002"
+        }
+        response = self.test_client.post("/query", json=premerged_data)
+        assert response.status_code == 200
+        assert response.json()["message"]["knowledge_graph"]["edges"]["invalid"]["subject"] == "NCBIGene:9496"
+
+        assert self.test_client.post("/query", json={"message": []}).status_code == 422
+
+    def test_message_normalize_invalid(self):
+        assert self.test_client.post("/query", content=b'{"message": ').status_code == 422
+
+        response = self.test_client.post("/query", json={"message": {"knowledge_graph": {"nodes": []}}})
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"][:3] == ["body", "message", "knowledge_graph"]
+
+    @patch(
+        "node_normalizer.normalizer.get_all_equivalent_curies",
+        Mock(side_effect=mock_get_all_equivalent_curies),
+    )
+    @patch(
+        "node_normalizer.normalizer.get_info_content_attributes",
+        Mock(side_effect=mock_get_ic_attributes),
+    )
+    def test_message_normalize_drops_nulls(self):
+        """
+        Nulls in the query aren't echoed back, just as they weren't when the response was serialized with pydantic.
+        """
+        query = {
+            "message": {
+                "query_graph": {
+                    "nodes": {"n0": {"ids": ["HGNC:11603"], "categories": None}, "n1": {"ids": None}},
+                    "edges": {"e0": {"subject": "n0", "object": "n1", "predicates": None}},
+                },
+                "knowledge_graph": {
+                    "nodes": {"HGNC:11603": {"name": None, "categories": ["biolink:Gene"], "attributes": [
+                        {"attribute_type_id": "biolink:has_attribute", "value": {"a": None}, "value_url": None},
+                    ]}},
+                    "edges": {},
+                },
+                "results": None,
+            },
+            "log_level": None,
+        }
+        response = self.test_client.post("/query", json=query)
+        assert response.status_code == 200
+        normalized = response.json()
+        assert "log_level" not in normalized
+        assert "results" not in normalized["message"]
+        assert normalized["message"]["query_graph"]["nodes"]["n1"] == {"is_set": False, "constraints": []}
+        assert "predicates" not in normalized["message"]["query_graph"]["edges"]["e0"]
+        [attribute] = [attribute for attribute in normalized["message"]["knowledge_graph"]["nodes"]["NCBIGene:9496"]
+                       ["attributes"] if attribute["attribute_type_id"] == "biolink:has_attribute"]
+        assert attribute == {"attribute_type_id": "biolink:has_attribute", "value": {"a": None}}
+
     # unless these nodes are added to the mock-redis, this won't run
     def x_test_real_result(self):
         with open("resources/ac_out_attributes.json", "r") as pre:
@@ -88,6 +176,14 @@ class TestServer:
         "node_normalizer.normalizer.get_info_content_attribute",
         Mock(side_effect=mock_get_ic),
     )
+    @patch(
+        "node_normalizer.normalizer.get_all_equivalent_curies",
+        Mock(side_effect=mock_get_all_equivalent_curies),
+    )
+    @patch(
+        "node_normalizer.normalizer.get_info_content_attributes",
+        Mock(side_effect=mock_get_ic_attributes),
+    )
     def test_dupe_edge(self):
         """
         TODO turn this into a parametrized test for various cases
@@ -119,6 +215,14 @@ class TestServer:
         "node_normalizer.normalizer.get_info_content_attribute",
         Mock(side_effect=mock_get_ic),
     )
+    @patch(
+        "node_normalizer.normalizer.get_all_equivalent_curies",
+        Mock(side_effect=mock_get_all_equivalent_curies),
+    )
+    @patch(
+        "node_normalizer.normalizer.get_info_content_attributes",
+        Mock(side_effect=mock_get_ic_attributes),
+    )
     def test_input_has_set(self):
         """
         Node normalizer is doing something bad with nodes when there are more than one knodes bound to a single qnode
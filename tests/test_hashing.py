@@ -0,0 +1,59 @@
+"""Test the content hashes in node_normalizer/hashing.py"""
+import pytest
+from reasoner_pydantic import Attribute, CURIE
+
+from node_normalizer.hashing import DIGEST_SIZE, attributes_hash, content_hash
+from node_normalizer.normalizer import normalize_kgraph_dict
+from .test_normalizer import mock_app
+
+
+def test_content_hash():
+    value = {"id": "NCBIGene:1", "qualifiers": [{"type": "a", "value": {"b": [1, 2.5, None]}}]}
+    reordered = {"qualifiers": [{"value": {"b": [1, 2.5, None]}, "type": "a"}], "id": "NCBIGene:1"}
+    assert len(content_hash(value)) == DIGEST_SIZE
+    assert content_hash(value) == content_hash(reordered)
+    # Lists are ordered, dicts aren't.
+    assert content_hash([1, 2]) != content_hash([2, 1])
+    assert content_hash({"a": 1}) != content_hash({"a": "1"})
+    # Values that aren't JSON can still be hashed.
+    assert content_hash({"a": {3, 1, 2}}) == content_hash({"a": {2, 3, 1}})
+    assert content_hash(2 ** 70) != content_hash(2 ** 70 + 1)
+
+
+def test_attributes_hash():
+    attribute1 = {"attribute_type_id": "foo:bar", "value": {"nested": {"deeply": [1, 2]}}}
+    attribute2 = {"attribute_type_id": "foo:bar", "value": 2, "value_type_id": None}
+    assert attributes_hash([attribute1, attribute2]) == attributes_hash([attribute2, attribute1, attribute1])
+    assert attributes_hash([attribute2]) == attributes_hash([{**attribute2, "value_type_id": ""}])
+    assert attributes_hash([attribute1]) != attributes_hash([attribute2])
+    assert attributes_hash(None) == attributes_hash(None)
+    assert attributes_hash(None) != attributes_hash([])
+
+    pydantic_attribute = Attribute(attribute_type_id=CURIE("foo:bar"), value=attribute1["value"])
+    assert attributes_hash([pydantic_attribute.dict()]) == attributes_hash([attribute1])
+
+
+@pytest.mark.asyncio
+async def test_kgraph_edges_with_nested_attributes_merged():
+    """
+    Edges that are the same once their nodes are normalized are merged, even if their attributes have nested values.
+    """
+    source = {"resource_id": "infores:test", "resource_role": "primary_knowledge_source"}
+    attributes = [{"attribute_type_id": "biolink:has_attribute", "value": {"a": {"b": [1, 2]}}}]
+    kgraph = {
+        "nodes": {
+            node_id: {"categories": ["biolink:NamedThing"]} for node_id in ["HGNC:1", "NCBIGene:1", "UNKNOWN:1"]
+        },
+        "edges": {
+            "e1": {"subject": "HGNC:1", "predicate": "biolink:related_to", "object": "UNKNOWN:1",
+                   "sources": [source], "attributes": attributes},
+            "e2": {"subject": "NCBIGene:1", "predicate": "biolink:related_to", "object": "UNKNOWN:1",
+                   "sources": [source], "attributes": list(reversed(attributes * 2))},
+            "e3": {"subject": "NCBIGene:1", "predicate": "biolink:related_to", "object": "UNKNOWN:1",
+                   "sources": [source], "attributes": []},
+        },
+    }
+
+    merged_kgraph, node_id_map, edge_id_map = await normalize_kgraph_dict(mock_app(), kgraph)
+    assert edge_id_map == {"e1": "e1", "e2": "e1", "e3": "e3"}
+    assert set(merged_kgraph["edges"].keys()) == {"e1", "e3"}
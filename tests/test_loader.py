@@ -1,4 +1,5 @@
 from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -27,3 +28,47 @@ def test_nn_record_validation():
     ret_val = node_loader.validate_compendia(bad_json)
 
     assert not ret_val
+
+
+async def test_nn_load_without_preferred_label_db():
+    """
+    Preferred labels aren't precomputed if redis_config.yaml doesn't configure preferred_label_db.
+    """
+    node_loader: NodeLoader = NodeLoader()
+    node_loader._test_mode = 1
+
+    with patch.object(NodeLoader, "get_redis", AsyncMock(return_value=MagicMock())) as get_redis:
+        assert await node_loader.load_compendium(good_json, 5, None)
+        get_redis.assert_any_await("info_content_db")
+        assert all(call.args != ("preferred_label_db",) for call in get_redis.await_args_list)
+
+        get_redis.reset_mock()
+        await node_loader.load_conflation_labels("gene_protein_db", [["NCBIGene:1", "UniProtKB:P1"]], None)
+        get_redis.assert_not_awaited()
+
+
+async def test_nn_load_connects_to_preferred_label_db_once():
+    """
+    The preferred_label_db connection is looked up once per load, and shared by every compendium and conflation.
+    """
+    node_loader: NodeLoader = NodeLoader()
+    node_loader._test_mode = 1
+    node_loader._data_files = ["a.txt", "b.txt"]
+    node_loader._conflations = [{"file": "c.txt", "redis_db": "gene_protein_db"},
+                                {"file": "d.txt", "redis_db": "chemical_drug_db"}]
+    preferred_label_redis = MagicMock()
+
+    with patch.object(NodeLoader, "get_redis", AsyncMock(return_value=MagicMock())), \
+            patch.object(NodeLoader, "get_optional_redis", AsyncMock(return_value=preferred_label_redis)) as get_optional_redis, \
+            patch.object(NodeLoader, "get_compendia", MagicMock(return_value=["a.txt", "b.txt"])), \
+            patch.object(NodeLoader, "validate_compendia", MagicMock(return_value=True)), \
+            patch.object(NodeLoader, "load_compendium", AsyncMock(return_value=True)) as load_compendium, \
+            patch.object(NodeLoader, "load_conflation", AsyncMock(return_value=True)) as load_conflation, \
+            patch.object(NodeLoader, "merge_semantic_meta_data", AsyncMock()), \
+            patch.object(NodeLoader, "record_biolink_ancestors", AsyncMock()), \
+            patch.object(NodeLoader, "record_babel_version", AsyncMock()):
+        assert await node_loader.load(5)
+
+    get_optional_redis.assert_awaited_once_with("preferred_label_db")
+    assert [call.args[2] for call in load_compendium.await_args_list] == [preferred_label_redis] * 2
+    assert [call.args[2] for call in load_conflation.await_args_list] == [preferred_label_redis] * 2
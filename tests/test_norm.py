@@ -1,12 +1,20 @@
 """Test node_normalizer server.py"""
+import asyncio
+import collections
+import gzip
 import json
-from node_normalizer.server import app
+import pytest
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from node_normalizer.server import app, parse_curie_list, get_normalized_node_handler_post_raw
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch
 from .helpers.redis_mocks import mock_get_equivalent_curies, mock_get_ic
 from pathlib import Path
 import os
-from bmt import Toolkit
+from node_normalizer.biolink_ancestors import read_bundled_ancestor_table
+from node_normalizer import response_formats
+from node_normalizer.bulk_jobs import BulkJobManager
 
 
 class MockRedis:
@@ -30,8 +38,7 @@ app.state.curie_to_bl_type_db = MockRedis({})
 app.state.info_content_db = MockRedis({})
 app.state.gene_protein_db = MockRedis({})
 #app.state.ancestor_map = {"biolink:Disease": ["biolink:Disease", "biolink:NamedThing"]}
-app.state.toolkit = Toolkit()
-app.state.ancestor_map = {}
+app.state.ancestor_map = read_bundled_ancestor_table()
 
 
 def test_not_found():
@@ -93,6 +100,186 @@ def test_merge():
     assert result["MONDO:0005002"]["type"][0] == "biolink:Disease"
 
 
+def test_fields():
+    client = TestClient(app)
+    response = client.get(
+        "/get_normalized_nodes", params={"curie": ["DOID:3812", "UNKNOWN:000000"], "fields": ["id", "type"]}
+    )
+    result = json.loads(response.text)
+    assert result["UNKNOWN:000000"] is None
+    assert set(result["DOID:3812"].keys()) == {"id", "type"}
+    assert result["DOID:3812"]["id"] == {"identifier": "MONDO:0005002"}
+    assert result["DOID:3812"]["type"][0] == "biolink:Disease"
+
+    response = client.post("/get_normalized_nodes", json={"curies": ["DOID:3812"], "fields": ["equivalent_identifiers"]})
+    result = json.loads(response.text)
+    assert result == {"DOID:3812": {"equivalent_identifiers": [{"identifier": "MONDO:0005002"},
+                                                               {"identifier": "DOID:3812"}]}}
+
+    response = client.get("/get_normalized_nodes", params={"curie": ["DOID:3812"], "fields": ["nonsense"]})
+    assert response.status_code == 422
+
+
+def test_equivalent_identifiers_pages():
+    client = TestClient(app)
+    response = client.get(
+        "/get_normalized_nodes", params={"curie": ["DOID:3812"], "max_equivalent_identifiers": 1}
+    )
+    result = json.loads(response.text)
+    assert result["DOID:3812"]["equivalent_identifiers"] == [{"identifier": "MONDO:0005002"}]
+    assert result["DOID:3812"]["equivalent_identifiers_count"] == 2
+
+    response = client.get("/get_equivalent_identifiers", params={"curie": "DOID:3812", "offset": 1, "limit": 1})
+    result = json.loads(response.text)
+    assert result == {
+        "identifier": "MONDO:0005002",
+        "equivalent_identifiers_count": 2,
+        "offset": 1,
+        "limit": 1,
+        "equivalent_identifiers": [{"identifier": "DOID:3812"}],
+    }
+
+    response = client.get("/get_equivalent_identifiers", params={"curie": "UNKNOWN:000000"})
+    assert response.status_code == 404
+
+
+def test_filters():
+    client = TestClient(app)
+    response = client.get(
+        "/get_normalized_nodes", params={"curie": ["DOID:3812"], "exclude_prefixes": ["MONDO"]}
+    )
+    result = json.loads(response.text)
+    assert result["DOID:3812"]["equivalent_identifiers"] == [{"identifier": "DOID:3812"}]
+
+    response = client.post("/get_normalized_nodes", json={"curies": ["DOID:3812"], "require_type": "biolink:Gene"})
+    assert json.loads(response.text) == {"DOID:3812": None}
+
+
+def test_curie_prefixes():
+    class MockTypeRedis(MockRedis):
+        async def get(self, key, **kwargs):
+            return self.data.get(key)
+
+    client = TestClient(app)
+    curie_to_bl_type_db = app.state.curie_to_bl_type_db
+    app.state.curie_to_bl_type_db = MockTypeRedis({"biolink:Disease": json.dumps({"MONDO": 10, "DOID": 2})})
+    try:
+        response = client.get("/get_curie_prefixes", params={"semantic_type": ["biolink:Disease", "biolink:Gene"]})
+    finally:
+        app.state.curie_to_bl_type_db = curie_to_bl_type_db
+    assert response.headers["content-type"] == "application/json"
+    assert json.loads(response.text) == {
+        "biolink:Disease": {"curie_prefix": {"MONDO": "10", "DOID": "2"}},
+        "biolink:Gene": {"curie_prefix": {"biolink:Gene": "Not found"}},
+    }
+
+
+def test_raw_post_parsing():
+    """
+    The minimal parser used with RAW_POST_PARSING=true accepts the same queries as CurieList.
+    """
+    curies = parse_curie_list(b'{"curies": ["DOID:3812"], "conflate": false, "fields": ["id"], "max_equivalent_identifiers": 2}')
+    assert curies.curies == ["DOID:3812"]
+    assert curies.conflate is False
+    assert curies.drug_chemical_conflate is False
+    assert curies.fields == ["id"]
+    assert curies.max_equivalent_identifiers == 2
+    assert curies.require_type is None
+
+    for body, loc in [
+        (b'{"curies": []}', ["body", "curies"]),
+        (b'{"curies": "DOID:3812"}', ["body", "curies"]),
+        (b'{"curies": ["DOID:3812", 1]}', ["body", "curies", 1]),
+        (b'{"curies": ["DOID:3812"], "conflate": "yes"}', ["body", "conflate"]),
+        (b'{"curies": ["DOID:3812"], "max_equivalent_identifiers": true}', ["body", "max_equivalent_identifiers"]),
+        (b'{"curies": ["DOID:3812"], "fields": ["nonsense"]}', ["body", "fields"]),
+        (b'["DOID:3812"]', ["body"]),
+        (b'{"curies": ', ["body"]),
+    ]:
+        with pytest.raises(RequestValidationError) as exc_info:
+            parse_curie_list(body)
+        assert list(exc_info.value.errors()[0]["loc"]) == loc
+
+    # Try the raw handler on a separate path, since the route is chosen when the server is imported.
+    app.router.add_api_route("/test_raw_post_parsing", get_normalized_node_handler_post_raw, methods=["POST"])
+    client = TestClient(app)
+    response = client.post("/test_raw_post_parsing", json={"curies": ["DOID:3812"], "fields": ["id"]})
+    assert json.loads(response.text) == {"DOID:3812": {"id": {"identifier": "MONDO:0005002"}}}
+    response = client.post("/test_raw_post_parsing", json={"curies": []})
+    assert response.status_code == 422
+    assert json.loads(response.text)["detail"][0]["msg"] == "ensure this value has at least 1 items"
+
+
+def test_compressed_request_body():
+    client = TestClient(app)
+    body = gzip.compress(json.dumps({"curies": ["DOID:3812"], "fields": ["id"]}).encode("utf-8"))
+    response = client.post("/get_normalized_nodes", content=body,
+                           headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert json.loads(response.text) == {"DOID:3812": {"id": {"identifier": "MONDO:0005002"}}}
+
+
+def test_binary_formats():
+    client = TestClient(app)
+    params = {"curie": ["DOID:3812", "UNKNOWN:000000"]}
+
+    # Clients that don't ask for a binary format get JSON.
+    response = client.get("/get_normalized_nodes", params=params, headers={"Accept": "text/html, */*;q=0.8"})
+    assert response.headers["content-type"] == "application/json"
+
+    if response_formats.msgpack is None:
+        response = client.get("/get_normalized_nodes", params=params, headers={"Accept": "application/msgpack"})
+        assert response.status_code == 406
+    else:
+        response = client.post("/get_normalized_nodes", json={"curies": params["curie"]},
+                               headers={"Accept": "application/msgpack"})
+        assert response.headers["content-type"] == "application/msgpack"
+        result = response_formats.msgpack.unpackb(response.content)
+        assert result["UNKNOWN:000000"] is None
+        assert result["DOID:3812"]["id"]["identifier"] == "MONDO:0005002"
+
+    pyarrow = pytest.importorskip("pyarrow")
+    response = client.get("/get_normalized_nodes", params={**params, "fields": ["id", "type"]},
+                          headers={"Accept": "application/vnd.apache.arrow.stream"})
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    assert table.to_pydict() == {
+        "curie": ["DOID:3812", "UNKNOWN:000000"],
+        "identifier": ["MONDO:0005002", None],
+        "label": [None, None],
+        "type": ["biolink:Disease", None],
+        "information_content": [None, None],
+        "equivalent_identifiers": [None, None],
+    }
+
+
+def test_choose_media_type():
+    assert response_formats.choose_media_type("") == "application/json"
+    assert response_formats.choose_media_type("application/json, application/msgpack") == "application/json"
+    assert response_formats.choose_media_type("text/plain") == "application/json"
+    if response_formats.msgpack is not None:
+        assert response_formats.choose_media_type("application/json;q=0.5, application/msgpack") == \
+               "application/msgpack"
+    if response_formats.pyarrow is None:
+        with pytest.raises(HTTPException) as exc_info:
+            response_formats.choose_media_type("application/vnd.apache.arrow.stream")
+        assert exc_info.value.status_code == 406
+
+
+def test_canonical_ids():
+    client = TestClient(app)
+    response = client.get(
+        "/get_canonical_ids", params={"curie": ["DOID:3812", "UNKNOWN:000000"], "include_type": True}
+    )
+    result = json.loads(response.text)
+    assert result == {
+        "DOID:3812": {"identifier": "MONDO:0005002", "type": "biolink:Disease"},
+        "UNKNOWN:000000": None,
+    }
+
+    response = client.post("/get_canonical_ids", json={"curies": ["DOID:3812"]})
+    assert json.loads(response.text) == {"DOID:3812": {"identifier": "MONDO:0005002"}}
+
+
 def test_empty():
     client = TestClient(app)
 
@@ -111,3 +298,98 @@ def test_empty():
     result = json.loads(response.text)
     assert result["detail"][0]["msg"] == "ensure this value has at least 1 items"
     assert result["detail"][0]["loc"] == ["body", "curies"]
+
+
+class MockNormalizationScript:
+    """
+    Mimics resources/normalize_nodes.lua against the MockRedis tables above.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, keys=[], args=[]):
+        self.calls += 1
+        canonical_ids = [app.state.eq_id_to_id_db.data.get(key, False) for key in keys]
+        found = [canonical_id for canonical_id in canonical_ids if canonical_id]
+        return json.dumps({
+            "canonical_ids": canonical_ids,
+            "eqids": {c: app.state.id_to_eqids_db.data.get(c, False) for c in found},
+            "types": {c: app.state.id_to_type_db.data.get(c, False) for c in found},
+            "info_contents": {c: app.state.info_content_db.data.get(c, False) for c in found},
+            # One (empty) object for the gene/protein conflation, which is on by default.
+            "conflations": [{}],
+            # There's no preferred_label_db.
+            "preferred_labels": {},
+        })
+
+
+def test_normalization_script():
+    """
+    The single round-trip normalization script should give the same results as the MGET path.
+    """
+    client = TestClient(app)
+    params = {"curie": ["UNKNOWN:000000", "DOID:3812", "MONDO:0005002"]}
+    expected = json.loads(client.get("/get_normalized_nodes", params=params).text)
+
+    app.state.normalization_script = MockNormalizationScript()
+    app.state.normalization_script_databases = collections.defaultdict(int)
+    try:
+        result = json.loads(client.get("/get_normalized_nodes", params=params).text)
+        assert app.state.normalization_script.calls == 1
+
+        # Requests with more CURIEs than REDIS_SCRIPT_MAX_CURIES, or that only need some of the tables, use MGETs.
+        app.state.normalization_script_max_curies = 2
+        assert json.loads(client.get("/get_normalized_nodes", params=params).text) == expected
+        del app.state.normalization_script_max_curies
+        client.get("/get_normalized_nodes", params={**params, "fields": ["id"]})
+        assert app.state.normalization_script.calls == 1
+    finally:
+        app.state.normalization_script = None
+
+    assert result == expected
+    assert result["DOID:3812"]["id"]["identifier"] == "MONDO:0005002"
+
+
+def test_normalized_nodes_stream():
+    client = TestClient(app)
+    response = client.post("/get_normalized_nodes/stream", params={"fields": ["id"]},
+                           content=b'DOID:3812\n{"curie": "UNKNOWN:000000"}\n')
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"curie": "DOID:3812", "node": {"id": {"identifier": "MONDO:0005002"}}},
+        {"curie": "UNKNOWN:000000", "node": None},
+    ]
+
+
+def test_bulk_jobs(tmp_path):
+    bulk_jobs = BulkJobManager(str(tmp_path))
+    app.state.bulk_jobs = bulk_jobs
+    client = TestClient(app)
+    try:
+        # Run the job ourselves, since the TestClient doesn't keep an event loop running between requests.
+        with patch.object(bulk_jobs, "start_job"):
+            response = client.post("/bulk_jobs", params={"fields": ["id"]}, content=b"DOID:3812\nUNKNOWN:000000\n")
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.json()["status_url"] == f"/bulk_jobs/{job_id}"
+
+        assert client.get(f"/bulk_jobs/{job_id}").json()["status"] == "queued"
+        assert client.get(f"/bulk_jobs/{job_id}/result").status_code == 409
+
+        asyncio.run(bulk_jobs.run_job(app, job_id))
+        status = client.get(f"/bulk_jobs/{job_id}").json()
+        assert (status["status"], status["total_lines"], status["processed_lines"]) == ("complete", 2, 2)
+
+        response = client.get(f"/bulk_jobs/{job_id}/result", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-type"] == "application/gzip"
+        assert "content-encoding" not in response.headers
+        assert [json.loads(line) for line in gzip.decompress(response.content).splitlines()] == [
+            {"curie": "DOID:3812", "node": {"id": {"identifier": "MONDO:0005002"}}},
+            {"curie": "UNKNOWN:000000", "node": None},
+        ]
+
+        assert client.delete(f"/bulk_jobs/{job_id}").status_code == 204
+        assert client.get(f"/bulk_jobs/{job_id}").status_code == 404
+        assert client.get("/bulk_jobs/UNKNOWN/result").status_code == 404
+    finally:
+        app.state.bulk_jobs = None
@@ -7,14 +7,24 @@ from fastapi.encoders import jsonable_encoder
 from copy import deepcopy
 
 from deepdiff import DeepDiff
-from reasoner_pydantic import KnowledgeGraph, Attribute, CURIE
+from reasoner_pydantic import KnowledgeGraph, Attribute, CURIE, Message, Result
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 # Need to add to sources root to avoid linter warnings
-from .helpers.redis_mocks import mock_get_equivalent_curies, mock_get_ic
+from .helpers.redis_mocks import mock_get_all_equivalent_curies, mock_get_ic_attributes
+from starlette.datastructures import State
+
+from node_normalizer.cache import CliqueRecordCache, NormalizationCache
 from node_normalizer.normalizer import (
     normalize_kgraph,
+    normalize_message,
+    normalize_results,
+    normalize_results_dict,
+    get_normalized_nodes,
+    get_canonical_ids,
+    get_equivalent_identifiers_page,
+    choose_preferred_label,
     _hash_attributes,
     _merge_node_attributes,
 )
@@ -106,6 +116,55 @@ def float_or_none(x):
         return None
 
 
+class CountingMockRedis:
+    """
+    Mock Redis table that counts the number of MGETs it receives.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.mget_calls = 0
+
+    async def mget(self, *keys, **kwargs):
+        self.mget_calls += 1
+        return [self.data.get(key) for key in keys]
+
+    async def get(self, key, **kwargs):
+        return self.data.get(key)
+
+
+def mock_app():
+    """
+    A minimal app with a gene/protein conflation, where the gene clique has no labels.
+    """
+    app = Mock()
+    app.state = State()
+    app.state.eq_id_to_id_db = CountingMockRedis({
+        "NCBIGENE:1": "NCBIGene:1",
+        "HGNC:1": "NCBIGene:1",
+        "UNIPROTKB:P1": "UniProtKB:P1",
+    })
+    app.state.id_to_eqids_db = CountingMockRedis({
+        "NCBIGene:1": json.dumps([{"i": "NCBIGene:1"}, {"i": "HGNC:1"}]),
+        "UniProtKB:P1": json.dumps([{"i": "UniProtKB:P1", "l": "Protein one"}]),
+    })
+    app.state.id_to_type_db = CountingMockRedis({
+        "NCBIGene:1": "biolink:Gene",
+        "UniProtKB:P1": "biolink:Protein",
+    })
+    app.state.info_content_db = CountingMockRedis({})
+    app.state.gene_protein_db = CountingMockRedis({
+        "NCBIGene:1": json.dumps(["NCBIGene:1", "UniProtKB:P1"]),
+        "UniProtKB:P1": json.dumps(["NCBIGene:1", "UniProtKB:P1"]),
+    })
+    app.state.chemical_drug_db = CountingMockRedis({})
+    app.state.curie_to_bl_type_db = CountingMockRedis({"babel_version": "2024jan1"})
+    app.state.ancestor_map = {
+        "biolink:Gene": ["biolink:Gene", "biolink:NamedThing"],
+        "biolink:Protein": ["biolink:Protein", "biolink:NamedThing"],
+    }
+    return app
+
+
 premerged_graph = Path(__file__).parent / "resources" / "premerged_kgraph.json"
 postmerged_graph = Path(__file__).parent / "resources" / "postmerged_kgraph.json"
 
@@ -113,12 +172,12 @@ postmerged_graph = Path(__file__).parent / "resources" / "postmerged_kgraph.json
 class TestNormalizer:
     @pytest.mark.asyncio
     @patch(
-        "node_normalizer.normalizer.get_equivalent_curies",
-        Mock(side_effect=mock_get_equivalent_curies),
+        "node_normalizer.normalizer.get_all_equivalent_curies",
+        Mock(side_effect=mock_get_all_equivalent_curies),
     )
     @patch(
-        "node_normalizer.normalizer.get_info_content_attribute",
-        Mock(side_effect=mock_get_ic),
+        "node_normalizer.normalizer.get_info_content_attributes",
+        Mock(side_effect=mock_get_ic_attributes),
     )
     async def test_kg_normalize(self):
         app = None
@@ -247,3 +306,417 @@ class TestNormalizer:
                 {"attribute_type_id.3": "bar:baz", "value.3": 2},
             ],
         }
+
+
+@pytest.mark.asyncio
+async def test_conflated_label_from_prefetched_subcliques():
+    """
+    The label of a conflated clique comes from the first subclique with a label, and the subcliques
+    are looked up once for the whole request rather than once per node.
+    """
+    app = mock_app()
+    curies = ["HGNC:1", "UniProtKB:P1"]
+    result = await get_normalized_nodes(app, curies, True, False)
+
+    for curie in curies:
+        assert result[curie]["id"] == {"identifier": "NCBIGene:1", "label": "Protein one"}
+        assert [eqid["identifier"] for eqid in result[curie]["equivalent_identifiers"]] == \
+               ["NCBIGene:1", "HGNC:1", "UniProtKB:P1"]
+
+    # One MGET for the canonical IDs, and one for the conflated partners.
+    assert app.state.id_to_eqids_db.mget_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_duplicate_curies_share_cliques():
+    """
+    Repeated CURIEs, case variants and CURIEs from the same clique are looked up and built only once.
+    """
+    app = mock_app()
+    looked_up = []
+    mget = app.state.eq_id_to_id_db.mget
+
+    async def recording_mget(*keys, **kwargs):
+        looked_up.extend(keys)
+        return await mget(*keys, **kwargs)
+
+    app.state.eq_id_to_id_db.mget = recording_mget
+
+    curies = ["NCBIGene:1", "ncbigene:1", "HGNC:1", "NCBIGene:1", "UniProtKB:P1", "UNKNOWN:1", "UNKNOWN:1"]
+    result = await get_normalized_nodes(app, curies, True, False)
+
+    assert looked_up == ["NCBIGENE:1", "HGNC:1", "UNIPROTKB:P1", "UNKNOWN:1"]
+    assert set(result.keys()) == set(curies)
+    assert result["UNKNOWN:1"] is None
+    assert result["NCBIGene:1"] is result["ncbigene:1"] is result["HGNC:1"]
+    # Conflated partners are not repeated, even though several inputs share them.
+    for curie in ["NCBIGene:1", "UniProtKB:P1"]:
+        assert [eqid["identifier"] for eqid in result[curie]["equivalent_identifiers"]] == \
+               ["NCBIGene:1", "HGNC:1", "UniProtKB:P1"]
+
+
+@pytest.mark.asyncio
+async def test_cached_nodes_skip_redis():
+    """
+    Once a CURIE has been normalized, it is served from the cache until the loaded Babel version changes.
+    """
+    app = mock_app()
+    app.state.normalization_cache = NormalizationCache(max_size=100, ttl=3600, unknown_max_size=100, unknown_ttl=60)
+    looked_up = []
+    mget = app.state.eq_id_to_id_db.mget
+
+    async def recording_mget(*keys, **kwargs):
+        looked_up.append(list(keys))
+        return await mget(*keys, **kwargs)
+
+    app.state.eq_id_to_id_db.mget = recording_mget
+
+    first = await get_normalized_nodes(app, ["NCBIGene:1", "UNKNOWN:1"], True, False)
+    second = await get_normalized_nodes(app, ["ncbigene:1", "UNKNOWN:1", "UniProtKB:P1"], True, False)
+    assert looked_up == [["NCBIGENE:1", "UNKNOWN:1"], ["UNIPROTKB:P1"]]
+    assert second["ncbigene:1"] == first["NCBIGene:1"]
+    assert second["UNKNOWN:1"] is None
+    assert app.state.normalization_cache.hits == 2
+
+    # Different options are cached separately.
+    await get_normalized_nodes(app, ["NCBIGene:1"], False, False)
+    assert looked_up[-1] == ["NCBIGENE:1"]
+
+    # A new Babel version invalidates everything.
+    app.state.curie_to_bl_type_db.data["babel_version"] = "2024feb1"
+    app.state.normalization_cache.version_checked_at = None
+    await get_normalized_nodes(app, ["NCBIGene:1"], True, False)
+    assert looked_up[-1] == ["NCBIGENE:1"]
+    assert app.state.normalization_cache.version == "2024feb1"
+
+
+@pytest.mark.asyncio
+async def test_clique_records_shared_between_options():
+    """
+    Clique records are cached independently of the options used, so a request with different options
+    doesn't need to read them from Redis again.
+    """
+    app = mock_app()
+    app.state.clique_cache = CliqueRecordCache(max_bytes=1_000_000)
+
+    first = await get_normalized_nodes(app, ["NCBIGene:1"], False, False)
+    assert app.state.id_to_eqids_db.mget_calls == 1
+    assert app.state.info_content_db.mget_calls == 1
+
+    second = await get_normalized_nodes(app, ["HGNC:1"], False, False, include_descriptions=False,
+                                        include_individual_types=True)
+    assert app.state.id_to_eqids_db.mget_calls == 1
+    assert app.state.id_to_type_db.mget_calls == 1
+    assert app.state.info_content_db.mget_calls == 1
+    assert second["HGNC:1"]["id"] == first["NCBIGene:1"]["id"]
+    assert second["HGNC:1"]["equivalent_identifiers"][0]["type"] == "biolink:Gene"
+
+    # Conflation only needs to look up the cliques we haven't seen yet.
+    conflated = await get_normalized_nodes(app, ["NCBIGene:1"], True, False)
+    assert app.state.id_to_eqids_db.mget_calls == 2
+    assert [eqid["identifier"] for eqid in conflated["NCBIGene:1"]["equivalent_identifiers"]] == \
+           ["NCBIGene:1", "HGNC:1", "UniProtKB:P1"]
+
+
+@pytest.mark.asyncio
+async def test_precomputed_preferred_labels():
+    """
+    Preferred labels precomputed by the loader are used instead of computing them, including for conflated cliques.
+    """
+    app = mock_app()
+    app.state.preferred_label_db = CountingMockRedis({
+        "NCBIGene:1": "",
+        "UniProtKB:P1": "Precomputed protein",
+        "gene_protein_db|NCBIGene:1": "Precomputed gene/protein",
+        "gene_protein_db|UniProtKB:P1": "Precomputed gene/protein",
+    })
+
+    result = await get_normalized_nodes(app, ["NCBIGene:1", "UniProtKB:P1"], False, False)
+    assert "label" not in result["NCBIGene:1"]["id"]
+    assert result["UniProtKB:P1"]["id"]["label"] == "Precomputed protein"
+
+    result = await get_normalized_nodes(app, ["NCBIGene:1", "UniProtKB:P1"], True, False)
+    assert result["NCBIGene:1"]["id"]["label"] == "Precomputed gene/protein"
+    assert result["UniProtKB:P1"]["id"]["label"] == "Precomputed gene/protein"
+
+    # Without a precomputed label, we choose one ourselves.
+    del app.state.preferred_label_db.data["gene_protein_db|UniProtKB:P1"]
+    result = await get_normalized_nodes(app, ["UniProtKB:P1"], True, False)
+    assert result["UniProtKB:P1"]["id"]["label"] == "Protein one"
+
+
+@pytest.mark.asyncio
+async def test_normalization_script_matches_mgets():
+    """
+    resources/normalize_nodes.lua (run with lupa) gives the same nodes as the MGET path, including the precomputed
+    preferred labels.
+    """
+    pytest.importorskip("lupa")
+    from .helpers.lua_redis import LuaRedisScript
+    from node_normalizer.normalizer import get_normalization_script_databases, get_normalization_script_tables
+
+    app = mock_app()
+    app.state.info_content_db = CountingMockRedis({"NCBIGene:1": "12.34"})
+    app.state.preferred_label_db = CountingMockRedis({
+        "NCBIGene:1": "",
+        "UniProtKB:P1": "Precomputed protein",
+        "gene_protein_db|NCBIGene:1": "Precomputed gene/protein",
+        "gene_protein_db|UniProtKB:P1": "Precomputed gene/protein",
+    })
+    databases = {}
+    for db, table in enumerate(get_normalization_script_tables(app)):
+        getattr(app.state, table).redis_instance = Mock(db=db)
+        databases[db] = getattr(app.state, table).data
+    script = (Path(__file__).parents[1] / "node_normalizer" / "resources" / "normalize_nodes.lua").read_text()
+
+    curies = ["HGNC:1", "UniProtKB:P1", "UNKNOWN:1"]
+    for conflate_gene_protein, conflate_chemical_drug in [(False, False), (True, False), (True, True)]:
+        app.state.normalization_script = None
+        expected = await get_normalized_nodes(app, curies, conflate_gene_protein, conflate_chemical_drug)
+
+        app.state.normalization_script = LuaRedisScript(script, databases)
+        app.state.normalization_script_databases = get_normalization_script_databases(app)
+        label_mget_calls = app.state.preferred_label_db.mget_calls
+        result = await get_normalized_nodes(app, curies, conflate_gene_protein, conflate_chemical_drug)
+        assert app.state.normalization_script.calls == 1
+        assert app.state.preferred_label_db.mget_calls == label_mget_calls
+        assert result == expected
+
+    assert result["HGNC:1"]["id"]["label"] == "Precomputed gene/protein"
+
+
+def test_choose_preferred_label():
+    identifiers = [
+        {"i": "CHEMBL.COMPOUND:CHEMBL1", "l": "CHEMBL1"},
+        {"i": "MESH:D1", "l": "A label that is much too long"},
+        {"i": "PUBCHEM.COMPOUND:1", "l": "short"},
+    ]
+    assert choose_preferred_label(("biolink:SmallMolecule", "biolink:NamedThing"), identifiers) == "short"
+    assert choose_preferred_label(("biolink:SmallMolecule",), [{"i": "MESH:D1"}]) == ""
+
+
+@pytest.mark.asyncio
+async def test_canonical_ids_match_normalized_nodes():
+    """
+    get_canonical_ids() returns the same preferred identifiers as get_normalized_nodes() without reading the
+    clique records.
+    """
+    curies = ["HGNC:1", "UniProtKB:P1", "UNKNOWN:1"]
+    for conflate in [False, True]:
+        app = mock_app()
+        result = await get_canonical_ids(app, curies, conflate, False, include_type=True)
+        assert app.state.id_to_eqids_db.mget_calls == 0
+        assert app.state.info_content_db.mget_calls == 0
+        assert app.state.gene_protein_db.mget_calls == (1 if conflate else 0)
+
+        nodes = await get_normalized_nodes(mock_app(), curies, conflate, False)
+        assert result["UNKNOWN:1"] is None
+        for curie in curies[:2]:
+            assert result[curie] == {"identifier": nodes[curie]["id"]["identifier"], "type": nodes[curie]["type"][0]}
+
+    result = await get_canonical_ids(mock_app(), ["UniProtKB:P1"], True, False)
+    assert result == {"UniProtKB:P1": {"identifier": "NCBIGene:1"}}
+
+
+@pytest.mark.asyncio
+async def test_fields_skip_unneeded_lookups():
+    """
+    Only the requested parts of each node are built, and we don't read the tables needed for the other parts.
+    """
+    for conflate in [False, True]:
+        full = await get_normalized_nodes(mock_app(), ["HGNC:1"], conflate, False)
+
+        app = mock_app()
+        result = await get_normalized_nodes(app, ["HGNC:1", "UNKNOWN:1"], conflate, False, fields=["id", "type"])
+        assert result["HGNC:1"] == {"id": {"identifier": full["HGNC:1"]["id"]["identifier"]},
+                                    "type": full["HGNC:1"]["type"]}
+        assert result["UNKNOWN:1"] is None
+        assert app.state.id_to_eqids_db.mget_calls == 0
+        assert app.state.info_content_db.mget_calls == 0
+
+        app = mock_app()
+        result = await get_normalized_nodes(app, ["HGNC:1"], conflate, False, fields=["equivalent_identifiers"])
+        assert result["HGNC:1"] == {"equivalent_identifiers": full["HGNC:1"]["equivalent_identifiers"]}
+        assert app.state.info_content_db.mget_calls == 0
+
+    # Precomputed labels don't need the equivalent identifiers either.
+    app = mock_app()
+    app.state.preferred_label_db = CountingMockRedis({
+        "NCBIGene:1": "",
+        "gene_protein_db|NCBIGene:1": "Precomputed gene/protein",
+    })
+    result = await get_normalized_nodes(app, ["HGNC:1"], True, False, fields=["label"])
+    assert result["HGNC:1"] == {"id": {"label": "Precomputed gene/protein"}}
+    assert app.state.id_to_eqids_db.mget_calls == 0
+
+    # But we fall back to computing labels that weren't precomputed.
+    result = await get_normalized_nodes(app, ["UniProtKB:P1"], False, False, fields=["id", "label"])
+    assert result["UniProtKB:P1"] == {"id": {"identifier": "UniProtKB:P1", "label": "Protein one"}}
+
+
+@pytest.mark.asyncio
+async def test_max_equivalent_identifiers():
+    """
+    Large cliques can be truncated, and the rest of their identifiers retrieved a page at a time.
+    """
+    app = mock_app()
+    full = await get_normalized_nodes(app, ["HGNC:1"], True, False)
+    result = await get_normalized_nodes(app, ["HGNC:1"], True, False, max_equivalent_identifiers=2)
+    assert result["HGNC:1"]["equivalent_identifiers"] == full["HGNC:1"]["equivalent_identifiers"][:2]
+    assert result["HGNC:1"]["equivalent_identifiers_count"] == 3
+    assert result["HGNC:1"]["id"] == full["HGNC:1"]["id"]
+    assert "equivalent_identifiers_count" not in full["HGNC:1"]
+
+    page = await get_equivalent_identifiers_page(app, "HGNC:1", True, False, offset=2, limit=2)
+    assert page == {
+        "identifier": "NCBIGene:1",
+        "equivalent_identifiers_count": 3,
+        "offset": 2,
+        "limit": 2,
+        "equivalent_identifiers": full["HGNC:1"]["equivalent_identifiers"][2:],
+    }
+    assert await get_equivalent_identifiers_page(app, "UNKNOWN:1", True, False) is None
+
+
+@pytest.mark.asyncio
+async def test_prefix_and_type_filters():
+    """
+    Equivalent identifiers can be filtered by prefix, and nodes by type, before the response is built.
+    """
+    app = mock_app()
+    full = await get_normalized_nodes(app, ["HGNC:1", "UniProtKB:P1"], False, False)
+
+    result = await get_normalized_nodes(app, ["HGNC:1"], True, False, include_prefixes=["HGNC", "UniProtKB"],
+                                        max_equivalent_identifiers=1)
+    assert [eqid["identifier"] for eqid in result["HGNC:1"]["equivalent_identifiers"]] == ["HGNC:1"]
+    assert result["HGNC:1"]["equivalent_identifiers_count"] == 2
+
+    result = await get_normalized_nodes(app, ["HGNC:1"], True, False, exclude_prefixes=["HGNC"])
+    assert [eqid["identifier"] for eqid in result["HGNC:1"]["equivalent_identifiers"]] == \
+           ["NCBIGene:1", "UniProtKB:P1"]
+    # The preferred identifier and label don't depend on which identifiers are returned.
+    assert result["HGNC:1"]["id"] == {"identifier": "NCBIGene:1", "label": "Protein one"}
+
+    result = await get_normalized_nodes(app, ["HGNC:1", "UniProtKB:P1", "UNKNOWN:1"], False, False,
+                                        require_type="biolink:Protein")
+    assert result == {"HGNC:1": None, "UniProtKB:P1": full["UniProtKB:P1"], "UNKNOWN:1": None}
+
+    # Ancestors count as types of the clique, and conflated cliques have the types of all their members.
+    result = await get_normalized_nodes(app, ["HGNC:1"], False, False, require_type="biolink:NamedThing",
+                                        fields=["id"])
+    assert result == {"HGNC:1": {"id": {"identifier": "NCBIGene:1"}}}
+    result = await get_normalized_nodes(app, ["HGNC:1"], True, False, require_type="biolink:Protein")
+    assert result["HGNC:1"]["id"]["identifier"] == "NCBIGene:1"
+
+
+@pytest.mark.asyncio
+async def test_kgraph_nodes_normalized_together():
+    """
+    All the nodes of a knowledge graph are normalized with a single lookup in each table.
+    """
+    app = mock_app()
+    app.state.info_content_db = CountingMockRedis({"NCBIGene:1": "12.34"})
+    kgraph = KnowledgeGraph.parse_obj({
+        "nodes": {
+            node_id: {"categories": ["biolink:NamedThing"], "attributes": []}
+            for node_id in ["NCBIGene:1", "HGNC:1", "UniProtKB:P1", "UNKNOWN:1"]
+        },
+        "edges": {
+            "e1": {"subject": "HGNC:1", "predicate": "biolink:related_to", "object": "UNKNOWN:1",
+                   "sources": [{"resource_id": "infores:test", "resource_role": "primary_knowledge_source"}]},
+        },
+    })
+
+    merged_kgraph, node_id_map, edge_id_map = await normalize_kgraph(app, kgraph)
+    assert app.state.eq_id_to_id_db.mget_calls == 1
+    # The information content attributes are made from the normalized nodes.
+    assert app.state.info_content_db.mget_calls == 1
+
+    assert node_id_map == {"NCBIGene:1": "NCBIGene:1", "HGNC:1": "NCBIGene:1", "UniProtKB:P1": "NCBIGene:1",
+                           "UNKNOWN:1": "UNKNOWN:1"}
+    assert set(merged_kgraph.nodes.keys()) == {"NCBIGene:1", "UNKNOWN:1"}
+    gene = merged_kgraph.nodes["NCBIGene:1"]
+    assert gene.name == "Protein one"
+    ic_attributes = [attribute for attribute in gene.attributes
+                     if attribute.original_attribute_name == "information_content"]
+    assert [attribute.value for attribute in ic_attributes] == [12.3]
+    edge = merged_kgraph.edges["e1"]
+    assert (edge.subject, edge.object) == ("NCBIGene:1", "UNKNOWN:1")
+
+
+@pytest.mark.asyncio
+async def test_results_information_content_looked_up_together():
+    """
+    The information content of every bound node is looked up with a single MGET, however many bindings there are.
+    """
+    app = mock_app()
+    app.state.info_content_db = CountingMockRedis({"NCBIGene:1": "12.34"})
+    node_id_map = {"HGNC:1": "NCBIGene:1", "NCBIGene:1": "NCBIGene:1", "UNKNOWN:1": "UNKNOWN:1"}
+    results = [
+        Result.parse_obj({
+            "node_bindings": {"gene": [{"id": gene_id, "attributes": []}], "other": [{"id": "UNKNOWN:1"}]},
+            "analyses": [{"resource_id": "infores:test", "edge_bindings": {"e": [{"id": f"e{index}"}]}}],
+        })
+        for index, gene_id in enumerate(["HGNC:1", "NCBIGene:1", "HGNC:1"])
+    ]
+
+    merged_results = await normalize_results(app, results, node_id_map, {"e0": "e0", "e1": "e0", "e2": "e2"})
+    assert app.state.info_content_db.mget_calls == 1
+
+    # The first two results are the same once their identifiers are normalized.
+    assert len(merged_results) == 2
+    for result in merged_results:
+        [gene_binding] = result.node_bindings["gene"]
+        assert gene_binding.id == "NCBIGene:1"
+        assert [attribute.value for attribute in gene_binding.attributes] == [12.3]
+        [other_binding] = result.node_bindings["other"]
+        assert not other_binding.attributes
+
+
+@pytest.mark.asyncio
+async def test_results_keep_every_analysis():
+    """
+    Each analysis of a result is kept, even if it's the same as another once its edges are normalized.
+    """
+    analyses = [
+        {"resource_id": "infores:test", "score": score, "edge_bindings": {"e": [{"id": edge_id}]}}
+        for score, edge_id in [(0.5, "e0"), (0.5, "e1"), (0.5, "e1"), (0.9, "e1")]
+    ]
+    results = [{"node_bindings": {"gene": [{"id": "NCBIGene:1"}]}, "analyses": analyses}]
+
+    [merged_result] = await normalize_results_dict(mock_app(), results, {"NCBIGene:1": "NCBIGene:1"},
+                                                   {"e0": "e0", "e1": "e0"})
+    assert [analysis["score"] for analysis in merged_result["analyses"]] == [0.5, 0.5, 0.5, 0.9]
+
+
+@pytest.mark.asyncio
+async def test_message_curies_normalized_together():
+    """
+    The ids in the query graph and the knowledge graph are normalized with a single lookup, which the results reuse
+    for their information content.
+    """
+    app = mock_app()
+    app.state.info_content_db = CountingMockRedis({"NCBIGene:1": "12.34"})
+    message = Message.parse_obj({
+        "query_graph": {
+            "nodes": {"gene": {"ids": ["HGNC:1", "UniProtKB:P1", "UNKNOWN:1"]}, "other": {}},
+            "edges": {"e": {"subject": "gene", "object": "other"}},
+        },
+        "knowledge_graph": {
+            "nodes": {"HGNC:1": {"categories": ["biolink:Gene"], "attributes": []}},
+            "edges": {},
+        },
+        "results": [{
+            "node_bindings": {"gene": [{"id": "HGNC:1", "attributes": []}]},
+            "analyses": [{"resource_id": "infores:test", "edge_bindings": {}}],
+        }],
+    })
+
+    normalized = await normalize_message(app, message)
+    assert app.state.eq_id_to_id_db.mget_calls == 1
+    assert app.state.info_content_db.mget_calls == 1
+    [result] = normalized.results
+    [gene_binding] = result.node_bindings["gene"]
+    assert [attribute.value for attribute in gene_binding.attributes] == [12.3]
+    assert sorted(normalized.query_graph.nodes["gene"].ids) == ["NCBIGene:1", "UNKNOWN:1"]
+    assert list(normalized.knowledge_graph.nodes.keys()) == ["NCBIGene:1"]
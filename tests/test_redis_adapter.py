@@ -1,6 +1,7 @@
+import asyncio
 import pytest, yaml
 from node_normalizer.redis_adapter import ConnectionConfig, RedisInstance, RedisConnectionFactory, \
-    RedisConnection, Resource
+    RedisConnection, RedisScript, Resource, ChunkSizer
 from pathlib import Path
 from unittest.mock import patch
 
@@ -250,3 +251,127 @@ async def test_redis_rediscluster():
         # assert wait closed
         await connection.wait_closed()
         assert RedisClusterMock.closed
+
+
+class ScriptConnectionMock:
+    """ A connection whose script cache is flushed after the first script_load. """
+    def __init__(self):
+        self.loads = 0
+        self.script_cache = {}
+
+    async def script_load(self, script):
+        self.loads += 1
+        digest = f"digest-{self.loads}"
+        if self.loads == 1:
+            # Pretend that Redis was restarted straight after the script was loaded.
+            return digest
+        self.script_cache[digest] = script
+        return digest
+
+    async def evalsha(self, digest, keys=[], args=[]):
+        if digest not in self.script_cache:
+            raise Exception("NOSCRIPT No matching script. Please use EVAL.")
+        return f"{self.script_cache[digest]}:{','.join(keys)}:{','.join(map(str, args))}"
+
+
+@pytest.mark.asyncio
+async def test_redis_script_reloads_on_noscript():
+    connection = ScriptConnectionMock()
+    script = await RedisScript.register(connection, "return 1")
+    assert script.digest == "digest-1"
+
+    assert await script(keys=["a", "b"], args=[1, 2]) == "return 1:a,b:1,2"
+    assert connection.loads == 2
+    assert script.digest == "digest-2"
+
+
+def test_chunk_sizer_tracks_latency_and_size():
+    sizer = ChunkSizer(initial_size=1000, min_size=10, max_size=10000, target_seconds=0.01,
+                       target_bytes=1_000_000, smoothing=1.0)
+    assert sizer.chunk_size == 1000
+
+    # 1000 keys in 1ms: we could read ten times as many within the target latency.
+    sizer.observe(1000, 0.001, 1000)
+    assert sizer.chunk_size == 10000
+
+    # 1000 keys in 100ms: we should read a tenth as many.
+    sizer.observe(1000, 0.1, 1000)
+    assert sizer.chunk_size == 100
+
+    # Fast, but 10kB per key: the reply size limits us to 100 keys.
+    sizer.observe(1000, 0.001, 10_000_000)
+    assert sizer.chunk_size == 100
+
+    # Never below the minimum.
+    sizer.observe(1000, 100, 1000)
+    assert sizer.chunk_size == 10
+
+
+class ChunkedRedisConnection(RedisConnection):
+    """ A RedisConnection that records the chunks it reads instead of talking to Redis. """
+    def __init__(self, chunk_size, max_in_flight):
+        super().__init__()
+        self.chunk_sizer = ChunkSizer(initial_size=chunk_size, min_size=chunk_size, max_size=chunk_size)
+        self.max_chunks_in_flight = max_in_flight
+        self.chunks = []
+        self.in_flight = 0
+        self.max_seen_in_flight = 0
+
+    async def _mget(self, keys, encoding):
+        self.chunks.append(keys)
+        self.in_flight += 1
+        self.max_seen_in_flight = max(self.max_seen_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        return [f"value-{key}" for key in keys]
+
+
+@pytest.mark.asyncio
+async def test_mget_is_chunked():
+    connection = ChunkedRedisConnection(chunk_size=10, max_in_flight=2)
+    keys = [f"key{i}" for i in range(95)]
+    assert await connection.mget(*keys) == [f"value-{key}" for key in keys]
+    assert len(connection.chunks) == 10
+    assert all(len(chunk) <= 10 for chunk in connection.chunks)
+    assert connection.max_seen_in_flight == 2
+
+    # Small reads are sent as a single command.
+    connection.chunks = []
+    assert await connection.mget("key1", "key2") == ["value-key1", "value-key2"]
+    assert connection.chunks == [("key1", "key2")]
+
+
+@pytest.mark.asyncio
+async def test_small_mget_not_queued_behind_large_one():
+    """
+    The limit on chunks in flight applies to each read, so a concurrent small read is sent straight away.
+    """
+    connection = ChunkedRedisConnection(chunk_size=10, max_in_flight=2)
+    keys = [f"key{i}" for i in range(95)]
+    large_read = asyncio.create_task(connection.mget(*keys))
+    while connection.in_flight < 2:
+        await asyncio.sleep(0)
+
+    assert await connection.mget("key1") == ["value-key1"]
+    # The small read was sent before most of the large read's chunks.
+    assert connection.chunks.index(("key1",)) < 4
+    assert await large_read == [f"value-{key}" for key in keys]
+
+
+@pytest.mark.asyncio
+async def test_small_mgets_dont_shrink_chunks():
+    """
+    Small reads take about as long as a round-trip, however few keys they have, so they mustn't shrink the chunks
+    that large reads are split into.
+    """
+    connection = ChunkedRedisConnection(chunk_size=2500, max_in_flight=2)
+    connection.chunk_sizer = ChunkSizer(initial_size=2500, min_size=100, max_size=25000, target_seconds=0.01)
+    for i in range(30):
+        await connection.mget(*[f"key{i}-{j}" for j in range(5)])
+    assert connection.chunk_sizer.chunk_size == 2500
+
+    connection.chunks = []
+    keys = [f"key{i}" for i in range(6000)]
+    assert await connection.mget(*keys) == [f"value-{key}" for key in keys]
+    assert len(connection.chunks) == 3
+    assert connection.chunk_sizer.chunk_size >= 2500
@@ -3,7 +3,7 @@ import json
 
 from node_normalizer.server import app
 from fastapi.testclient import TestClient
-from bmt import Toolkit
+from node_normalizer.biolink_ancestors import read_bundled_ancestor_table
 
 
 class MockRedis:
@@ -36,8 +36,7 @@ app.state.chemical_drug_db = MockRedis({
 app.state.gene_protein_db = MockRedis({})
 app.state.curie_to_bl_type_db = MockRedis({})
 app.state.info_content_db = MockRedis({})
-app.state.toolkit = Toolkit()
-app.state.ancestor_map = {}
+app.state.ancestor_map = read_bundled_ancestor_table()
 
 
 def test_setid_empty():
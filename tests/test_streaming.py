@@ -0,0 +1,66 @@
+"""Test the NDJSON streaming normalization in node_normalizer/streaming.py"""
+import asyncio
+import json
+
+import pytest
+
+from node_normalizer.streaming import normalize_stream, parse_curie_line
+from .test_normalizer import mock_app
+
+
+async def chunks_of(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def test_parse_curie_line():
+    assert parse_curie_line(b" MONDO:0005002 \r") == "MONDO:0005002"
+    assert parse_curie_line(b'"MONDO:0005002"') == "MONDO:0005002"
+    assert parse_curie_line(b'{"curie": "MONDO:0005002", "other": 1}') == "MONDO:0005002"
+    assert parse_curie_line(b"  ") is None
+    for line in [b'{"id": "MONDO:0005002"}', b'{"curie": 1}', b'{"curie": ']:
+        with pytest.raises(ValueError):
+            parse_curie_line(line)
+
+
+@pytest.mark.asyncio
+async def test_normalize_stream():
+    """
+    Results come back in input order however the input is split into chunks and windows, with a bounded number of
+    windows being normalized at once.
+    """
+    app = mock_app()
+    in_flight = 0
+    max_in_flight = 0
+    mget = app.state.eq_id_to_id_db.mget
+
+    async def counting_mget(*keys, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            return await mget(*keys, **kwargs)
+        finally:
+            in_flight -= 1
+
+    app.state.eq_id_to_id_db.mget = counting_mget
+
+    curies = ["HGNC:1", "UniProtKB:P1", "UNKNOWN:1", "NCBIGene:1"] * 10
+    body = "\n".join(curies[:20]) + "\n\n{\"curie\": \"HGNC:1\"}\n{\"nope\": 1}\n" + "\n".join(curies[20:])
+    output = b""
+    async for chunk in normalize_stream(app, chunks_of(body.encode("utf-8"), 7), window_size=3,
+                                        max_windows_in_flight=2, conflate_gene_protein=False,
+                                        conflate_chemical_drug=False, fields=["id"]):
+        output += chunk
+
+    results = [json.loads(line) for line in output.decode("utf-8").splitlines()]
+    assert results[21] == {"line": 23, "error": "Expected a CURIE or an object with a 'curie' string, but got "
+                                                "{\"nope\": 1}"}
+    del results[21]
+    assert [result["curie"] for result in results] == curies[:20] + ["HGNC:1"] + curies[20:]
+    for result in results:
+        expected = None if result["curie"] == "UNKNOWN:1" else \
+            {"id": {"identifier": "UniProtKB:P1" if result["curie"] == "UniProtKB:P1" else "NCBIGene:1"}}
+        assert result["node"] == expected
+    assert max_in_flight == 2